@@ -1,17 +1,23 @@
 # Início do arquivo completo: app.py
 
 import os
+import re
 import csv
+import time
 import io
 import click
-from functools import wraps
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, abort
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, partial
+from itertools import count
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, abort, make_response, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime, timezone, timedelta, date
 from sqlalchemy.exc import IntegrityError
 from wtforms.validators import ValidationError
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, insert, update, delete, select, case, extract, literal, exists
+from sqlalchemy.orm import joinedload
 import locale 
 from flask_login import LoginManager, current_user, login_user, logout_user, login_required
 import math
@@ -22,16 +28,25 @@ from config import Config
 from models import (
     db, User, Ata, Contrato, Contratinho, Empenho, ItemAta, UnidadeSaude,
     ConsumoItemContratinho, ConsumoItemEmpenho, ItemContrato, Aditivo, CotaUnidadeItem, Log, Comentario,
-    Processo
+    Processo, GastoUnidadeMensal, obter_totais_dashboard, reconstruir_resumo_contagem, consultar_vencimentos,
+    registrar_gasto_unidade, ajustar_saldo_item, ajustar_consumo_cota, lancar_movimento_consumo,
+    calcular_saldos, gerar_snapshot_saldos, reconstruir_saldos, reconciliar_saldos,
+    lancar_movimentos_saldo, ajustar_resumo_contagem, registrar_vencimentos_em_lote, remover_vencimentos_em_lote,
+    lancar_movimentos_por_consulta, carregar_comentarios, ImportacaoJob, calcular_fim_vigencia
 )
 from forms import (
     LoginForm, AtaForm, ContratoForm, ContratinhoForm, EmpenhoForm, ItemAtaForm, UnidadeSaudeForm,
     AdicionarItensLoteAtaForm, RelatorioConsumoUnidadeForm, RelatorioConsumoPorItemForm,
-    RelatorioContratosVigentesUnidadeForm, AditivoForm, ImportCSVForm, GerenciarCotasForm,
+    RelatorioContratosVigentesUnidadeForm, AditivoForm, ImportCSVForm, ImportAtasCSVForm, GerenciarCotasForm,
     RelatorioPotencialDeSolicitacaoForm, UserCreationForm, UserEditForm, CommentForm,
     ProcessoForm
 )
 import reports
+import importacao
+from profiler import ProfilerRequisicoes
+from paginacao import paginar_por_cursor
+from busca import buscar_documentos, reconstruir_indice_busca, indexar_documentos_em_lote, remover_documentos_do_indice
+from opcoes import opcoes_itens_com_saldo
 
 app = Flask(__name__)
 
@@ -118,6 +133,7 @@ def inject_current_year():
 
 db.init_app(app)
 migrate = Migrate(app, db)
+profiler = ProfilerRequisicoes(app)
 
 @app.cli.command("create-admin")
 @click.argument("username")
@@ -136,6 +152,94 @@ def create_admin(username, password):
         db.session.commit()
         print(f"Administrador '{username}' criado com sucesso!")
 
+@app.cli.command("rebuild-totais")
+def rebuild_totais():
+    """Recalcula do zero os totais de registros exibidos no dashboard."""
+    totais = reconstruir_resumo_contagem()
+    for entidade, total in totais.items():
+        print(f"{entidade}: {total}")
+    print("Resumo de contagens reconstruído com sucesso!")
+
+@app.cli.command("rebuild-busca")
+def rebuild_busca():
+    """Recria do zero o índice de busca textual."""
+    totais = reconstruir_indice_busca()
+    for tipo_documento, total in totais.items():
+        print(f"{tipo_documento}: {total}")
+    print("Índice de busca reconstruído com sucesso!")
+
+@app.cli.command("snapshot-saldos")
+@click.option("--margem-minutos", default=10, show_default=True,
+              help="Movimentos mais recentes que isso ficam para o próximo snapshot.")
+def snapshot_saldos(margem_minutos):
+    """Grava um snapshot dos saldos do livro de movimentos (rodar periodicamente, ex.: cron diário)."""
+    data_corte, linhas = gerar_snapshot_saldos(timedelta(minutes=margem_minutos))
+    if data_corte is None:
+        print("Já existe snapshot com corte igual ou posterior; nada a fazer.")
+    else:
+        print(f"Snapshot com corte em {data_corte:%d/%m/%Y %H:%M:%S} (UTC) gravado com {linhas} linha(s).")
+
+@app.cli.command("saldos-em")
+@click.argument("data")
+@click.option("--item", "item_ata_id", type=int, help="Mostra apenas este item de ata.")
+def saldos_em(data, item_ata_id):
+    """Mostra os saldos de itens e cotas ao final do dia DATA (DD/MM/AAAA), segundo o livro de movimentos."""
+    ate = datetime.strptime(data, '%d/%m/%Y') + timedelta(days=1)
+    saldos_itens, cotas = calcular_saldos(ate, [item_ata_id] if item_ata_id else None)
+    for item_id, saldo in sorted(saldos_itens.items()):
+        print(f"Item {item_id}: saldo {saldo:g}")
+        for (cota_item_id, unidade_id), (prevista, consumida) in sorted(cotas.items()):
+            if cota_item_id == item_id:
+                print(f"  Unidade {unidade_id}: cota {prevista:g}, consumido {consumida:g}")
+
+@app.cli.command("rebuild-saldos")
+@click.option("--aplicar", is_flag=True, help="Grava nos itens e cotas os saldos calculados pelo livro.")
+def rebuild_saldos(aplicar):
+    """Recalcula saldos de itens e cotas a partir do último snapshot + movimentos e lista as divergências."""
+    divergencias = reconstruir_saldos(aplicar=aplicar)
+    for tabela, registro_id, valor_atual, valor_livro in divergencias:
+        print(f"{tabela} {registro_id}: atual {valor_atual}, livro {valor_livro}")
+    if not divergencias:
+        print("Saldos conferem com o livro de movimentos.")
+    elif aplicar:
+        print(f"{len(divergencias)} saldo(s) corrigido(s) a partir do livro de movimentos.")
+    else:
+        print(f"{len(divergencias)} divergência(s) encontrada(s). Use --aplicar para corrigir.")
+
+@app.cli.command("reconcile-saldos")
+@click.option("--corrigir", is_flag=True, help="Grava os valores recalculados numa única transação.")
+@click.option("--ata", "ata_ids", type=int, multiple=True, help="Limita a conferência a esta ata (pode repetir).")
+def reconcile_saldos(corrigir, ata_ids):
+    """Recalcula saldos de itens e consumos de cotas a partir das linhas de consumo e lista as divergências."""
+    itens, cotas = reconciliar_saldos(corrigir=corrigir, ata_ids=list(ata_ids) or None)
+    for item_id, ata_id, descricao, atual, correto in itens:
+        print(f"Item {item_id} (Ata {ata_id}) {descricao[:40]}: saldo {atual:g}, correto {correto:g}")
+    for cota_id, item_id, unidade_id, atual, correto in cotas:
+        print(f"Cota {cota_id} (Item {item_id}, Unidade {unidade_id}): consumido {atual:g}, correto {correto:g}")
+    total = len(itens) + len(cotas)
+    if not total:
+        print("Nenhuma divergência encontrada.")
+    elif corrigir:
+        print(f"{total} registro(s) corrigido(s).")
+    else:
+        print(f"{total} divergência(s) encontrada(s). Use --corrigir para gravar os valores recalculados.")
+
+@app.cli.command("processar-importacoes")
+@click.option("--reiniciar-interrompidas", is_flag=True,
+              help="Devolve à fila as tarefas que ficaram PROCESSANDO (ex.: servidor reiniciado no meio da importação).")
+def processar_importacoes(reiniciar_interrompidas):
+    """Processa, neste processo, as importações CSV que estão na fila."""
+    if reiniciar_interrompidas:
+        ImportacaoJob.query.filter_by(status='PROCESSANDO').update({'status': 'PENDENTE'}, synchronize_session=False)
+        db.session.commit()
+    pendentes = [job_id for (job_id,) in db.session.query(ImportacaoJob.id)
+                 .filter_by(status='PENDENTE').order_by(ImportacaoJob.criado_em)]
+    for job_id in pendentes:
+        processar_importacao(job_id)
+        job = db.session.get(ImportacaoJob, job_id)
+        print(f"Tarefa {job_id} ({job.nome_arquivo}): {job.status} {job.resumo or job.erros or ''}")
+    print(f"{len(pendentes)} importação(ões) processada(s).")
+
 # --- ROTAS DE AUTENTICAÇÃO ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -176,6 +280,25 @@ def admin_visualizar_logs():
     logs = Log.query.order_by(Log.timestamp.desc()).paginate(page=page, per_page=25)
     return render_template('admin/visualizar_logs.html', logs=logs, titulo_pagina="Logs de Atividade")
 
+@app.route('/admin/desempenho')
+@login_required
+@role_required('admin')
+def admin_visualizar_desempenho():
+    return render_template('admin/visualizar_desempenho.html',
+                           estatisticas=profiler.resumo(),
+                           profiler_ativo=app.config['PROFILER_ATIVO'],
+                           taxa_amostragem=app.config['PROFILER_TAXA_AMOSTRAGEM'],
+                           tamanho_janela=app.config['PROFILER_JANELA'],
+                           titulo_pagina="Desempenho por Endpoint")
+
+@app.route('/admin/desempenho/limpar', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_limpar_desempenho():
+    profiler.limpar()
+    flash('Medições de desempenho descartadas.', 'success')
+    return redirect(url_for('admin_visualizar_desempenho'))
+
 @app.route('/admin/usuario/novo', methods=['GET', 'POST'])
 @login_required
 @role_required('admin')
@@ -272,15 +395,7 @@ def admin_excluir_usuario(user_id):
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    totais = {
-        'processos': Processo.query.count(),
-        'atas': Ata.query.count(),
-        'contratos': Contrato.query.count(),
-        'contratinhos': Contratinho.query.count(),
-        'empenhos': Empenho.query.count(),
-        'itens_ata': ItemAta.query.count(),
-        'unidades_saude': UnidadeSaude.query.count()
-    }
+    totais = obter_totais_dashboard()
     
     percentual_config_default = app.config.get('PERCENTUAL_SALDO_BAIXO', 20)
     try:
@@ -296,21 +411,15 @@ def dashboard():
     itens_saldo_baixo = []
     if unidade_id_filtro == 'todas':
         itens_saldo_baixo = ItemAta.query.filter(
-            ItemAta.quantidade_registrada > 0,
-            (ItemAta.saldo_disponivel / ItemAta.quantidade_registrada) <= percentual_limite
+            ItemAta.razao_saldo <= percentual_limite
         ).order_by(ItemAta.saldo_disponivel).all()
     else:
         try:
             unidade_id_int = int(unidade_id_filtro)
-            cotas_saldo_baixo = CotaUnidadeItem.query.filter(
+            itens_saldo_baixo = CotaUnidadeItem.query.filter(
                 CotaUnidadeItem.unidade_saude_id == unidade_id_int,
-                CotaUnidadeItem.quantidade_prevista > 0,
-                ((CotaUnidadeItem.quantidade_prevista - CotaUnidadeItem.quantidade_consumida) / CotaUnidadeItem.quantidade_prevista) <= percentual_limite
+                CotaUnidadeItem.razao_saldo <= percentual_limite
             ).all()
-            for cota in cotas_saldo_baixo:
-                saldo = cota.quantidade_prevista - cota.quantidade_consumida
-                cota.saldo_percentual = (saldo / cota.quantidade_prevista) * 100 if cota.quantidade_prevista > 0 else 0
-            itens_saldo_baixo = cotas_saldo_baixo
         except (ValueError, TypeError):
             flash("ID de Unidade inválido.", "danger")
             unidade_id_filtro = 'todas'
@@ -330,20 +439,13 @@ def dashboard():
     hoje_obj = datetime.now(timezone.utc)
     data_alerta_prazo_obj = hoje_obj + timedelta(days=dias_prazo_atual)
     filtro_vencidos = request.args.get('vencidos_dashboard', 'ocultar')
-    query_atas = Ata.query.filter(Ata.data_validade != None, Ata.data_validade <= data_alerta_prazo_obj)
-    query_contratos = Contrato.query.filter(Contrato.data_fim_vigencia != None, Contrato.data_fim_vigencia <= data_alerta_prazo_obj)
-    query_contratinhos = Contratinho.query.filter(Contratinho.data_fim_vigencia != None, Contratinho.data_fim_vigencia <= data_alerta_prazo_obj)
+    vencimentos = consultar_vencimentos(
+        data_alerta_prazo_obj,
+        data_inicial=hoje_obj if filtro_vencidos == 'ocultar' else None
+    )
     
-    if filtro_vencidos == 'ocultar':
-        query_atas = query_atas.filter(Ata.data_validade >= hoje_obj)
-        query_contratos = query_contratos.filter(Contrato.data_fim_vigencia >= hoje_obj)
-        query_contratinhos = query_contratinhos.filter(Contratinho.data_fim_vigencia >= hoje_obj)
-        
-    atas_vencendo = query_atas.order_by(Ata.data_validade).all()
-    contratos_vencendo = query_contratos.order_by(Contrato.data_fim_vigencia).all()
-    contratinhos_vencendo = query_contratinhos.order_by(Contratinho.data_fim_vigencia).all()
-    
-    recent_comments = Comentario.query.order_by(Comentario.timestamp.desc()).limit(5).all()
+    recent_comments = Comentario.query.options(joinedload(Comentario.author))\
+        .order_by(Comentario.timestamp.desc()).limit(5).all()
 
     return render_template('dashboard.html',
                            titulo_pagina="Dashboard",
@@ -352,19 +454,47 @@ def dashboard():
                            percentual_alerta_atual=percentual_alerta_atual,
                            unidades_saude=UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all(),
                            unidade_id_filtro_atual=unidade_id_filtro,
-                           atas_vencendo=atas_vencendo,
-                           contratos_vencendo=contratos_vencendo,
-                           contratinhos_vencendo=contratinhos_vencendo,
+                           vencimentos=vencimentos,
                            dias_alerta_prazo_atual=dias_prazo_atual, 
                            hoje_datetime=hoje_obj,
                            filtro_vencidos_ativo=filtro_vencidos,
                            recent_comments=recent_comments)
 
+# --- BUSCA TEXTUAL ---
+@app.route('/buscar')
+@login_required
+def buscar():
+    consulta = request.args.get('q', '').strip()
+    pagina = request.args.get('pagina', 1, type=int)
+    resultados, tem_proxima = buscar_documentos(consulta, pagina=pagina) if consulta else ([], False)
+    return render_template('buscar.html',
+                           titulo_pagina="Busca",
+                           consulta=consulta,
+                           pagina=max(pagina, 1),
+                           tem_proxima=tem_proxima,
+                           resultados=resultados)
+
+# --- AUXILIAR PARA AS LISTAGENS ---
+def _contagem_por_pai(coluna_fk, coluna_pai):
+    """Subconsulta escalar correlacionada com a quantidade de filhos do registro pai.
+
+    Entra como coluna da própria listagem, em vez de um COUNT por linha
+    renderizada. Por ser correlacionada, só é avaliada para as linhas da
+    página, cada uma pelo índice da FK, e não agrupa a tabela filha inteira.
+    """
+    return select(func.count()).select_from(coluna_fk.table).where(coluna_fk == coluna_pai).scalar_subquery()
+
 # --- ROTAS PARA PROCESSOS ---
 @app.route('/processos')
 @login_required
 def listar_processos():
-    processos = Processo.query.order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()
+    total_docs = sum(_contagem_por_pai(coluna, Processo.id)
+                     for coluna in (Ata.processo_id, Contrato.processo_id, Contratinho.processo_id, Empenho.processo_id))
+    query = db.session.query(Processo, total_docs)
+    processos = paginar_por_cursor(query,
+                                   [(Processo.ano, True), (Processo.numero_processo, True), (Processo.id, True)],
+                                   cursor=request.args.get('cursor'),
+                                   por_pagina=app.config['ITENS_POR_PAGINA'])
     return render_template('listar_processos.html',
                            titulo_pagina="Processos Administrativos",
                            lista_de_processos=processos)
@@ -450,11 +580,15 @@ def excluir_processo(processo_id):
 @login_required
 def index():
     filtro = request.args.get('filtro', 'vigentes')
-    query_base = Ata.query
+    query_base = db.session.query(Ata, _contagem_por_pai(ItemAta.ata_id, Ata.id))\
+        .options(joinedload(Ata.processo))
     hoje = datetime.now(timezone.utc).date()
     if filtro == 'vigentes':
         query_base = query_base.filter(or_(Ata.data_validade >= hoje, Ata.data_validade == None))
-    todas_as_atas = query_base.order_by(Ata.ano.desc(), Ata.numero_ata.desc()).all()
+    todas_as_atas = paginar_por_cursor(query_base,
+                                       [(Ata.ano, True), (Ata.numero_ata, True), (Ata.id, True)],
+                                       cursor=request.args.get('cursor'),
+                                       por_pagina=app.config['ITENS_POR_PAGINA'])
     return render_template('listar_atas.html',
                            titulo_pagina="Atas Registradas",
                            lista_de_atas=todas_as_atas,
@@ -465,7 +599,8 @@ def index():
 @login_required
 @role_required('admin', 'gestor')
 def importar_atas_csv():
-    form = ImportCSVForm()
+    form = ImportAtasCSVForm()
+    validacao, token_erros = None, None
     if form.validate_on_submit():
         if 'csv_file' not in request.files:
             flash('Nenhum arquivo selecionado.', 'danger')
@@ -476,68 +611,210 @@ def importar_atas_csv():
             flash('Nenhum arquivo selecionado.', 'danger')
             return redirect(request.url)
             
-        if file and file.filename.endswith('.csv'):
+        if not file.filename.endswith('.csv'):
+            flash('Envie um arquivo com extensão .csv.', 'danger')
+        elif form.validar.data:
+            validacao = importacao.validar_atas_csv(io.TextIOWrapper(file.stream, 'utf-8-sig', errors='replace'),
+                                                    modo=form.modo.data)
+            if validacao.valido:
+                flash(f'Arquivo válido: {validacao.linhas} linha(s) prontas para importar.', 'success')
+                if validacao.avisos:
+                    flash(f'{len(validacao.avisos)} aviso(s): confira a lista abaixo antes de importar.', 'warning')
+            else:
+                token_erros = _salvar_relatorio_de_erros(validacao)
+                flash(f'Foram encontrados {len(validacao.erros)} erro(s) em {validacao.linhas_com_erro} linha(s). Nada foi gravado.', 'danger')
+        else:
+            job = enfileirar_importacao(form.modo.data, file)
+            flash('Arquivo recebido. A importação será processada em segundo plano; acompanhe o andamento abaixo.', 'info')
+            return redirect(url_for('acompanhar_importacao', job_id=job.id))
+
+    importacoes_recentes = ImportacaoJob.query.filter_by(usuario_id=current_user.id)\
+        .filter(ImportacaoJob.tipo.in_(('atas', 'atas_atualizar')))\
+        .order_by(ImportacaoJob.criado_em.desc()).limit(10).all()
+    return render_template('importar_atas_csv.html', form=form, titulo_pagina="Importar Atas de CSV",
+                           importacoes_recentes=importacoes_recentes, validacao=validacao, token_erros=token_erros)
+
+@app.route('/importar/contratos_csv', methods=['GET', 'POST'])
+@login_required
+@role_required('admin', 'gestor')
+def importar_contratos_csv():
+    form = ImportCSVForm()
+    if form.validate_on_submit():
+        file = request.files.get('csv_file')
+        if not file or file.filename == '':
+            flash('Nenhum arquivo selecionado.', 'danger')
+            return redirect(request.url)
+        if not file.filename.endswith('.csv'):
+            flash('Envie um arquivo com extensão .csv.', 'danger')
+        else:
+            job = enfileirar_importacao('contratos', file)
+            flash('Arquivo recebido. A importação será processada em segundo plano; acompanhe o andamento abaixo.', 'info')
+            return redirect(url_for('acompanhar_importacao', job_id=job.id))
+
+    importacoes_recentes = ImportacaoJob.query.filter_by(usuario_id=current_user.id, tipo='contratos')\
+        .order_by(ImportacaoJob.criado_em.desc()).limit(10).all()
+    return render_template('importar_contratos_csv.html', form=form, titulo_pagina="Importar Contratos de CSV",
+                           importacoes_recentes=importacoes_recentes)
+
+# Relatórios de erro da validação ficam no diretório de spool por um dia.
+VALIDADE_RELATORIO_ERROS = 24 * 60 * 60
+
+def _salvar_relatorio_de_erros(validacao):
+    diretorio = app.config['IMPORTACAO_DIRETORIO']
+    os.makedirs(diretorio, exist_ok=True)
+    limite = time.time() - VALIDADE_RELATORIO_ERROS
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        if nome.startswith('erros_') and os.path.getmtime(caminho) < limite:
             try:
-                atas_criadas = {}
-                stream = io.TextIOWrapper(file.stream, 'utf-8', errors='replace')
-                csv_reader = csv.DictReader(stream)
-                
-                itens_criados_total = 0
-                
-                for row in csv_reader:
-                    numero_ata = row.get('numero_ata')
-                    ano_ata_str = row.get('ano_ata')
-
-                    if not numero_ata or not ano_ata_str:
-                        raise ValueError("Cada linha deve ter 'numero_ata' e 'ano_ata'.")
-
-                    chave_ata = f"{numero_ata}/{ano_ata_str}"
-                    ata_obj = atas_criadas.get(chave_ata)
-
-                    if not ata_obj:
-                        ata_obj = Ata.query.filter_by(numero_ata=numero_ata, ano=int(ano_ata_str)).first()
-                        if not ata_obj:
-                            data_assinatura = datetime.strptime(row['data_assinatura_ata'], '%d/%m/%Y') if row.get('data_assinatura_ata') else None
-                            data_validade = datetime.strptime(row['data_validade_ata'], '%d/%m/%Y') if row.get('data_validade_ata') else None
-
-                            ata_obj = Ata(
-                                numero_ata=numero_ata,
-                                ano=int(ano_ata_str),
-                                descricao=row.get('descricao_ata'),
-                                data_assinatura=data_assinatura,
-                                data_validade=data_validade
-                            )
-                            db.session.add(ata_obj)
-                            db.session.flush() 
-                        
-                        atas_criadas[chave_ata] = ata_obj
-
-                    valor_unitario_str = row.get('valor_unitario_registrado', '0').replace(',', '.')
-                    quantidade_str = row.get('quantidade_registrada', '0').replace(',', '.')
-                    
-                    novo_item = ItemAta(
-                        ata_id=ata_obj.id,
-                        descricao_item=row.get('descricao_item'),
-                        tipo_item=row.get('tipo_item', 'OUTRO'),
-                        unidade_medida=row.get('unidade_medida'),
-                        quantidade_registrada=float(quantidade_str),
-                        valor_unitario_registrado=float(valor_unitario_str),
-                        lote=row.get('lote')
-                    )
-                    novo_item.saldo_disponivel = novo_item.quantidade_registrada
-                    db.session.add(novo_item)
-                    itens_criados_total += 1
-                
-                db.session.commit()
-                registrar_log(current_user, "IMPORTAÇÃO CSV", f"{len(atas_criadas)} ata(s) e {itens_criados_total} item(ns) importados.")
-                flash(f'Importação concluída com sucesso! {len(atas_criadas)} ata(s) processada(s) e {itens_criados_total} item(ns) criado(s).', 'success')
-                return redirect(url_for('index'))
-                
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao processar o arquivo CSV: {e}', 'danger')
+                os.remove(caminho)
+            except OSError:
+                pass
+    token = uuid.uuid4().hex
+    with open(os.path.join(diretorio, f"erros_{token}.csv"), 'w', encoding='utf-8-sig', newline='') as destino:
+        validacao.escrever_erros(destino)
+    return token
+
+@app.route('/importar/atas_csv/erros/<token>')
+@login_required
+@role_required('admin', 'gestor')
+def baixar_relatorio_erros_importacao(token):
+    caminho = os.path.join(app.config['IMPORTACAO_DIRETORIO'], f"erros_{token}.csv")
+    if not re.fullmatch(r'[0-9a-f]{32}', token) or not os.path.exists(caminho):
+        flash('Relatório de erros não encontrado ou expirado. Valide o arquivo novamente.', 'warning')
+        return redirect(url_for('importar_atas_csv'))
+    return send_file(caminho, mimetype='text/csv', as_attachment=True, download_name='erros_importacao_atas.csv')
+
+# --- IMPORTAÇÕES EM SEGUNDO PLANO ---
+# O arquivo enviado é gravado no diretório de spool e processado por um pool de
+# threads do próprio processo, fora do ciclo da requisição (sem broker externo).
+# A importação continua atômica: uma única transação, confirmada no fim. Como o
+# progresso precisa ser visível antes desse commit (e para qualquer worker),
+# ele é gravado a cada PROGRESSO_A_CADA_LOTES fatias: no PostgreSQL, na linha
+# da tarefa, por uma conexão à parte; no SQLite, que admite um único escritor
+# por vez e está travado pela própria importação, num arquivo ao lado do CSV no
+# diretório de spool, lido pelo endpoint de progresso enquanto a tarefa roda.
+IMPORTADORES = {
+    'atas': importacao.importar_atas_csv,
+    'atas_atualizar': partial(importacao.importar_atas_csv, atualizar_existentes=True),
+    'contratos': importacao.importar_contratos_csv,
+}
+executor_importacoes = ThreadPoolExecutor(max_workers=app.config['IMPORTACAO_WORKERS'],
+                                          thread_name_prefix='importacao')
+PROGRESSO_A_CADA_LOTES = 5
+
+def _atualizar_job(job_id, *condicoes, **valores):
+    """Grava o estado da tarefa numa transação própria, independente da importação."""
+    tabela = ImportacaoJob.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            update(tabela).where(tabela.c.id == job_id, *condicoes).values(**valores)
+        ).rowcount
+
+def _caminho_progresso(job_id):
+    return os.path.join(app.config['IMPORTACAO_DIRETORIO'], f"progresso_{job_id}.txt")
+
+def _registrar_progresso(job_id, lote, linhas):
+    if lote % PROGRESSO_A_CADA_LOTES:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        _atualizar_job(job_id, linhas_processadas=linhas)
+        return
+    caminho = _caminho_progresso(job_id)
+    with open(caminho + '.tmp', 'w') as arquivo:
+        arquivo.write(str(linhas))
+    os.replace(caminho + '.tmp', caminho)
+
+def _ler_progresso(job):
+    """Linhas processadas da tarefa, inclusive as ainda não confirmadas de uma importação em curso."""
+    linhas = job.linhas_processadas
+    if job.status == 'PROCESSANDO' and db.engine.dialect.name != 'postgresql':
+        try:
+            with open(_caminho_progresso(job.id)) as arquivo:
+                linhas = max(linhas, int(arquivo.read() or 0))
+        except (OSError, ValueError):
+            pass
+    return linhas
+
+def enfileirar_importacao(tipo, arquivo):
+    """Grava o arquivo enviado no spool, cria a tarefa e a coloca na fila. Faz commit."""
+    diretorio = app.config['IMPORTACAO_DIRETORIO']
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"{uuid.uuid4().hex}.csv")
+    arquivo.save(caminho)
+    job = ImportacaoJob(tipo=tipo, nome_arquivo=arquivo.filename[:255], caminho_arquivo=caminho,
+                        status='PENDENTE', linhas_processadas=0, usuario_id=current_user.id)
+    db.session.add(job)
+    db.session.commit()
+    executor_importacoes.submit(processar_importacao, job.id)
+    return job
+
+def processar_importacao(job_id):
+    """Executa uma tarefa da fila, com contexto de aplicação e sessão próprios.
+
+    A tarefa só é executada se ainda estiver PENDENTE, o que impede que dois
+    workers processem o mesmo arquivo. O resultado é registrado em registrar_log.
+    """
+    with app.app_context():
+        tabela = ImportacaoJob.__table__
+        if not _atualizar_job(job_id, tabela.c.status == 'PENDENTE',
+                              status='PROCESSANDO', iniciado_em=datetime.now(timezone.utc)):
+            return
+        job = db.session.get(ImportacaoJob, job_id)
+        usuario = job.usuario
+        lotes = count(1)
+        try:
+            with open(job.caminho_arquivo, encoding='utf-8-sig', errors='replace', newline='') as arquivo:
+                resultado = IMPORTADORES[job.tipo](
+                    arquivo, tamanho_lote=app.config['IMPORTACAO_TAMANHO_LOTE'], usuario_id=usuario.id,
+                    ao_processar_lote=lambda parcial: _registrar_progresso(job_id, next(lotes), parcial.linhas)
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, ValueError):
+                app.logger.error(f"Erro na importação {job_id}: {e}", exc_info=True)
+            _atualizar_job(job_id, status='ERRO', erros=str(e), concluido_em=datetime.now(timezone.utc))
+            registrar_log(usuario, "IMPORTAÇÃO CSV COM ERRO", f"Arquivo {job.nome_arquivo} (tarefa {job_id}): {e}")
+        else:
+            _atualizar_job(job_id, status='CONCLUIDO', linhas_processadas=resultado.linhas,
+                           resumo=resultado.resumo(), concluido_em=datetime.now(timezone.utc))
+            registrar_log(usuario, "IMPORTAÇÃO CSV", f"{resultado.resumo()} importados do arquivo {job.nome_arquivo} (tarefa {job_id}).")
+        finally:
+            for caminho in (job.caminho_arquivo, _caminho_progresso(job_id)):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+            db.session.remove()
+
+def _job_do_usuario(job_id):
+    job = ImportacaoJob.query.get_or_404(job_id)
+    if job.usuario_id != current_user.id and current_user.role != 'admin':
+        abort(403)
+    return job
+
+@app.route('/importacoes/<int:job_id>')
+@login_required
+def acompanhar_importacao(job_id):
+    job = _job_do_usuario(job_id)
+    return render_template('acompanhar_importacao.html', job=job,
+                           titulo_pagina=f"Importação {job.nome_arquivo}")
+
+@app.route('/importacoes/<int:job_id>/progresso')
+@login_required
+def progresso_importacao(job_id):
+    job = _job_do_usuario(job_id)
+    linhas = _ler_progresso(job)
+    return jsonify({
+        'status': job.status,
+        'status_display': dict(ImportacaoJob.STATUS_CHOICES).get(job.status, job.status),
+        'finalizado': job.finalizado,
+        'linhas_processadas': linhas,
+        'resumo': job.resumo,
+        'erros': job.erros,
+    })
 
-    return render_template('importar_atas_csv.html', form=form, titulo_pagina="Importar Atas de CSV")
 
 @app.route('/ata/nova', methods=['GET', 'POST'])
 @login_required
@@ -591,20 +868,34 @@ def editar_ata(ata_id):
 
     return render_template('editar_ata.html', titulo_pagina="Editar Ata", form=form, ata_id=ata_id)
 
+def _itens_referenciados_em_consumos(*filtros):
+    """Itens de ata (id, descrição) que aparecem em alguma linha de consumo de Contratinho ou Empenho.
+
+    Uma única consulta com EXISTS nas duas tabelas de consumo, resolvidos pelos
+    índices em item_ata_id, em vez de duas consultas por item.
+    """
+    referenciado = or_(
+        exists().where(ConsumoItemContratinho.item_ata_id == ItemAta.id),
+        exists().where(ConsumoItemEmpenho.item_ata_id == ItemAta.id),
+    )
+    return db.session.query(ItemAta.id, ItemAta.descricao_item)\
+        .filter(*filtros, referenciado).order_by(ItemAta.descricao_item).all()
+
+def _resumir_itens(itens, limite=5):
+    descricoes = [descricao for _, descricao in itens[:limite]]
+    if len(itens) > limite:
+        descricoes.append(f"e mais {len(itens) - limite}")
+    return ', '.join(descricoes)
+
 @app.route('/ata/excluir/<int:ata_id>', methods=['GET'])
 @login_required
 @role_required('admin', 'gestor')
 def excluir_ata(ata_id):
     ata_para_excluir = Ata.query.get_or_404(ata_id)
     try:
-        itens_em_uso = False
-        for item_ata in ata_para_excluir.itens_ata:
-            if ConsumoItemContratinho.query.filter_by(item_ata_id=item_ata.id).first() or \
-               ConsumoItemEmpenho.query.filter_by(item_ata_id=item_ata.id).first():
-                itens_em_uso = True
-                break
+        itens_em_uso = _itens_referenciados_em_consumos(ItemAta.ata_id == ata_para_excluir.id)
         if itens_em_uso:
-            flash('Não é possível excluir a ata. Existem itens desta ata que já foram consumidos em Contratinhos ou Empenhos.', 'danger')
+            flash(f'Não é possível excluir a ata. {len(itens_em_uso)} item(ns) desta ata já foram consumidos em Contratinhos ou Empenhos: {_resumir_itens(itens_em_uso)}.', 'danger')
             return redirect(url_for('index'))
         
         num_ata = ata_para_excluir.numero_ata
@@ -825,6 +1116,48 @@ def gerenciar_cotas_item(item_id):
                            form=form, 
                            unidades=unidades)
 
+@app.route('/ata/<int:ata_id>/cotas/modelo')
+@login_required
+@role_required('admin', 'gestor')
+def exportar_matriz_cotas_ata(ata_id):
+    ata = Ata.query.get_or_404(ata_id)
+    destino = io.StringIO()
+    importacao.exportar_matriz_cotas(ata.id, destino)
+    response = make_response(destino.getvalue().encode('utf-8-sig'))
+    response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename=cotas_ata_{ata.numero_ata}_{ata.ano}.csv'.replace('/', '-')
+    return response
+
+@app.route('/ata/<int:ata_id>/cotas/importar', methods=['GET', 'POST'])
+@login_required
+@role_required('admin', 'gestor')
+def importar_matriz_cotas_ata(ata_id):
+    ata = Ata.query.get_or_404(ata_id)
+    form = ImportCSVForm()
+    erros = []
+    if form.validate_on_submit():
+        file = request.files.get('csv_file')
+        if not file or not file.filename.endswith('.csv'):
+            flash('Envie um arquivo com extensão .csv.', 'danger')
+        else:
+            try:
+                stream = io.TextIOWrapper(file.stream, 'utf-8-sig', errors='replace')
+                resultado = importacao.importar_matriz_cotas(stream, ata.id, usuario_id=current_user.id)
+                if resultado.erros:
+                    db.session.rollback()
+                    erros = resultado.erros
+                    flash(f'Nenhuma cota foi gravada: o arquivo tem {len(erros)} erro(s).', 'danger')
+                else:
+                    db.session.commit()
+                    registrar_log(current_user, "IMPORTOU COTAS", f"Ata nº {ata.numero_ata}/{ata.ano} (ID: {ata.id}): {resultado.resumo()}.")
+                    flash(f'Cotas importadas com sucesso: {resultado.resumo()}.', 'success')
+                    return redirect(url_for('listar_itens_da_ata', ata_id=ata.id))
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Erro ao importar as cotas: {e}', 'danger')
+    return render_template('importar_cotas_ata.html', ata=ata, form=form, erros=erros,
+                           titulo_pagina=f"Importar Cotas da Ata {ata.numero_ata}/{ata.ano}")
+
 @app.route('/item_ata/<int:item_id>/visualizar_cotas')
 @login_required
 def visualizar_cotas_item(item_id):
@@ -860,8 +1193,7 @@ def excluir_item_ata(ata_id, item_id):
     if item_para_excluir.ata_id != ata.id:
         flash('Item não pertence à ata especificada.', 'danger')
         return redirect(url_for('listar_itens_da_ata', ata_id=ata.id))
-    if ConsumoItemContratinho.query.filter_by(item_ata_id=item_id).first() or \
-       ConsumoItemEmpenho.query.filter_by(item_ata_id=item_id).first():
+    if _itens_referenciados_em_consumos(ItemAta.id == item_para_excluir.id):
         flash('Este item não pode ser excluído pois já foi referenciado em Contratinhos ou Empenhos. Remova as referências primeiro.', 'danger')
         return redirect(url_for('listar_itens_da_ata', ata_id=ata.id))
     try:
@@ -910,14 +1242,20 @@ def _processar_itens_livres_contrato(form_itens_data, contrato_pai_obj):
 @login_required
 def listar_contratos():
     filtro = request.args.get('filtro', 'vigentes')
-    query_base = Contrato.query
+    query_base = db.session.query(Contrato, _contagem_por_pai(ItemContrato.contrato_id, Contrato.id))\
+        .options(joinedload(Contrato.processo))
     hoje = datetime.now(timezone.utc).date()
     if filtro == 'vigentes':
         query_base = query_base.filter(or_(Contrato.data_fim_vigencia >= hoje, Contrato.data_fim_vigencia == None))
-    todos_os_contratos = query_base.order_by(Contrato.data_assinatura_contrato.desc(), Contrato.numero_contrato.desc()).all()
+    todos_os_contratos = paginar_por_cursor(query_base,
+                                            [(Contrato.data_assinatura_contrato, True), (Contrato.numero_contrato, True), (Contrato.id, True)],
+                                            cursor=request.args.get('cursor'),
+                                            por_pagina=app.config['ITENS_POR_PAGINA'])
+    comentarios = carregar_comentarios([linha[0] for linha in todos_os_contratos.itens])
     return render_template('listar_contratos.html',
                            titulo_pagina="Lista de Contratos",
                            lista_de_contratos=todos_os_contratos,
+                           comentarios=comentarios,
                            filtro_ativo=filtro,
                            today=hoje)
 
@@ -1061,18 +1399,8 @@ def _recalculate_contract_state(contrato_id):
     acrescimo_aditivos = sum(ad.valor_acrescimo for ad in contrato.aditivos if ad.valor_acrescimo is not None)
     contrato.valor_global_contrato = valor_base + acrescimo_aditivos
 
-    data_final = contrato.data_fim_vigencia_original
-    
     aditivos_ordenados = sorted(list(contrato.aditivos), key=lambda ad: ad.data_assinatura.date() if isinstance(ad.data_assinatura, datetime) else ad.data_assinatura)
-
-    for aditivo in aditivos_ordenados:
-        if aditivo.nova_data_fim_vigencia:
-            data_final = aditivo.nova_data_fim_vigencia
-        elif aditivo.prazo_adicional_dias and data_final:
-            current_date_obj = data_final.date() if isinstance(data_final, datetime) else data_final
-            data_final = current_date_obj + timedelta(days=aditivo.prazo_adicional_dias)
-    
-    contrato.data_fim_vigencia = data_final
+    contrato.data_fim_vigencia = calcular_fim_vigencia(contrato.data_fim_vigencia_original, aditivos_ordenados)
 
 # --- ROTAS PARA ADITIVOS ---
 @app.route('/contrato/<int:contrato_id>/aditivo/novo', methods=['GET', 'POST'])
@@ -1154,7 +1482,10 @@ def excluir_aditivo(aditivo_id):
 @app.route('/unidades')
 @login_required
 def listar_unidades():
-    unidades = UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()
+    unidades = paginar_por_cursor(UnidadeSaude.query,
+                                  [(UnidadeSaude.nome_unidade, False), (UnidadeSaude.id, False)],
+                                  cursor=request.args.get('cursor'),
+                                  por_pagina=app.config['ITENS_POR_PAGINA'])
     unidade_tipo_map = dict(UnidadeSaude.TIPO_UNIDADE_CHOICES)
     return render_template('listar_unidades.html', 
                            titulo_pagina="Unidades de Saúde", 
@@ -1224,79 +1555,256 @@ def excluir_unidade(unidade_id):
     return redirect(url_for('listar_unidades'))
 
 # --- LÓGICA AUXILIAR PARA PROCESSAR ITENS CONSUMIDOS ---
-def _processar_itens_consumidos_para_salvar(form_itens_data, objeto_pai, ModeloConsumoItem, ata_id_principal, unidade_saude_id):
-    novos_consumos_db_list = []
-    valor_total_itens_calculado = 0.0
+class ErrosValidacaoConsumo(ValueError):
+    """Todas as linhas de consumo inválidas de um formulário, de uma só vez."""
+    def __init__(self, mensagens):
+        super().__init__(" ".join(mensagens))
+        self.mensagens = mensagens
+
+def _flash_erro_validacao(ve):
+    for mensagem in getattr(ve, 'mensagens', [str(ve)]):
+        flash(mensagem, 'danger')
+
+def _linhas_de_consumo(form_itens_data):
+    """Converte os dados do FieldList em [(item_ata_id, quantidade)], ignorando linhas vazias."""
     itens_a_processar = []
     if isinstance(form_itens_data, list):
         itens_a_processar = form_itens_data
     elif isinstance(form_itens_data, dict) and form_itens_data.get('item_ata_id'): 
         itens_a_processar = [form_itens_data]
 
-    if not unidade_saude_id:
-        raise ValueError("Uma Unidade de Saúde é obrigatória para consumir um item.")
-
+    linhas = []
     for item_data in itens_a_processar:
         item_id = int(item_data.get('item_ata_id')) if item_data.get('item_ata_id') else None
         quantidade_a_consumir = float(str(item_data.get('quantidade_consumida', '0.0')))
-        
         if item_id and quantidade_a_consumir > 0:
-            item_ata = db.session.get(ItemAta, item_id)
-            if not item_ata:
-                raise ValueError(f"Item ID {item_id} não encontrado.")
+            linhas.append((item_id, quantidade_a_consumir))
+    return linhas
+
+def _carregar_itens_e_cotas(ids_itens, ids_unidades):
+    """Carrega de uma vez os itens e as cotas (das unidades informadas) referenciados pelas linhas."""
+    itens_por_id = {item.id: item for item in ItemAta.query.filter(ItemAta.id.in_(ids_itens)).all()}
+    cotas = {
+        (cota.item_ata_id, cota.unidade_saude_id): cota for cota in CotaUnidadeItem.query.filter(
+            CotaUnidadeItem.item_ata_id.in_(ids_itens),
+            CotaUnidadeItem.unidade_saude_id.in_(ids_unidades)
+        ).all()
+    }
+    return itens_por_id, cotas
+
+def _validar_linhas_consumo(linhas, ata_id_principal, unidade_saude_id, itens_por_id, cotas, saldos_reservados):
+    """Confere as linhas [(item_ata_id, quantidade)] contra os saldos já carregados.
+
+    saldos_reservados guarda o que sobra de saldo de itens e cotas após os
+    consumos já validados (chaves item_ata_id e (item_ata_id, unidade_saude_id)),
+    e só é atualizado se todas as linhas forem válidas. Retorna
+    (erros, {item_ata_id: quantidade total}).
+    """
+    erros = []
+    saldo_restante = {}
+    quantidade_por_item = {}
+    unidade_nome = None
+    for item_id, quantidade_a_consumir in linhas:
+        item_ata = itens_por_id.get(item_id)
+        if not item_ata:
+            erros.append(f"Item ID {item_id} não encontrado.")
+            continue
 
-            if item_ata.ata_id != ata_id_principal:
-                 raise ValueError(f"Item '{item_ata.descricao_item}' não pertence à Ata selecionada.")
+        if item_ata.ata_id != ata_id_principal:
+            erros.append(f"Item '{item_ata.descricao_item}' não pertence à Ata selecionada.")
+            continue
 
-            if item_ata.saldo_disponivel < quantidade_a_consumir:
-                raise ValueError(f"Saldo GLOBAL insuficiente para '{item_ata.descricao_item}'. Disponível: {item_ata.saldo_disponivel:.2f}, Solicitado: {quantidade_a_consumir:.2f}.")
+        # Linhas repetidas do mesmo item são conferidas contra o saldo que sobra após as anteriores.
+        saldo_global = saldo_restante.get(item_id, saldos_reservados.get(item_id, item_ata.saldo_disponivel))
+        if saldo_global < quantidade_a_consumir:
+            erros.append(f"Saldo GLOBAL insuficiente para '{item_ata.descricao_item}'. Disponível: {saldo_global:.2f}, Solicitado: {quantidade_a_consumir:.2f}.")
+            continue
 
-            cota_unidade = CotaUnidadeItem.query.filter_by(item_ata_id=item_id, unidade_saude_id=unidade_saude_id).first()
-            if not cota_unidade or cota_unidade.quantidade_prevista == 0:
+        chave_cota = (item_id, unidade_saude_id)
+        cota_unidade = cotas.get(chave_cota)
+        if not cota_unidade or cota_unidade.quantidade_prevista == 0:
+            if unidade_nome is None:
                 unidade_nome = db.session.get(UnidadeSaude, unidade_saude_id).nome_unidade
-                raise ValueError(f"A unidade '{unidade_nome}' não tem cota definida para o item '{item_ata.descricao_item}'.")
-            
-            saldo_cota = cota_unidade.quantidade_prevista - cota_unidade.quantidade_consumida
-            if quantidade_a_consumir > saldo_cota:
-                raise ValueError(f"Saldo da COTA da unidade insuficiente para '{item_ata.descricao_item}'. Saldo da Cota: {saldo_cota:.2f}, Solicitado: {quantidade_a_consumir:.2f}.")
+            erros.append(f"A unidade '{unidade_nome}' não tem cota definida para o item '{item_ata.descricao_item}'.")
+            continue
 
-            item_ata.saldo_disponivel -= quantidade_a_consumir
-            cota_unidade.quantidade_consumida += quantidade_a_consumir
-            
-            valor_unit = item_ata.valor_unitario_registrado or 0.0
-            valor_item_consumido = quantidade_a_consumir * valor_unit
-            valor_total_itens_calculado += valor_item_consumido
-            
-            consumo_kwargs = {
-                'item_ata_id': item_ata.id,
-                'quantidade_consumida': quantidade_a_consumir,
-                'valor_unitario_no_consumo': valor_unit,
-                'valor_total_consumido_item': valor_item_consumido
-            }
-            
-            if isinstance(objeto_pai, Contratinho):
-                consumo_kwargs['contratinho_id'] = objeto_pai.id
-            elif isinstance(objeto_pai, Empenho):
-                consumo_kwargs['empenho_id'] = objeto_pai.id
-            
-            novo_consumo_obj = ModeloConsumoItem(**consumo_kwargs)
-            db.session.add(novo_consumo_obj) 
-            novos_consumos_db_list.append(novo_consumo_obj)
-    
+        saldo_cota = saldo_restante.get(chave_cota, saldos_reservados.get(
+            chave_cota, cota_unidade.quantidade_prevista - cota_unidade.quantidade_consumida))
+        if quantidade_a_consumir > saldo_cota:
+            erros.append(f"Saldo da COTA da unidade insuficiente para '{item_ata.descricao_item}'. Saldo da Cota: {saldo_cota:.2f}, Solicitado: {quantidade_a_consumir:.2f}.")
+            continue
+
+        saldo_restante[item_id] = saldo_global - quantidade_a_consumir
+        saldo_restante[chave_cota] = saldo_cota - quantidade_a_consumir
+        quantidade_por_item[item_id] = quantidade_por_item.get(item_id, 0.0) + quantidade_a_consumir
+
+    if not erros:
+        saldos_reservados.update(saldo_restante)
+    return erros, quantidade_por_item
+
+def _aplicar_baixa(item_ata, unidade_saude_id, quantidade):
+    # Baixa atômica: a validação usou os saldos lidos no início, e outro
+    # worker pode ter consumido o mesmo item desde então.
+    if not ajustar_saldo_item(item_ata.id, -quantidade):
+        raise ValueError(f"Saldo GLOBAL de '{item_ata.descricao_item}' foi alterado por outra operação e não comporta mais {quantidade:.2f}. Revise as quantidades e tente novamente.")
+    if not ajustar_consumo_cota(item_ata.id, unidade_saude_id, quantidade):
+        raise ValueError(f"Saldo da COTA da unidade para '{item_ata.descricao_item}' foi alterado por outra operação e não comporta mais {quantidade:.2f}. Revise as quantidades e tente novamente.")
+
+def _baixar_saldos(linhas, ata_id_principal, unidade_saude_id, documento=None):
+    """Valida as linhas [(item_ata_id, quantidade)] e baixa saldo e cota de cada item.
+
+    Cada baixa é lançada no livro de movimentos com o documento informado.
+    Retorna {item_ata_id: ItemAta} dos itens envolvidos. Levanta
+    ErrosValidacaoConsumo com todas as linhas inválidas de uma vez.
+    """
+    itens_por_id, cotas = _carregar_itens_e_cotas({item_id for item_id, _ in linhas}, [unidade_saude_id])
+    erros, quantidade_por_item = _validar_linhas_consumo(
+        linhas, ata_id_principal, unidade_saude_id, itens_por_id, cotas, {}
+    )
+    if erros:
+        raise ErrosValidacaoConsumo(erros)
+
+    for item_id, quantidade_total in quantidade_por_item.items():
+        _aplicar_baixa(itens_por_id[item_id], unidade_saude_id, quantidade_total)
+        lancar_movimento_consumo(item_id, unidade_saude_id, quantidade_total, documento)
+    return itens_por_id
+
+def _novo_consumo(objeto_pai, ModeloConsumoItem, item_ata, quantidade):
+    valor_unit = item_ata.valor_unitario_registrado or 0.0
+    consumo_kwargs = {
+        'item_ata_id': item_ata.id,
+        'quantidade_consumida': quantidade,
+        'valor_unitario_no_consumo': valor_unit,
+        'valor_total_consumido_item': quantidade * valor_unit
+    }
+
+    if isinstance(objeto_pai, Contratinho):
+        consumo_kwargs['contratinho_id'] = objeto_pai.id
+    elif isinstance(objeto_pai, Empenho):
+        consumo_kwargs['empenho_id'] = objeto_pai.id
+
+    novo_consumo_obj = ModeloConsumoItem(**consumo_kwargs)
+    db.session.add(novo_consumo_obj)
+    return novo_consumo_obj
+
+def _processar_itens_consumidos_para_salvar(form_itens_data, objeto_pai, ModeloConsumoItem, ata_id_principal, unidade_saude_id):
+    novos_consumos_db_list = []
+    valor_total_itens_calculado = 0.0
+
+    if not unidade_saude_id:
+        raise ValueError("Uma Unidade de Saúde é obrigatória para consumir um item.")
+
+    linhas = _linhas_de_consumo(form_itens_data)
+    if not linhas:
+        return novos_consumos_db_list, valor_total_itens_calculado
+
+    itens_por_id = _baixar_saldos(linhas, ata_id_principal, unidade_saude_id, objeto_pai)
+
+    for item_id, quantidade_a_consumir in linhas:
+        novo_consumo_obj = _novo_consumo(objeto_pai, ModeloConsumoItem, itens_por_id[item_id], quantidade_a_consumir)
+        valor_total_itens_calculado += novo_consumo_obj.valor_total_consumido_item
+        novos_consumos_db_list.append(novo_consumo_obj)
+
+    registrar_gasto_unidade(unidade_saude_id, objeto_pai.data_emissao, valor_total_itens_calculado)
     return novos_consumos_db_list, valor_total_itens_calculado
 
+def _estornar_itens_consumidos(objeto_pai, unidade_saude_id, data_emissao):
+    """Devolve ao item e à cota tudo o que o documento consumiu e apaga suas linhas."""
+    valor_estornado = 0.0
+    for consumo_antigo in list(objeto_pai.itens_consumidos):
+        ajustar_saldo_item(consumo_antigo.item_ata_id, consumo_antigo.quantidade_consumida)
+        ajustar_consumo_cota(consumo_antigo.item_ata_id, unidade_saude_id, -consumo_antigo.quantidade_consumida)
+        lancar_movimento_consumo(consumo_antigo.item_ata_id, unidade_saude_id, -consumo_antigo.quantidade_consumida, objeto_pai)
+        valor_estornado += consumo_antigo.valor_total_consumido_item or 0.0
+        db.session.delete(consumo_antigo)
+    registrar_gasto_unidade(unidade_saude_id, data_emissao, -valor_estornado)
+    db.session.flush()
+
+def _atualizar_itens_consumidos(form_itens_data, objeto_pai, ModeloConsumoItem, ata_id_anterior, unidade_saude_id_anterior, data_emissao_anterior):
+    """Aplica a edição das linhas de consumo de um Contratinho/Empenho pela diferença.
+
+    objeto_pai já deve estar com os novos dados de cabeçalho; os valores
+    anteriores de ata, unidade e data de emissão são recebidos à parte. Se a
+    ata ou a unidade mudaram, tudo é estornado e consumido de novo. Caso
+    contrário, só os itens cuja quantidade total mudou são tocados: o aumento
+    é validado, baixado e gravado como uma linha nova pelo valor atual, e a
+    redução é devolvida e retirada das linhas mais recentes do item. As demais
+    linhas (e seus valores da época do consumo) ficam como estão.
+    Retorna o novo valor total dos itens.
+    """
+    ata_id, unidade_saude_id = objeto_pai.ata_id, objeto_pai.unidade_saude_id
+    if ata_id != ata_id_anterior or unidade_saude_id != unidade_saude_id_anterior:
+        _estornar_itens_consumidos(objeto_pai, unidade_saude_id_anterior, data_emissao_anterior)
+        _, valor_total = _processar_itens_consumidos_para_salvar(
+            form_itens_data, objeto_pai, ModeloConsumoItem, ata_id, unidade_saude_id
+        )
+        return valor_total
+
+    consumos_por_item = {}
+    for consumo in objeto_pai.itens_consumidos:
+        consumos_por_item.setdefault(consumo.item_ata_id, []).append(consumo)
+    valor_anterior = sum(consumo.valor_total_consumido_item or 0.0
+                         for consumos in consumos_por_item.values() for consumo in consumos)
+
+    quantidade_nova = {}
+    for item_id, quantidade in _linhas_de_consumo(form_itens_data):
+        quantidade_nova[item_id] = quantidade_nova.get(item_id, 0.0) + quantidade
+    quantidade_anterior = {item_id: sum(consumo.quantidade_consumida for consumo in consumos)
+                           for item_id, consumos in consumos_por_item.items()}
+
+    aumentos = []
+    reducoes = {}
+    for item_id in set(quantidade_nova) | set(quantidade_anterior):
+        delta = quantidade_nova.get(item_id, 0.0) - quantidade_anterior.get(item_id, 0.0)
+        if delta > 0:
+            aumentos.append((item_id, delta))
+        elif delta < 0:
+            reducoes[item_id] = -delta
+
+    if aumentos and not unidade_saude_id:
+        raise ValueError("Uma Unidade de Saúde é obrigatória para consumir um item.")
+    itens_por_id = _baixar_saldos(aumentos, ata_id, unidade_saude_id, objeto_pai) if aumentos else {}
+    for item_id, quantidade in reducoes.items():
+        ajustar_saldo_item(item_id, quantidade)
+        ajustar_consumo_cota(item_id, unidade_saude_id, -quantidade)
+        lancar_movimento_consumo(item_id, unidade_saude_id, -quantidade, objeto_pai)
+
+    # O aumento vira uma linha nova, pelo valor unitário atual do item; as
+    # linhas já gravadas mantêm o valor da época em que foram consumidas.
+    for item_id, quantidade in aumentos:
+        _novo_consumo(objeto_pai, ModeloConsumoItem, itens_por_id[item_id], quantidade)
+    # A redução sai das linhas mais recentes do item; só as que zeram são apagadas.
+    for item_id, quantidade in reducoes.items():
+        for consumo in sorted(consumos_por_item[item_id], key=lambda consumo: consumo.id, reverse=True):
+            if quantidade <= 0:
+                break
+            retirada = min(quantidade, consumo.quantidade_consumida)
+            quantidade -= retirada
+            if retirada >= consumo.quantidade_consumida:
+                db.session.delete(consumo)
+            else:
+                consumo.quantidade_consumida -= retirada
+                consumo.valor_total_consumido_item = consumo.quantidade_consumida * (consumo.valor_unitario_no_consumo or 0.0)
+    db.session.flush()
+
+    valor_total = sum(consumo.valor_total_consumido_item or 0.0 for consumo in objeto_pai.itens_consumidos)
+    if objeto_pai.data_emissao != data_emissao_anterior:
+        registrar_gasto_unidade(unidade_saude_id, data_emissao_anterior, -valor_anterior)
+        registrar_gasto_unidade(unidade_saude_id, objeto_pai.data_emissao, valor_total)
+    else:
+        registrar_gasto_unidade(unidade_saude_id, objeto_pai.data_emissao, valor_total - valor_anterior)
+    return valor_total
+
 def _helper_popula_choices_itens_subform(form_principal, subform_fieldlist, ata_id_para_filtro):
     item_choices = [('', '--- Selecione uma Ata Principal Primeiro ---')]
     if ata_id_para_filtro is not None:
         try: 
             id_ata_int = int(ata_id_para_filtro)
-            itens_query = ItemAta.query.filter_by(ata_id=id_ata_int).filter(ItemAta.saldo_disponivel > 0).order_by(ItemAta.descricao_item).all()
-            if itens_query:
-                item_choices = [('', '--- Selecione um Item ---')] + \
-                               [(item.id, f"{item.descricao_item} (Saldo: {item.saldo_disponivel:.2f} {item.unidade_medida or ''}, VU: R${item.valor_unitario_registrado:.2f})")
-                                for item in itens_query]
+            itens_com_saldo, ata_tem_itens = opcoes_itens_com_saldo(id_ata_int)
+            if itens_com_saldo:
+                item_choices = [('', '--- Selecione um Item ---')] + itens_com_saldo
             else:
-                if ItemAta.query.filter_by(ata_id=id_ata_int).first():
+                if ata_tem_itens:
                      item_choices = [('', 'Todos os itens desta Ata estão com saldo zero')]
                 else:
                      item_choices = [('', 'Nenhum item cadastrado para esta Ata')]
@@ -1312,14 +1820,21 @@ def _helper_popula_choices_itens_subform(form_principal, subform_fieldlist, ata_
 @login_required
 def listar_contratinhos():
     filtro = request.args.get('filtro', 'vigentes')
-    query_base = Contratinho.query
+    query_base = db.session.query(Contratinho, _contagem_por_pai(ConsumoItemContratinho.contratinho_id, Contratinho.id))\
+        .options(joinedload(Contratinho.processo), joinedload(Contratinho.ata_vinculada),
+                 joinedload(Contratinho.unidade_saude_solicitante))
     hoje = datetime.now(timezone.utc).date()
     if filtro == 'vigentes':
         query_base = query_base.filter(or_(Contratinho.data_fim_vigencia >= hoje, Contratinho.data_fim_vigencia == None))
-    todos_os_contratinhos = query_base.order_by(Contratinho.data_emissao.desc()).all()
+    todos_os_contratinhos = paginar_por_cursor(query_base,
+                                               [(Contratinho.data_emissao, True), (Contratinho.id, True)],
+                                               cursor=request.args.get('cursor'),
+                                               por_pagina=app.config['ITENS_POR_PAGINA'])
+    comentarios = carregar_comentarios([linha[0] for linha in todos_os_contratinhos.itens])
     return render_template('listar_contratinhos.html',
                            titulo_pagina="Lista de Contratinhos",
                            lista_de_contratinhos=todos_os_contratinhos,
+                           comentarios=comentarios,
                            filtro_ativo=filtro,
                            today=hoje)
 
@@ -1355,7 +1870,7 @@ def criar_contratinho():
             return redirect(url_for('listar_contratinhos'))
         except ValueError as ve:
             db.session.rollback()
-            flash(str(ve), 'danger')
+            _flash_erro_validacao(ve)
         except IntegrityError as ie: 
             db.session.rollback()
             flash(f'Erro de integridade ao salvar Contratinho: {str(ie)}', 'danger')
@@ -1403,16 +1918,9 @@ def editar_contratinho(contratinho_id):
     _helper_popula_choices_itens_subform(form, form.itens_consumidos, ata_id_atual_ou_selecionada)
     if form.validate_on_submit():
         try:
-            for consumo_antigo in ct_para_editar.itens_consumidos:
-                item_ata_antigo = db.session.get(ItemAta, consumo_antigo.item_ata_id)
-                cota_antiga = CotaUnidadeItem.query.filter_by(item_ata_id=consumo_antigo.item_ata_id, unidade_saude_id=ct_para_editar.unidade_saude_id).first()
-                if item_ata_antigo:
-                    item_ata_antigo.saldo_disponivel += consumo_antigo.quantidade_consumida
-                if cota_antiga:
-                    cota_antiga.quantidade_consumida -= consumo_antigo.quantidade_consumida
-            for consumo_antigo in list(ct_para_editar.itens_consumidos): 
-                 db.session.delete(consumo_antigo)
-            db.session.flush() 
+            ata_id_anterior = ct_para_editar.ata_id
+            unidade_saude_id_anterior = ct_para_editar.unidade_saude_id
+            data_emissao_anterior = ct_para_editar.data_emissao
             ct_para_editar.processo_id = form.processo_id.data
             ct_para_editar.numero_contratinho = form.numero_contratinho.data
             ct_para_editar.objeto = form.objeto.data
@@ -1422,8 +1930,9 @@ def editar_contratinho(contratinho_id):
             ct_para_editar.ata_id = form.ata_id.data
             ct_para_editar.unidade_saude_id = form.unidade_saude_id.data
             ct_para_editar.valor_total_manual = form.valor_total_manual.data
-            _, novo_valor_total_dos_itens = _processar_itens_consumidos_para_salvar(
-                form.itens_consumidos.data, ct_para_editar, ConsumoItemContratinho, ct_para_editar.ata_id, ct_para_editar.unidade_saude_id
+            novo_valor_total_dos_itens = _atualizar_itens_consumidos(
+                form.itens_consumidos.data, ct_para_editar, ConsumoItemContratinho,
+                ata_id_anterior, unidade_saude_id_anterior, data_emissao_anterior
             )
             ct_para_editar.valor_total_itens = novo_valor_total_dos_itens
             db.session.commit()
@@ -1432,7 +1941,7 @@ def editar_contratinho(contratinho_id):
             return redirect(url_for('listar_contratinhos'))
         except ValueError as ve:
             db.session.rollback()
-            flash(str(ve), 'danger')
+            _flash_erro_validacao(ve)
         except IntegrityError as ie:
             db.session.rollback()
             flash(f'Erro de integridade ao atualizar Contratinho: {str(ie)}', 'danger')
@@ -1450,14 +1959,7 @@ def excluir_contratinho(contratinho_id):
     ct_para_excluir = Contratinho.query.get_or_404(contratinho_id)
     try:
         ct_num = ct_para_excluir.numero_contratinho
-        for consumo in ct_para_excluir.itens_consumidos:
-            item_afetado = db.session.get(ItemAta, consumo.item_ata_id)
-            cota_afetada = CotaUnidadeItem.query.filter_by(item_ata_id=consumo.item_ata_id, unidade_saude_id=ct_para_excluir.unidade_saude_id).first()
-            if item_afetado:
-                item_afetado.saldo_disponivel += consumo.quantidade_consumida
-            if cota_afetada:
-                cota_afetada.quantidade_consumida -= consumo.quantidade_consumida
-        db.session.delete(ct_para_excluir)
+        _excluir_documentos_com_estorno('contratinho', [ct_para_excluir.id])
         db.session.commit()
         registrar_log(current_user, "EXCLUIU CONTRATINHO", f"Contratinho nº {ct_num} (ID: {contratinho_id}) foi excluído.")
         flash('Contratinho excluído com sucesso! Saldos dos itens e das cotas foram restaurados.', 'success')
@@ -1471,10 +1973,18 @@ def excluir_contratinho(contratinho_id):
 @app.route('/empenhos')
 @login_required
 def listar_empenhos():
-    todos_os_empenhos = Empenho.query.order_by(Empenho.data_emissao.desc()).all()
+    query_base = db.session.query(Empenho, _contagem_por_pai(ConsumoItemEmpenho.empenho_id, Empenho.id))\
+        .options(joinedload(Empenho.processo), joinedload(Empenho.ata_vinculada),
+                 joinedload(Empenho.unidade_saude_solicitante))
+    todos_os_empenhos = paginar_por_cursor(query_base,
+                                           [(Empenho.data_emissao, True), (Empenho.id, True)],
+                                           cursor=request.args.get('cursor'),
+                                           por_pagina=app.config['ITENS_POR_PAGINA'])
+    comentarios = carregar_comentarios([linha[0] for linha in todos_os_empenhos.itens])
     return render_template('listar_empenhos.html',
                            titulo_pagina="Lista de Empenhos",
-                           lista_de_empenhos=todos_os_empenhos)
+                           lista_de_empenhos=todos_os_empenhos,
+                           comentarios=comentarios)
 
 @app.route('/empenho/visualizar/<int:empenho_id>') 
 @login_required
@@ -1519,7 +2029,7 @@ def criar_empenho():
             return redirect(url_for('listar_empenhos'))
         except ValueError as ve:
             db.session.rollback()
-            flash(str(ve), 'danger')
+            _flash_erro_validacao(ve)
         except IntegrityError as ie:
             db.session.rollback()
             flash(f'Erro de integridade ao salvar Empenho: {str(ie)}', 'danger')
@@ -1555,28 +2065,21 @@ def editar_empenho(empenho_id):
     _helper_popula_choices_itens_subform(form, form.itens_consumidos, ata_id_atual_ou_selecionada)
     if form.validate_on_submit():
         try:
-            for consumo_antigo in emp_para_editar.itens_consumidos:
-                item_ata_antigo = db.session.get(ItemAta, consumo_antigo.item_ata_id)
-                cota_antiga = CotaUnidadeItem.query.filter_by(item_ata_id=consumo_antigo.item_ata_id, unidade_saude_id=emp_para_editar.unidade_saude_id).first()
-                if item_ata_antigo:
-                    item_ata_antigo.saldo_disponivel += consumo_antigo.quantidade_consumida
-                if cota_antiga:
-                    cota_antiga.quantidade_consumida -= consumo_antigo.quantidade_consumida
-            for consumo_antigo in list(emp_para_editar.itens_consumidos):
-                db.session.delete(consumo_antigo)
-            db.session.flush()
+            ata_id_anterior = emp_para_editar.ata_id
+            unidade_saude_id_anterior = emp_para_editar.unidade_saude_id
+            data_emissao_anterior = emp_para_editar.data_emissao
 
             emp_para_editar.processo_id = form.processo_id.data
             emp_para_editar.numero_empenho = form.numero_empenho.data
             emp_para_editar.descricao_simples = form.descricao_simples.data
             emp_para_editar.favorecido = form.favorecido.data
             emp_para_editar.data_emissao = form.data_emissao.data
-            emp_para_editar.ata_id = form.ata_id.data
+            emp_para_editar.ata_id = form.ata_id.data if form.ata_id.data else ata_id_anterior
             emp_para_editar.unidade_saude_id = form.unidade_saude_id.data
             emp_para_editar.valor_total_manual = form.valor_total_manual.data
-            id_ata_para_processar_itens = form.ata_id.data if form.ata_id.data else emp_para_editar.ata_id
-            _, novo_valor_total_dos_itens = _processar_itens_consumidos_para_salvar(
-                form.itens_consumidos.data, emp_para_editar, ConsumoItemEmpenho, id_ata_para_processar_itens, emp_para_editar.unidade_saude_id
+            novo_valor_total_dos_itens = _atualizar_itens_consumidos(
+                form.itens_consumidos.data, emp_para_editar, ConsumoItemEmpenho,
+                ata_id_anterior, unidade_saude_id_anterior, data_emissao_anterior
             )
             emp_para_editar.valor_total_itens = novo_valor_total_dos_itens
             
@@ -1586,7 +2089,7 @@ def editar_empenho(empenho_id):
             return redirect(url_for('listar_empenhos'))
         except ValueError as ve:
             db.session.rollback()
-            flash(str(ve), 'danger')
+            _flash_erro_validacao(ve)
         except IntegrityError as ie:
             db.session.rollback()
             flash(f'Erro de integridade ao atualizar Empenho: {str(ie)}', 'danger')
@@ -1604,14 +2107,7 @@ def excluir_empenho(empenho_id):
     emp_para_excluir = Empenho.query.get_or_404(empenho_id)
     try:
         emp_num = emp_para_excluir.numero_empenho
-        for consumo in emp_para_excluir.itens_consumidos:
-            item_afetado = db.session.get(ItemAta, consumo.item_ata_id)
-            cota_afetada = CotaUnidadeItem.query.filter_by(item_ata_id=consumo.item_ata_id, unidade_saude_id=emp_para_excluir.unidade_saude_id).first()
-            if item_afetado:
-                item_afetado.saldo_disponivel += consumo.quantidade_consumida
-            if cota_afetada:
-                cota_afetada.quantidade_consumida -= consumo.quantidade_consumida
-        db.session.delete(emp_para_excluir)
+        _excluir_documentos_com_estorno('empenho', [emp_para_excluir.id])
         db.session.commit()
         registrar_log(current_user, "EXCLUIU EMPENHO", f"Empenho nº {emp_num} (ID: {empenho_id}) foi excluído.")
         flash('Empenho excluído com sucesso! Saldos dos itens e das cotas foram restaurados.', 'success')
@@ -1621,6 +2117,302 @@ def excluir_empenho(empenho_id):
         app.logger.error(f"Erro ao excluir empenho {empenho_id}: {e}", exc_info=True)
     return redirect(url_for('listar_empenhos'))
 
+# --- CRIAÇÃO DE CONTRATINHOS/EMPENHOS EM LOTE (JSON) ---
+# Por tipo: (modelo, modelo de consumo, coluna do pai no consumo, entidade no
+# resumo de contagens, campo do número, campos de texto, campos de data extras).
+_DOCUMENTOS_EM_LOTE = {
+    'contratinho': (Contratinho, ConsumoItemContratinho, 'contratinho_id', 'contratinhos', 'numero_contratinho',
+                    ('objeto', 'favorecido'), ('data_fim_vigencia',)),
+    'empenho': (Empenho, ConsumoItemEmpenho, 'empenho_id', 'empenhos', 'numero_empenho',
+                ('descricao_simples', 'favorecido'), ()),
+}
+
+def _excluir_documentos_com_estorno(tipo, documento_ids):
+    """Exclui os documentos e devolve a itens e cotas tudo o que consumiram. Não faz commit.
+
+    O número de comandos é constante, qualquer que seja a quantidade de
+    documentos: um UPDATE ... FROM com as quantidades agregadas por item, outro
+    por item/unidade para as cotas, outro por unidade/mês para o consolidado de
+    gastos, um INSERT ... SELECT no livro de movimentos e DELETEs pela lista
+    de ids. Retorna os números dos documentos excluídos.
+    """
+    Modelo, ModeloConsumo, coluna_pai, entidade, campo_numero, _, _ = _DOCUMENTOS_EM_LOTE[tipo]
+    documento, consumo = Modelo.__table__, ModeloConsumo.__table__
+    encontrados = db.session.execute(
+        select(documento.c.id, documento.c[campo_numero]).where(documento.c.id.in_(documento_ids))
+    ).all()
+    if not encontrados:
+        return []
+    ids = [documento_id for documento_id, _ in encontrados]
+    do_lote = consumo.c[coluna_pai].in_(ids)
+    quantidade = func.sum(consumo.c.quantidade_consumida)
+    consumos_com_documento = consumo.join(documento, documento.c.id == consumo.c[coluna_pai])
+
+    # Saldo dos itens
+    por_item = select(consumo.c.item_ata_id, quantidade.label('quantidade'))\
+        .where(do_lote).group_by(consumo.c.item_ata_id).subquery()
+    item = ItemAta.__table__
+    novo_saldo = item.c.saldo_disponivel + por_item.c.quantidade
+    db.session.execute(update(item).where(item.c.id == por_item.c.item_ata_id).values(
+        saldo_disponivel=novo_saldo,
+        razao_saldo=case((item.c.quantidade_registrada > 0, novo_saldo / item.c.quantidade_registrada), else_=None)
+    ))
+
+    # Consumo das cotas (a unidade é a do documento)
+    por_cota = select(consumo.c.item_ata_id, documento.c.unidade_saude_id, quantidade.label('quantidade'))\
+        .select_from(consumos_com_documento).where(do_lote)\
+        .group_by(consumo.c.item_ata_id, documento.c.unidade_saude_id).subquery()
+    cota = CotaUnidadeItem.__table__
+    novo_consumo = cota.c.quantidade_consumida - por_cota.c.quantidade
+    db.session.execute(update(cota).where(
+        cota.c.item_ata_id == por_cota.c.item_ata_id, cota.c.unidade_saude_id == por_cota.c.unidade_saude_id
+    ).values(
+        quantidade_consumida=novo_consumo,
+        razao_saldo=case((cota.c.quantidade_prevista > 0,
+                          (cota.c.quantidade_prevista - novo_consumo) / cota.c.quantidade_prevista), else_=None)
+    ))
+
+    # Consolidado de gastos por unidade/mês
+    ano, mes = extract('year', documento.c.data_emissao), extract('month', documento.c.data_emissao)
+    por_mes = select(documento.c.unidade_saude_id, ano.label('ano'), mes.label('mes'),
+                     func.sum(consumo.c.valor_total_consumido_item).label('valor'))\
+        .select_from(consumos_com_documento).where(do_lote)\
+        .group_by(documento.c.unidade_saude_id, ano, mes).subquery()
+    gasto = GastoUnidadeMensal.__table__
+    db.session.execute(update(gasto).where(
+        gasto.c.unidade_saude_id == por_mes.c.unidade_saude_id, gasto.c.ano == por_mes.c.ano,
+        gasto.c.mes == por_mes.c.mes, por_mes.c.valor.isnot(None)
+    ).values(valor_total=gasto.c.valor_total - por_mes.c.valor))
+
+    # Livro de movimentos: um estorno por documento e item
+    lancar_movimentos_por_consulta('ESTORNO', select(
+        consumo.c.item_ata_id, documento.c.unidade_saude_id, quantidade, -quantidade,
+        literal(Modelo.__name__), consumo.c[coluna_pai]
+    ).select_from(consumos_com_documento).where(do_lote)
+     .group_by(consumo.c[coluna_pai], consumo.c.item_ata_id, documento.c.unidade_saude_id))
+
+    db.session.execute(delete(consumo).where(do_lote))
+    db.session.execute(delete(documento).where(documento.c.id.in_(ids)))
+
+    # Os DELETEs acima não passam pelos eventos do ORM.
+    connection = db.session.connection()
+    ajustar_resumo_contagem(connection, {entidade: -len(ids)})
+    remover_documentos_do_indice(connection, Modelo, ids)
+    remover_vencimentos_em_lote(connection, Modelo, ids)
+    return [numero for _, numero in encontrados]
+
+def _ler_data_lote(valor):
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(str(valor), formato)
+        except ValueError:
+            continue
+    raise ValueError(valor)
+
+def _ler_documento_lote(dados, campo_numero, campos_texto, campos_data):
+    """Converte um documento do JSON em (cabeçalho, linhas de consumo, erros)."""
+    if not isinstance(dados, dict):
+        return None, [], ["O documento deve ser um objeto JSON."]
+    erros = []
+    cabecalho = {campo_numero: str(dados.get(campo_numero) or '').strip()}
+    if not cabecalho[campo_numero]:
+        erros.append(f"O campo '{campo_numero}' é obrigatório.")
+    for campo in campos_texto:
+        cabecalho[campo] = dados.get(campo) or None
+
+    for campo in ('ata_id', 'unidade_saude_id', 'processo_id'):
+        cabecalho[campo] = None
+        if dados.get(campo) in (None, ''):
+            if campo != 'processo_id':
+                erros.append(f"O campo '{campo}' é obrigatório.")
+            continue
+        try:
+            cabecalho[campo] = int(dados[campo])
+        except (TypeError, ValueError):
+            erros.append(f"O campo '{campo}' deve ser um número inteiro.")
+
+    for campo in ('data_emissao',) + campos_data:
+        cabecalho[campo] = None
+        if dados.get(campo) in (None, ''):
+            if campo == 'data_emissao':
+                erros.append("O campo 'data_emissao' é obrigatório.")
+            continue
+        try:
+            cabecalho[campo] = _ler_data_lote(dados[campo])
+        except ValueError:
+            erros.append(f"O campo '{campo}' deve ser uma data (AAAA-MM-DD ou DD/MM/AAAA).")
+
+    cabecalho['valor_total_manual'] = None
+    if dados.get('valor_total_manual') not in (None, ''):
+        try:
+            cabecalho['valor_total_manual'] = float(str(dados['valor_total_manual']).replace(',', '.'))
+        except ValueError:
+            erros.append("O campo 'valor_total_manual' deve ser numérico.")
+
+    linhas = []
+    itens = dados.get('itens') or []
+    if not isinstance(itens, list):
+        erros.append("O campo 'itens' deve ser uma lista.")
+    else:
+        try:
+            linhas = _linhas_de_consumo(itens)
+        except (TypeError, ValueError, AttributeError):
+            erros.append("Linhas de consumo inválidas: informe 'item_ata_id' e 'quantidade_consumida' numéricos.")
+    return cabecalho, linhas, erros
+
+def _criar_documentos_em_lote(tipo, documentos):
+    """Valida o lote e grava os documentos válidos numa única transação. Faz commit.
+
+    Itens, cotas, atas, unidades e processos referenciados são carregados com
+    uma consulta cada, e os saldos de cada documento são conferidos contra
+    esses valores, descontado o que os documentos anteriores do lote já
+    reservaram. Documentos, linhas de consumo, livro de movimentos, índice de
+    busca e vencimentos são gravados com INSERTs em lote; a baixa de saldo é um
+    UPDATE atômico por item e por cota. Retorna os resultados na ordem
+    recebida. Levanta ValueError, sem gravar nada, se outra operação consumir
+    o saldo entre a validação e a baixa.
+    """
+    Modelo, ModeloConsumo, coluna_pai, entidade, campo_numero, campos_texto, campos_data = _DOCUMENTOS_EM_LOTE[tipo]
+    lidos = [_ler_documento_lote(dados, campo_numero, campos_texto, campos_data) for dados in documentos]
+    cabecalhos_lidos = [cabecalho for cabecalho, _, _ in lidos if cabecalho]
+
+    def _ids(campo):
+        return {cabecalho[campo] for cabecalho in cabecalhos_lidos if cabecalho.get(campo)}
+    atas_existentes = {ata_id for (ata_id,) in db.session.query(Ata.id).filter(Ata.id.in_(_ids('ata_id')))}
+    unidades_existentes = {unidade.id for unidade in UnidadeSaude.query.filter(UnidadeSaude.id.in_(_ids('unidade_saude_id')))}
+    processos_existentes = {processo_id for (processo_id,) in
+                            db.session.query(Processo.id).filter(Processo.id.in_(_ids('processo_id')))}
+    itens_por_id, cotas = _carregar_itens_e_cotas({item_id for _, linhas, _ in lidos for item_id, _ in linhas},
+                                                  unidades_existentes)
+
+    resultados, aceitos = [], []
+    saldos_reservados = {}
+    for indice, (cabecalho, linhas, erros) in enumerate(lidos):
+        if not erros:
+            if cabecalho['ata_id'] not in atas_existentes:
+                erros.append(f"Ata ID {cabecalho['ata_id']} não encontrada.")
+            if cabecalho['unidade_saude_id'] not in unidades_existentes:
+                erros.append(f"Unidade de Saúde ID {cabecalho['unidade_saude_id']} não encontrada.")
+            if cabecalho['processo_id'] and cabecalho['processo_id'] not in processos_existentes:
+                erros.append(f"Processo ID {cabecalho['processo_id']} não encontrado.")
+        if not erros and linhas:
+            erros, _ = _validar_linhas_consumo(linhas, cabecalho['ata_id'], cabecalho['unidade_saude_id'],
+                                               itens_por_id, cotas, saldos_reservados)
+        if erros:
+            resultados.append({'indice': indice, 'status': 'rejeitado', 'erros': erros})
+            continue
+        cabecalho['valor_total_itens'] = sum((quantidade * (itens_por_id[item_id].valor_unitario_registrado or 0.0)
+                                              for item_id, quantidade in linhas), 0.0)
+        resultado = {'indice': indice, 'status': 'criado', 'numero': cabecalho[campo_numero],
+                     'valor_total_itens': cabecalho['valor_total_itens']}
+        resultados.append(resultado)
+        aceitos.append((resultado, cabecalho, linhas))
+    if not aceitos:
+        return resultados
+
+    cabecalhos = [cabecalho for _, cabecalho, _ in aceitos]
+    ids_criados = db.session.execute(
+        insert(Modelo).returning(Modelo.id, sort_by_parameter_order=True), cabecalhos
+    ).scalars().all()
+
+    linhas_consumo, movimentos = [], []
+    baixas, gastos = {}, {}
+    for documento_id, (resultado, cabecalho, linhas) in zip(ids_criados, aceitos):
+        resultado['id'] = cabecalho['id'] = documento_id
+        unidade_saude_id = cabecalho['unidade_saude_id']
+        quantidade_por_item = {}
+        for item_id, quantidade in linhas:
+            valor_unit = itens_por_id[item_id].valor_unitario_registrado or 0.0
+            linhas_consumo.append({coluna_pai: documento_id, 'item_ata_id': item_id, 'quantidade_consumida': quantidade,
+                                   'valor_unitario_no_consumo': valor_unit,
+                                   'valor_total_consumido_item': quantidade * valor_unit})
+            quantidade_por_item[item_id] = quantidade_por_item.get(item_id, 0.0) + quantidade
+        for item_id, quantidade in quantidade_por_item.items():
+            baixas[(item_id, unidade_saude_id)] = baixas.get((item_id, unidade_saude_id), 0.0) + quantidade
+            movimentos.append({'tipo': 'CONSUMO', 'item_ata_id': item_id, 'unidade_saude_id': unidade_saude_id,
+                               'delta_saldo_item': -quantidade, 'delta_consumo_cota': quantidade,
+                               'tipo_documento': Modelo.__name__, 'documento_id': documento_id})
+        data_emissao = cabecalho['data_emissao']
+        chave_gasto = (unidade_saude_id, data_emissao.year, data_emissao.month)
+        gastos[chave_gasto] = (data_emissao, gastos.get(chave_gasto, (None, 0.0))[1] + cabecalho['valor_total_itens'])
+
+    if linhas_consumo:
+        db.session.execute(insert(ModeloConsumo), linhas_consumo)
+    for (item_id, unidade_saude_id), quantidade in baixas.items():
+        _aplicar_baixa(itens_por_id[item_id], unidade_saude_id, quantidade)
+    lancar_movimentos_saldo(movimentos)
+    for (unidade_saude_id, _, _), (data_emissao, valor) in gastos.items():
+        registrar_gasto_unidade(unidade_saude_id, data_emissao, valor)
+
+    # Os INSERTs em lote não passam pelos eventos do ORM: as estruturas
+    # derivadas dos documentos são atualizadas aqui, na mesma transação.
+    connection = db.session.connection()
+    ajustar_resumo_contagem(connection, {entidade: len(cabecalhos)})
+    indexar_documentos_em_lote(connection, Modelo, cabecalhos)
+    registrar_vencimentos_em_lote(connection, Modelo, cabecalhos)
+    db.session.commit()
+    return resultados
+
+@app.route('/<any(contratinho, empenho):tipo>/lote', methods=['POST'])
+@login_required
+@role_required('admin', 'gestor')
+def criar_documentos_em_lote(tipo):
+    """Cria vários Contratinhos ou Empenhos a partir de um JSON.
+
+    Corpo: {"documentos": [{"numero_empenho": "12/2025", "data_emissao": "2025-06-30",
+    "ata_id": 1, "unidade_saude_id": 2, "itens": [{"item_ata_id": 10, "quantidade_consumida": 5}]}]}.
+    Documentos inválidos são rejeitados um a um; os válidos são gravados juntos.
+    """
+    dados = request.get_json(silent=True)
+    documentos = dados.get('documentos') if isinstance(dados, dict) else None
+    if not isinstance(documentos, list) or not documentos:
+        return jsonify({'error': "Envie um JSON com a lista 'documentos'."}), 400
+    limite = app.config['LOTE_MAXIMO_DOCUMENTOS']
+    if len(documentos) > limite:
+        return jsonify({'error': f'O lote pode ter no máximo {limite} documentos.'}), 400
+
+    try:
+        resultados = _criar_documentos_em_lote(tipo, documentos)
+    except ValueError as ve:
+        db.session.rollback()
+        return jsonify({'error': str(ve)}), 409
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Erro ao criar {tipo}s em lote: {e}", exc_info=True)
+        return jsonify({'error': 'Erro interno ao processar o lote.'}), 500
+
+    criados = [resultado for resultado in resultados if resultado['status'] == 'criado']
+    if criados:
+        numeros = ', '.join(resultado['numero'] for resultado in criados[:20])
+        if len(criados) > 20:
+            numeros += ', ...'
+        registrar_log(current_user, f"CRIOU {tipo.upper()}S EM LOTE",
+                      f"{len(criados)} {tipo}(s) criado(s) em lote (nº {numeros}; IDs {criados[0]['id']} a "
+                      f"{criados[-1]['id']}); {len(resultados) - len(criados)} rejeitado(s).")
+    return jsonify({'criados': len(criados), 'rejeitados': len(resultados) - len(criados), 'resultados': resultados})
+
+@app.route('/<any(contratinho, empenho):tipo>/excluir_lote', methods=['POST'])
+@login_required
+@role_required('admin', 'gestor')
+def excluir_documentos_em_lote(tipo):
+    destino = url_for('listar_contratinhos' if tipo == 'contratinho' else 'listar_empenhos')
+    documento_ids = request.form.getlist('documento_ids', type=int)
+    if not documento_ids:
+        flash('Selecione ao menos um documento para excluir.', 'warning')
+        return redirect(destino)
+    try:
+        numeros = _excluir_documentos_com_estorno(tipo, documento_ids)
+        db.session.commit()
+        if numeros:
+            registrar_log(current_user, f"EXCLUIU {tipo.upper()}S EM LOTE",
+                          f"{len(numeros)} {tipo}(s) excluído(s) em lote: nº {', '.join(numeros)}.")
+        flash(f'{len(numeros)} {tipo}(s) excluído(s) com sucesso! Saldos dos itens e das cotas foram restaurados.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao excluir {tipo}s em lote: {str(e)}', 'danger')
+        app.logger.error(f"Erro ao excluir {tipo}s em lote {documento_ids}: {e}", exc_info=True)
+    return redirect(destino)
+
 # --- ROTA PARA ADICIONAR COMENTÁRIOS ---
 @app.route('/comentario/adicionar/<string:doc_tipo>/<int:doc_id>', methods=['POST'])
 @login_required
@@ -1667,39 +2459,30 @@ def adicionar_comentario(doc_tipo, doc_id):
 @app.route('/api/gastos_por_unidade')
 @login_required
 def api_gastos_por_unidade():
-    gastos = {}
-
-    # Consulta para Contratinhos
-    gastos_contratinhos = db.session.query(
-        UnidadeSaude.nome_unidade,
-        func.sum(ConsumoItemContratinho.valor_total_consumido_item)
-    ).join(Contratinho, Contratinho.unidade_saude_id == UnidadeSaude.id)\
-     .join(ConsumoItemContratinho, ConsumoItemContratinho.contratinho_id == Contratinho.id)\
-     .group_by(UnidadeSaude.nome_unidade).all()
-
-    for nome, valor in gastos_contratinhos:
-        if nome:
-            gastos[nome] = gastos.get(nome, 0) + (valor or 0)
-
-    # Consulta para Empenhos
-    gastos_empenhos = db.session.query(
-        UnidadeSaude.nome_unidade,
-        func.sum(ConsumoItemEmpenho.valor_total_consumido_item)
-    ).join(Empenho, Empenho.unidade_saude_id == UnidadeSaude.id)\
-     .join(ConsumoItemEmpenho, ConsumoItemEmpenho.empenho_id == Empenho.id)\
-     .group_by(UnidadeSaude.nome_unidade).all()
-
-    for nome, valor in gastos_empenhos:
-        if nome:
-            gastos[nome] = gastos.get(nome, 0) + (valor or 0)
-
-    # Ordenar por valor (do maior para o menor)
-    sorted_gastos = sorted(gastos.items(), key=lambda item: item[1], reverse=True)
-    
-    labels = [item[0] for item in sorted_gastos]
-    data = [item[1] for item in sorted_gastos]
-
-    return jsonify({'labels': labels, 'data': data})
+    # Lê o consolidado mensal (mantido junto com os consumos) em vez de reagregar
+    # todos os itens de Contratinhos e Empenhos a cada carregamento do gráfico.
+    total_por_unidade = func.sum(GastoUnidadeMensal.valor_total)
+    query_gastos = db.session.query(UnidadeSaude.nome_unidade, total_por_unidade)\
+        .join(GastoUnidadeMensal, GastoUnidadeMensal.unidade_saude_id == UnidadeSaude.id)
+
+    ano = request.args.get('ano', type=int)
+    if ano:
+        query_gastos = query_gastos.filter(GastoUnidadeMensal.ano == ano)
+        mes = request.args.get('mes', type=int)
+        if mes:
+            query_gastos = query_gastos.filter(GastoUnidadeMensal.mes == mes)
+
+    gastos = query_gastos.group_by(UnidadeSaude.nome_unidade).order_by(total_por_unidade.desc()).all()
+    # Unidades cujos gastos foram todos estornados ficam com total zero no consolidado.
+    gastos = [(nome, valor) for nome, valor in gastos if round(valor or 0, 2)]
+
+    labels = [item[0] for item in gastos]
+    data = [item[1] for item in gastos]
+
+    resposta = jsonify({'labels': labels, 'data': data})
+    resposta.add_etag()
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta.make_conditional(request)
 
 # --- ROTAS PARA RELATÓRIOS PDF ---
 @app.route('/relatorio/atas/todas')
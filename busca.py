@@ -0,0 +1,231 @@
+# Início do arquivo completo: busca.py
+
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, event, inspect, select, text
+from sqlalchemy.orm import joinedload
+
+from models import db, Ata, ItemAta, Contrato, Contratinho, Empenho, Processo
+
+# --- ÍNDICE DE BUSCA TEXTUAL ---
+# Uma linha por documento na tabela 'indice_busca'. No SQLite ela é uma tabela
+# virtual FTS5 (ranking por bm25); no PostgreSQL é uma tabela comum com uma
+# coluna tsvector gerada e índice GIN (ranking por ts_rank). O texto é gravado
+# já normalizado (minúsculo e sem acentos) para que a busca se comporte igual
+# nos dois bancos sem depender da extensão unaccent.
+#
+# A chave de cada linha é documento_id * 8 + código do tipo, o que permite
+# regravar ou remover o documento pela chave primária (rowid no FTS5).
+
+CAMPOS_INDEXADOS = {
+    Processo: ('numero_processo', 'descricao'),
+    Ata: ('numero_ata', 'descricao'),
+    ItemAta: ('descricao_item',),
+    Contrato: ('numero_contrato', 'objeto', 'fornecedor'),
+    Contratinho: ('numero_contratinho', 'objeto', 'favorecido'),
+    Empenho: ('numero_empenho', 'descricao_simples'),
+}
+_CODIGO_TIPO = {'Processo': 1, 'Ata': 2, 'ItemAta': 3, 'Contrato': 4, 'Contratinho': 5, 'Empenho': 6}
+_MODELO_POR_TIPO = {modelo.__name__: modelo for modelo in CAMPOS_INDEXADOS}
+
+_RE_TERMO = re.compile(r'\w+', re.UNICODE)
+
+
+def _normalizar(texto):
+    sem_acentos = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in sem_acentos if not unicodedata.combining(c)).lower()
+
+
+def _chave(tipo_documento, documento_id):
+    return documento_id * 8 + _CODIGO_TIPO[tipo_documento]
+
+
+def _eh_postgresql(connection):
+    return connection.dialect.name == 'postgresql'
+
+
+def montar_conteudo(*valores):
+    return _normalizar(' '.join(str(valor) for valor in valores if valor))
+
+
+def criar_estrutura_busca(connection):
+    """Cria a tabela do índice (e o índice GIN no PostgreSQL), se ainda não existir."""
+    if _eh_postgresql(connection):
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS indice_busca ("
+            " chave BIGINT PRIMARY KEY,"
+            " tipo_documento VARCHAR(20) NOT NULL,"
+            " documento_id INTEGER NOT NULL,"
+            " conteudo TEXT NOT NULL,"
+            " vetor tsvector GENERATED ALWAYS AS (to_tsvector('simple', conteudo)) STORED)"
+        ))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_indice_busca_vetor ON indice_busca USING GIN (vetor)"))
+    else:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS indice_busca USING fts5("
+            "tipo_documento UNINDEXED, documento_id UNINDEXED, conteudo, tokenize = 'unicode61')"
+        ))
+
+
+def remover_estrutura_busca(connection):
+    connection.execute(text("DROP TABLE IF EXISTS indice_busca"))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _criar_com_metadata(target, connection, **kw):
+    criar_estrutura_busca(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _remover_com_metadata(target, connection, **kw):
+    remover_estrutura_busca(connection)
+
+
+def indexar_documento(connection, tipo_documento, documento_id, conteudo=None):
+    """Regrava a linha do documento no índice; sem conteúdo, apenas a remove."""
+    chave = _chave(tipo_documento, documento_id)
+    coluna_chave = 'chave' if _eh_postgresql(connection) else 'rowid'
+    connection.execute(text(f"DELETE FROM indice_busca WHERE {coluna_chave} = :chave"), {'chave': chave})
+    if conteudo:
+        connection.execute(
+            text(f"INSERT INTO indice_busca ({coluna_chave}, tipo_documento, documento_id, conteudo) "
+                 "VALUES (:chave, :tipo, :documento_id, :conteudo)"),
+            {'chave': chave, 'tipo': tipo_documento, 'documento_id': documento_id, 'conteudo': conteudo}
+        )
+
+
+def remover_documentos_do_indice(connection, modelo, documento_ids):
+    """Remove do índice, com um único DELETE, documentos excluídos sem passar pelo ORM."""
+    coluna_chave = 'chave' if _eh_postgresql(connection) else 'rowid'
+    chaves = [_chave(modelo.__name__, documento_id) for documento_id in documento_ids]
+    if chaves:
+        connection.execute(text(f"DELETE FROM indice_busca WHERE {coluna_chave} IN :chaves")
+                           .bindparams(bindparam('chaves', expanding=True)), {'chaves': chaves})
+
+
+def _registrar_eventos_busca(modelo, atributos):
+    tipo_documento = modelo.__name__
+
+    def _conteudo(target):
+        return montar_conteudo(*(getattr(target, nome) for nome in atributos))
+
+    @event.listens_for(modelo, 'after_insert')
+    def _inserir(mapper, connection, target):
+        indexar_documento(connection, tipo_documento, target.id, _conteudo(target))
+
+    @event.listens_for(modelo, 'after_update')
+    def _atualizar(mapper, connection, target):
+        estado = inspect(target)
+        if any(estado.attrs[nome].history.has_changes() for nome in atributos):
+            indexar_documento(connection, tipo_documento, target.id, _conteudo(target))
+
+    @event.listens_for(modelo, 'after_delete')
+    def _excluir(mapper, connection, target):
+        indexar_documento(connection, tipo_documento, target.id)
+
+for _modelo, _atributos in CAMPOS_INDEXADOS.items():
+    _registrar_eventos_busca(_modelo, _atributos)
+
+
+def indexar_documentos_em_lote(connection, modelo, documentos):
+    """Indexa documentos recém-inseridos em lote (sem eventos do ORM) com um único INSERT.
+
+    documentos é uma lista de dicts com 'id' e os campos indexados do modelo.
+    """
+    tipo_documento = modelo.__name__
+    coluna_chave = 'chave' if _eh_postgresql(connection) else 'rowid'
+    linhas = []
+    for documento in documentos:
+        conteudo = montar_conteudo(*(documento.get(nome) for nome in CAMPOS_INDEXADOS[modelo]))
+        if conteudo:
+            linhas.append({'chave': _chave(tipo_documento, documento['id']), 'tipo': tipo_documento,
+                           'documento_id': documento['id'], 'conteudo': conteudo})
+    if linhas:
+        connection.execute(
+            text(f"INSERT INTO indice_busca ({coluna_chave}, tipo_documento, documento_id, conteudo) "
+                 "VALUES (:chave, :tipo, :documento_id, :conteudo)"),
+            linhas
+        )
+
+
+def reconstruir_indice_busca(tamanho_lote=1000):
+    """Apaga e regrava todo o índice a partir das tabelas de origem. Faz commit."""
+    connection = db.session.connection()
+    criar_estrutura_busca(connection)
+    connection.execute(text("DELETE FROM indice_busca"))
+    coluna_chave = 'chave' if _eh_postgresql(connection) else 'rowid'
+    inserir = text(f"INSERT INTO indice_busca ({coluna_chave}, tipo_documento, documento_id, conteudo) "
+                   "VALUES (:chave, :tipo, :documento_id, :conteudo)")
+    totais = {}
+    for modelo, atributos in CAMPOS_INDEXADOS.items():
+        tipo_documento = modelo.__name__
+        colunas = [getattr(modelo, nome) for nome in atributos]
+        resultado = db.session.execute(select(modelo.id, *colunas).execution_options(yield_per=tamanho_lote))
+        totais[tipo_documento] = 0
+        for lote in resultado.partitions():
+            linhas = []
+            for documento_id, *valores in lote:
+                conteudo = montar_conteudo(*valores)
+                if conteudo:
+                    linhas.append({'chave': _chave(tipo_documento, documento_id), 'tipo': tipo_documento,
+                                   'documento_id': documento_id, 'conteudo': conteudo})
+            if linhas:
+                connection.execute(inserir, linhas)
+                totais[tipo_documento] += len(linhas)
+    db.session.commit()
+    return totais
+
+
+def _termos_da_consulta(consulta):
+    return _RE_TERMO.findall(_normalizar(consulta or ''))[:10]
+
+
+def buscar_documentos(consulta, pagina=1, por_pagina=20):
+    """Busca textual ranqueada. Retorna (resultados, tem_proxima).
+
+    Cada termo é buscado como prefixo e todos precisam aparecer no documento.
+    Os resultados são tuplas (tipo_documento, documento), com os documentos
+    carregados em uma consulta por tipo.
+    """
+    termos = _termos_da_consulta(consulta)
+    if not termos:
+        return [], False
+    connection = db.session.connection()
+    deslocamento = (max(pagina, 1) - 1) * por_pagina
+    if _eh_postgresql(connection):
+        sql = text(
+            "SELECT tipo_documento, documento_id FROM indice_busca, to_tsquery('simple', :consulta) consulta "
+            "WHERE vetor @@ consulta ORDER BY ts_rank(vetor, consulta) DESC, chave "
+            "LIMIT :limite OFFSET :deslocamento"
+        )
+        expressao = ' & '.join(f"{termo}:*" for termo in termos)
+    else:
+        sql = text(
+            "SELECT tipo_documento, documento_id FROM indice_busca WHERE indice_busca MATCH :consulta "
+            "ORDER BY bm25(indice_busca), rowid LIMIT :limite OFFSET :deslocamento"
+        )
+        expressao = ' '.join(f'"{termo}"*' for termo in termos)
+    linhas = connection.execute(sql, {'consulta': expressao, 'limite': por_pagina + 1,
+                                      'deslocamento': deslocamento}).all()
+    tem_proxima = len(linhas) > por_pagina
+    linhas = linhas[:por_pagina]
+
+    ids_por_tipo = {}
+    for tipo_documento, documento_id in linhas:
+        ids_por_tipo.setdefault(tipo_documento, []).append(int(documento_id))
+    documentos = {}
+    for tipo_documento, ids in ids_por_tipo.items():
+        modelo = _MODELO_POR_TIPO[tipo_documento]
+        query = modelo.query.filter(modelo.id.in_(ids))
+        if modelo is ItemAta:
+            query = query.options(joinedload(ItemAta.ata_mae))
+        for documento in query.all():
+            documentos[(tipo_documento, documento.id)] = documento
+
+    resultados = [(tipo_documento, documentos[(tipo_documento, int(documento_id))])
+                  for tipo_documento, documento_id in linhas
+                  if (tipo_documento, int(documento_id)) in documentos]
+    return resultados, tem_proxima
+
+# Fim do arquivo completo: busca.py
@@ -19,6 +19,25 @@ class Config:
     # Configurações de Alertas do Dashboard
     PERCENTUAL_SALDO_BAIXO = int(os.environ.get('PERCENTUAL_SALDO_BAIXO', 20))
     DIAS_ALERTA_PRAZO = int(os.environ.get('DIAS_ALERTA_PRAZO', 30))
+
+    # Quantidade de registros por página nas listagens (paginação por cursor)
+    ITENS_POR_PAGINA = int(os.environ.get('ITENS_POR_PAGINA', 50))
+
+    # Máximo de documentos aceitos por requisição nos endpoints de criação em lote
+    LOTE_MAXIMO_DOCUMENTOS = int(os.environ.get('LOTE_MAXIMO_DOCUMENTOS', 200))
+
+    # Linhas do CSV processadas por fatia nas importações em lote
+    IMPORTACAO_TAMANHO_LOTE = int(os.environ.get('IMPORTACAO_TAMANHO_LOTE', 2000))
+    # Importações em segundo plano: diretório onde os arquivos aguardam processamento
+    # e número de threads do pool de importação em cada processo
+    IMPORTACAO_DIRETORIO = os.environ.get('IMPORTACAO_DIRETORIO') or os.path.join(basedir, 'importacoes')
+    IMPORTACAO_WORKERS = int(os.environ.get('IMPORTACAO_WORKERS', 2))
+
+    # Configurações do Profiler de Requisições (Admin > Desempenho)
+    # A taxa de amostragem vai de 0.0 (nenhuma requisição) a 1.0 (todas).
+    PROFILER_ATIVO = os.environ.get('PROFILER_ATIVO', 'True').lower() == 'true'
+    PROFILER_TAXA_AMOSTRAGEM = float(os.environ.get('PROFILER_TAXA_AMOSTRAGEM', 1.0))
+    PROFILER_JANELA = int(os.environ.get('PROFILER_JANELA', 200))
     
     # Configuração do Banco de Dados
     # A variável de ambiente DATABASE_URL tem prioridade (usado em produção, ex: Heroku/Render).
@@ -6,6 +6,7 @@ from wtforms.fields import FieldList, FormField, FileField
 from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError, Email, EqualTo
 # O modelo Processo já estava importado
 from models import Ata, ItemAta, UnidadeSaude, ItemContrato, User, Processo
+from opcoes import opcoes_atas, opcoes_itens_ata, opcoes_itens_com_saldo, opcoes_processos, opcoes_unidades
 from wtforms import Form as WTForm_Form 
 from datetime import date
 import math
@@ -57,8 +58,7 @@ class AtaForm(FlaskForm):
     # --- MÉTODO __init__ ADICIONADO ---
     def __init__(self, *args, **kwargs):
         super(AtaForm, self).__init__(*args, **kwargs)
-        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + \
-                                   [(p.id, f"{p.numero_processo}/{p.ano}") for p in Processo.query.order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()]
+        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + opcoes_processos()
 
     def validate_data_assinatura(self, field):
         if field.data and field.data > date.today():
@@ -121,11 +121,9 @@ class ContratoForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(ContratoForm, self).__init__(*args, **kwargs)
-        self.unidade_saude_id.choices = [('', '--- Nenhuma (Geral da Secretaria) ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Nenhuma (Geral da Secretaria) ---')] + opcoes_unidades()
         # --- LINHA ADICIONADA ---
-        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + \
-                                   [(p.id, f"{p.numero_processo}/{p.ano}") for p in Processo.query.order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()]
+        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + opcoes_processos()
 
     def validate_data_assinatura_contrato(self, field):
         if field.data and field.data > date.today():
@@ -185,13 +183,10 @@ class ContratinhoForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(ContratinhoForm, self).__init__(*args, **kwargs)
-        self.ata_id.choices = [('', '--- Selecione uma Ata ---')] + \
-                              [(ata.id, f"{ata.numero_ata}/{ata.ano}") for ata in Ata.query.order_by(Ata.ano.desc(), Ata.numero_ata.desc()).all()]
-        self.unidade_saude_id.choices = [('', '--- Nenhuma Unidade ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.ata_id.choices = [('', '--- Selecione uma Ata ---')] + opcoes_atas()
+        self.unidade_saude_id.choices = [('', '--- Nenhuma Unidade ---')] + opcoes_unidades()
         # --- LINHA ADICIONADA ---
-        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + \
-                                   [(p.id, f"{p.numero_processo}/{p.ano}") for p in Processo.query.order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()]
+        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + opcoes_processos()
         
         ata_selecionada_id = None
         if self.ata_id.data is not None: 
@@ -201,13 +196,11 @@ class ContratinhoForm(FlaskForm):
             ata_selecionada_id = kwargs['obj'].ata_id
         item_choices_options = [('', '--- Selecione uma Ata Principal Primeiro ---')]
         if ata_selecionada_id is not None:
-            itens_da_ata_selecionada = ItemAta.query.filter_by(ata_id=ata_selecionada_id).filter(ItemAta.saldo_disponivel > 0).order_by(ItemAta.descricao_item).all()
+            itens_da_ata_selecionada, ata_tem_itens = opcoes_itens_com_saldo(ata_selecionada_id)
             if itens_da_ata_selecionada:
-                item_choices_options = [('', '--- Selecione um Item ---')] + \
-                                   [(item.id, f"{item.descricao_item} (Saldo: {item.saldo_disponivel:.2f} {item.unidade_medida or ''}, VU: R${item.valor_unitario_registrado:.2f})")
-                                    for item in itens_da_ata_selecionada]
+                item_choices_options = [('', '--- Selecione um Item ---')] + itens_da_ata_selecionada
             else:
-                if ItemAta.query.filter_by(ata_id=ata_selecionada_id).first():
+                if ata_tem_itens:
                     item_choices_options = [('', 'Todos os itens desta Ata estão com saldo zero')]
                 else:
                     item_choices_options = [('', 'Nenhum item cadastrado para esta Ata')]
@@ -234,13 +227,10 @@ class EmpenhoForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(EmpenhoForm, self).__init__(*args, **kwargs)
-        self.ata_id.choices = [('', '--- Selecione uma Ata ---')] + \
-                              [(ata.id, f"{ata.numero_ata}/{ata.ano}") for ata in Ata.query.order_by(Ata.ano.desc(), Ata.numero_ata.desc()).all()]
-        self.unidade_saude_id.choices = [('', '--- Nenhuma Unidade ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.ata_id.choices = [('', '--- Selecione uma Ata ---')] + opcoes_atas()
+        self.unidade_saude_id.choices = [('', '--- Nenhuma Unidade ---')] + opcoes_unidades()
         # --- LINHA ADICIONADA ---
-        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + \
-                                   [(p.id, f"{p.numero_processo}/{p.ano}") for p in Processo.query.order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()]
+        self.processo_id.choices = [('', '--- Sem Processo Vinculado ---')] + opcoes_processos()
                                    
         ata_selecionada_id = None
         if self.ata_id.data is not None:
@@ -250,13 +240,11 @@ class EmpenhoForm(FlaskForm):
             ata_selecionada_id = kwargs['obj'].ata_id
         item_choices_options = [('', '--- Selecione uma Ata Principal Primeiro ---')]
         if ata_selecionada_id is not None:
-            itens_da_ata_selecionada = ItemAta.query.filter_by(ata_id=ata_selecionada_id).filter(ItemAta.saldo_disponivel > 0).order_by(ItemAta.descricao_item).all()
+            itens_da_ata_selecionada, ata_tem_itens = opcoes_itens_com_saldo(ata_selecionada_id)
             if itens_da_ata_selecionada:
-                item_choices_options = [('', '--- Selecione um Item ---')] + \
-                                   [(item.id, f"{item.descricao_item} (Saldo: {item.saldo_disponivel:.2f} {item.unidade_medida or ''}, VU: R${item.valor_unitario_registrado:.2f})")
-                                    for item in itens_da_ata_selecionada]
+                item_choices_options = [('', '--- Selecione um Item ---')] + itens_da_ata_selecionada
             else:
-                if ItemAta.query.filter_by(ata_id=ata_selecionada_id).first():
+                if ata_tem_itens:
                     item_choices_options = [('', 'Todos os itens desta Ata estão com saldo zero')]
                 else:
                     item_choices_options = [('', 'Nenhum item cadastrado para esta Ata')]
@@ -270,8 +258,7 @@ class RelatorioContratosVigentesUnidadeForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(RelatorioContratosVigentesUnidadeForm, self).__init__(*args, **kwargs)
-        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + opcoes_unidades()
 
 class RelatorioConsumoUnidadeForm(FlaskForm):
     unidade_saude_id = SelectField('Unidade de Saúde', coerce=coerce_int_or_none, validators=[DataRequired(message="Selecione uma Unidade de Saúde.")])
@@ -281,8 +268,7 @@ class RelatorioConsumoUnidadeForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(RelatorioConsumoUnidadeForm, self).__init__(*args, **kwargs)
-        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + opcoes_unidades()
 
     def validate_data_inicio(self, field):
         if field.data and field.data > date.today():
@@ -303,11 +289,7 @@ class RelatorioConsumoPorItemForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(RelatorioConsumoPorItemForm, self).__init__(*args, **kwargs)
-        todos_os_itens_ata = ItemAta.query.join(Ata, ItemAta.ata_id == Ata.id)\
-                                        .order_by(Ata.ano.desc(), Ata.numero_ata.desc(), ItemAta.descricao_item).all()
-        self.item_ata_id.choices = [('', '--- Selecione um Item ---')] + \
-                                   [(item.id, f"{item.descricao_item} (Ata: {item.ata_mae.numero_ata}/{item.ata_mae.ano}, Saldo: {item.saldo_disponivel:.0f})")
-                                    for item in todos_os_itens_ata]
+        self.item_ata_id.choices = [('', '--- Selecione um Item ---')] + opcoes_itens_ata()
 
     def validate_data_inicio(self, field):
         if field.data and field.data > date.today():
@@ -324,6 +306,13 @@ class ImportCSVForm(FlaskForm):
     csv_file = FileField('Arquivo CSV', validators=[DataRequired(message="Por favor, selecione um arquivo.")])
     submit = SubmitField('Importar')
 
+class ImportAtasCSVForm(ImportCSVForm):
+    modo = SelectField('Itens já cadastrados', choices=[
+        ('atas', 'Incluir todas as linhas como itens novos'),
+        ('atas_atualizar', 'Atualizar quantidade e preço dos itens já cadastrados (mesma ata, descrição e lote)'),
+    ], default='atas')
+    validar = SubmitField('Somente validar')
+
 class CotaUnidadeSubForm(WTForm_Form):
     unidade_saude_id = HiddenField()
     quantidade_prevista = BrazilianFloatField('Cota', validators=[Optional(), NumberRange(min=0)])
@@ -338,8 +327,7 @@ class RelatorioPotencialDeSolicitacaoForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(RelatorioPotencialDeSolicitacaoForm, self).__init__(*args, **kwargs)
-        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Selecione uma Unidade ---')] + opcoes_unidades()
 
 class UserCreationForm(FlaskForm):
     username = StringField('Nome de Usuário', validators=[DataRequired(), Length(min=3, max=64)])
@@ -351,8 +339,7 @@ class UserCreationForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(UserCreationForm, self).__init__(*args, **kwargs)
-        self.unidade_saude_id.choices = [('', '--- Nenhuma ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Nenhuma ---')] + opcoes_unidades()
 
     def validate_username(self, username):
         user = User.query.filter_by(username=username.data).first()
@@ -370,8 +357,7 @@ class UserEditForm(FlaskForm):
     def __init__(self, original_username, *args, **kwargs):
         super(UserEditForm, self).__init__(*args, **kwargs)
         self.original_username = original_username
-        self.unidade_saude_id.choices = [('', '--- Nenhuma ---')] + \
-                                        [(u.id, u.nome_unidade) for u in UnidadeSaude.query.order_by(UnidadeSaude.nome_unidade).all()]
+        self.unidade_saude_id.choices = [('', '--- Nenhuma ---')] + opcoes_unidades()
 
     def validate_username(self, username):
         if username.data != self.original_username:
@@ -0,0 +1,788 @@
+# Início do arquivo completo: importacao.py
+
+import csv
+import io
+from datetime import datetime
+from itertools import chain, islice
+
+from sqlalchemy import insert, select, update, text, tuple_, case, bindparam
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+
+from models import (
+    db, Ata, ItemAta, UnidadeSaude, CotaUnidadeItem, get_current_time_utc, calcular_razao_saldo,
+    calcular_chave_item, normalizar_texto, lancar_movimentos_saldo, ajustar_resumo_contagem, registrar_vencimentos_em_lote,
+    marcar_tabelas_alteradas, Contrato, ItemContrato, Aditivo, recalcular_contratos_em_lote
+)
+from busca import indexar_documentos_em_lote
+
+# --- IMPORTAÇÃO DE ATAS E ITENS EM LOTE (CSV) ---
+# O arquivo é lido em fatias de tamanho_lote linhas: a memória usada depende do
+# tamanho da fatia, não do arquivo. Para cada fatia, as atas referenciadas são
+# resolvidas com uma única consulta, as atas novas e os itens são gravados com
+# INSERTs em lote (COPY no PostgreSQL) e as estruturas mantidas pelos eventos
+# do ORM (livro de movimentos, índice de busca, vencimentos, resumo de
+# contagens) são atualizadas explicitamente, na mesma transação.
+#
+# No modo atualizar_existentes, cada item é casado com o já cadastrado pela
+# chave_item (hash de ata, descrição normalizada e lote): os encontrados têm
+# quantidade e preço atualizados e o saldo corrigido pela diferença de
+# quantidade (lançada como AJUSTE), de modo que reenviar o mesmo arquivo não
+# duplica itens.
+
+COLUNAS_OBRIGATORIAS_ATAS = ('numero_ata', 'ano_ata', 'descricao_item')
+TIPOS_ITEM = [valor for valor, _ in ItemAta.TIPO_ITEM_CHOICES]
+
+COLUNAS_ITEM_COPY = ('id', 'ata_id', 'descricao_item', 'tipo_item', 'unidade_medida', 'quantidade_registrada',
+                     'saldo_disponivel', 'valor_unitario_registrado', 'lote', 'razao_saldo', 'chave_item', 'criado_em')
+
+
+class ResultadoImportacao:
+    """Totais de uma importação de atas e itens."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.atas_criadas = 0
+        self.atas_existentes = 0
+        self.itens_criados = 0
+        self.itens_atualizados = 0
+        self.itens_inalterados = 0
+
+    @property
+    def atas_processadas(self):
+        return self.atas_criadas + self.atas_existentes
+
+    def resumo(self):
+        if self.itens_atualizados or self.itens_inalterados:
+            return (f"{self.atas_processadas} ata(s), {self.itens_criados} item(ns) novo(s), "
+                    f"{self.itens_atualizados} atualizado(s) e {self.itens_inalterados} sem alteração")
+        return f"{self.atas_processadas} ata(s) e {self.itens_criados} item(ns)"
+
+
+def ler_numero(valor, padrao=0.0):
+    """Converte números no formato brasileiro ('1.234,56') ou com ponto decimal ('1234.56')."""
+    valor = (valor or '').strip()
+    if not valor:
+        return padrao
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    return float(valor)
+
+
+def ler_data(valor):
+    valor = (valor or '').strip()
+    return datetime.strptime(valor, '%d/%m/%Y') if valor else None
+
+
+def fatias(iteravel, tamanho):
+    """Divide um iterável em listas de até `tamanho` elementos, sem carregá-lo por inteiro."""
+    iterador = iter(iteravel)
+    while True:
+        fatia = list(islice(iterador, tamanho))
+        if not fatia:
+            return
+        yield fatia
+
+
+def _ler_campo(row, coluna, erros, conversor=str, mensagem=None, obrigatorio=False, padrao=None):
+    """Lê e converte uma coluna da linha; problemas vão para erros como (coluna, valor, mensagem)."""
+    valor = (row.get(coluna) or '').strip()
+    if not valor:
+        if obrigatorio:
+            erros.append((coluna, valor, "campo obrigatório"))
+        return padrao
+    try:
+        return conversor(valor)
+    except ValueError:
+        erros.append((coluna, valor, mensagem))
+        return padrao
+
+
+def _levantar_primeiro_erro(numero_linha, erros):
+    if erros:
+        coluna, valor, mensagem = erros[0]
+        raise ValueError(f"Linha {numero_linha}, coluna '{coluna}': {mensagem}" + (f" ('{valor}')." if valor else "."))
+
+
+def _validar_linha_ata(numero_linha, row):
+    """Lê uma linha do CSV de atas sem levantar exceção.
+
+    Devolve (chave da ata, dados da ata, dados do item, erros), em que erros é
+    uma lista de (coluna, valor, mensagem). Com erros, os dados podem estar
+    incompletos e não devem ser gravados.
+    """
+    erros = []
+
+    def campo(coluna, *args, **kwargs):
+        return _ler_campo(row, coluna, erros, *args, **kwargs)
+
+    numero_ata = campo('numero_ata', obrigatorio=True)
+    ano = campo('ano_ata', int, "ano inválido", obrigatorio=True)
+    dados_ata = {'numero_ata': numero_ata, 'ano': ano, 'descricao': row.get('descricao_ata'),
+                 'data_assinatura': campo('data_assinatura_ata', ler_data, "data inválida (use DD/MM/AAAA)"),
+                 'data_validade': campo('data_validade_ata', ler_data, "data inválida (use DD/MM/AAAA)")}
+
+    descricao_item = campo('descricao_item', obrigatorio=True)
+    tipo_item = campo('tipo_item', str.upper, padrao='OUTRO')
+    if tipo_item not in TIPOS_ITEM:
+        erros.append(('tipo_item', row.get('tipo_item'), f"tipo_item deve ser um de: {', '.join(TIPOS_ITEM)}"))
+    quantidade = campo('quantidade_registrada', ler_numero, "número inválido (ex.: 1500,50)", padrao=0.0)
+    valor_unitario = campo('valor_unitario_registrado', ler_numero, "número inválido (ex.: 1500,50)", padrao=0.0)
+    for coluna, numero in (('quantidade_registrada', quantidade), ('valor_unitario_registrado', valor_unitario)):
+        if numero < 0:
+            erros.append((coluna, row.get(coluna), "não pode ser negativo"))
+    dados_item = {'descricao_item': descricao_item,
+                  'tipo_item': tipo_item,
+                  'unidade_medida': row.get('unidade_medida'),
+                  'quantidade_registrada': quantidade,
+                  'saldo_disponivel': quantidade,
+                  'valor_unitario_registrado': valor_unitario,
+                  'lote': row.get('lote'),
+                  'razao_saldo': calcular_razao_saldo(quantidade, quantidade)}
+    return (numero_ata, ano), dados_ata, dados_item, erros
+
+
+def _ler_linha_ata(numero_linha, row):
+    """Como _validar_linha_ata, mas levanta ValueError no primeiro erro da linha."""
+    chave, dados_ata, dados_item, erros = _validar_linha_ata(numero_linha, row)
+    _levantar_primeiro_erro(numero_linha, erros)
+    return chave, dados_ata, dados_item
+
+
+def _eh_postgresql(connection):
+    return connection.dialect.name == 'postgresql'
+
+
+def _resolver_atas(connection, chaves, atas_por_chave):
+    """Preenche atas_por_chave com o id das atas já cadastradas, numa única consulta."""
+    tabela = Ata.__table__
+    existentes = connection.execute(
+        select(tabela.c.numero_ata, tabela.c.ano, tabela.c.id)
+        .where(tuple_(tabela.c.numero_ata, tabela.c.ano).in_(list(chaves)))
+    ).all()
+    for numero_ata, ano, ata_id in existentes:
+        atas_por_chave[(numero_ata, ano)] = ata_id
+    return len(existentes)
+
+
+def _inserir_atas(connection, atas):
+    ids = connection.execute(
+        insert(Ata.__table__).returning(Ata.__table__.c.id, sort_by_parameter_order=True),
+        [{**ata, 'criado_em': get_current_time_utc()} for ata in atas]
+    ).scalars().all()
+    for ata_id, ata in zip(ids, atas):
+        ata['id'] = ata_id
+    indexar_documentos_em_lote(connection, Ata, atas)
+    registrar_vencimentos_em_lote(connection, Ata, atas)
+
+
+def _copiar_itens(connection, itens):
+    """PostgreSQL: reserva os ids na sequência e grava os itens com COPY."""
+    ids = connection.execute(
+        text("SELECT nextval(pg_get_serial_sequence('item_ata', 'id')) FROM generate_series(1, :total)"),
+        {'total': len(itens)}
+    ).scalars().all()
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for item_id, item in zip(ids, itens):
+        item['id'] = item_id
+        escritor.writerow([item[coluna] for coluna in COLUNAS_ITEM_COPY])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY item_ata ({', '.join(COLUNAS_ITEM_COPY)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def inserir_itens_em_lote(connection, itens, usuario_id=None):
+    """Grava itens de ata (dicts) e atualiza as estruturas que os eventos do ORM manteriam.
+
+    Preenche o 'id' de cada item. O saldo inicial de cada item é lançado no
+    livro de movimentos como IMPORTACAO, em nome de usuario_id (ou do usuário
+    da requisição atual, se omitido).
+    """
+    criado_em = get_current_time_utc()
+    for item in itens:
+        item['criado_em'] = criado_em
+        item.setdefault('chave_item', calcular_chave_item(item['ata_id'], item['descricao_item'], item['lote']))
+    if _eh_postgresql(connection):
+        _copiar_itens(connection, itens)
+    else:
+        # SQLite atribui rowids crescentes na ordem dos VALUES e serializa as
+        # escritas: ordenar os ids devolvidos reproduz a ordem dos itens sem o
+        # sort_by_parameter_order, que no SQLite insere uma linha por vez.
+        ids = sorted(connection.execute(
+            insert(ItemAta.__table__).returning(ItemAta.__table__.c.id), itens
+        ).scalars().all())
+        for item_id, item in zip(ids, itens):
+            item['id'] = item_id
+    autoria = {'usuario_id': usuario_id} if usuario_id else {}
+    lancar_movimentos_saldo([{'tipo': 'IMPORTACAO', 'item_ata_id': item['id'],
+                              'delta_saldo_item': item['saldo_disponivel'],
+                              'tipo_documento': 'Ata', 'documento_id': item['ata_id'], **autoria}
+                             for item in itens if item['saldo_disponivel']], connection=connection)
+    indexar_documentos_em_lote(connection, ItemAta, itens)
+
+
+def _atualizar_itens_existentes(connection, itens, linhas, usuario_id=None, linha_por_chave=None):
+    """Atualiza, em lote, os itens que já existem (mesma chave_item).
+
+    itens e linhas (números das linhas do CSV) são paralelos. linha_por_chave
+    guarda a linha de cada chave já vista no arquivo, entre as fatias. Devolve
+    (itens novos, atualizados, inalterados). Levanta ValueError se uma chave
+    se repetir no arquivo (as duas linhas atualizariam o mesmo item) ou se a
+    nova quantidade for menor que a já consumida do item.
+    """
+    if linha_por_chave is None:
+        linha_por_chave = {}
+    por_chave = {}
+    for numero_linha, item in zip(linhas, itens):
+        chave = item['chave_item']
+        if chave in linha_por_chave:
+            raise ValueError(f"Linha {numero_linha}: item repetido: mesma ata, descrição e lote da linha "
+                             f"{linha_por_chave[chave]}.")
+        linha_por_chave[chave] = numero_linha
+        por_chave[chave] = (numero_linha, item)
+    tabela = ItemAta.__table__
+    existentes = {}
+    # Com itens duplicados de importações anteriores, atualiza o mais antigo.
+    for linha in connection.execute(
+        select(tabela.c.chave_item, tabela.c.id, tabela.c.quantidade_registrada, tabela.c.saldo_disponivel,
+               tabela.c.valor_unitario_registrado)
+        .where(tabela.c.chave_item.in_(list(por_chave))).order_by(tabela.c.id)
+    ):
+        existentes.setdefault(linha.chave_item, linha)
+
+    novos, alteracoes, movimentos, inalterados = [], [], [], 0
+    autoria = {'usuario_id': usuario_id} if usuario_id else {}
+    for chave, (numero_linha, item) in por_chave.items():
+        atual = existentes.get(chave)
+        if atual is None:
+            novos.append(item)
+            continue
+        quantidade, valor_unitario = item['quantidade_registrada'], item['valor_unitario_registrado']
+        if quantidade == atual.quantidade_registrada and valor_unitario == atual.valor_unitario_registrado:
+            inalterados += 1
+            continue
+        delta = quantidade - atual.quantidade_registrada
+        if atual.saldo_disponivel + delta < 0:
+            consumida = atual.quantidade_registrada - atual.saldo_disponivel
+            raise ValueError(f"Linha {numero_linha}: a quantidade registrada ({quantidade:g}) do item "
+                             f"'{item['descricao_item']}' é menor que a já consumida ({consumida:g}).")
+        alteracoes.append({'b_id': atual.id, 'b_quantidade': quantidade, 'b_delta': delta,
+                           'b_valor_unitario': valor_unitario})
+        if delta:
+            movimentos.append({'tipo': 'AJUSTE', 'item_ata_id': atual.id, 'delta_saldo_item': delta,
+                               'tipo_documento': 'Ata', 'documento_id': item['ata_id'], **autoria})
+
+    if alteracoes:
+        # Saldo relativo (saldo + delta), como nos consumos: um consumo gravado
+        # entre a leitura e o UPDATE não é perdido.
+        novo_saldo = tabela.c.saldo_disponivel + bindparam('b_delta')
+        connection.execute(
+            update(tabela).where(tabela.c.id == bindparam('b_id'))
+            .values(quantidade_registrada=bindparam('b_quantidade'), saldo_disponivel=novo_saldo,
+                    valor_unitario_registrado=bindparam('b_valor_unitario'),
+                    razao_saldo=case((bindparam('b_quantidade') > 0, novo_saldo / bindparam('b_quantidade')),
+                                     else_=None)),
+            alteracoes
+        )
+        lancar_movimentos_saldo(movimentos, connection=connection)
+    return novos, len(alteracoes), inalterados
+
+
+def importar_atas_csv(arquivo, tamanho_lote=2000, ao_processar_lote=None, usuario_id=None,
+                      atualizar_existentes=False):
+    """Importa atas e itens de um CSV (arquivo texto) sem fazer commit.
+
+    Atas já cadastradas (mesmo número e ano) recebem os itens; as demais são
+    criadas com os dados da primeira linha em que aparecem. Com
+    atualizar_existentes, itens já cadastrados (mesma ata, descrição e lote)
+    são atualizados em vez de duplicados. ao_processar_lote,
+    se informado, é chamado com o ResultadoImportacao parcial após cada fatia.
+    usuario_id identifica o autor no livro de movimentos quando a importação
+    roda fora de uma requisição.
+    Levanta ValueError, indicando a linha, na primeira linha inválida.
+    """
+    connection = db.session.connection()
+    resultado = ResultadoImportacao()
+    atas_por_chave, linha_por_chave = {}, {}
+    leitor = csv.DictReader(arquivo)
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS_ATAS if coluna not in (leitor.fieldnames or [])]
+    if faltando:
+        raise ValueError(f"Linha 1: coluna(s) obrigatória(s) ausente(s) no cabeçalho: {', '.join(faltando)}.")
+    for fatia in fatias(enumerate(leitor, start=2), tamanho_lote):
+        linhas = [numero_linha for numero_linha, _ in fatia]
+        lidas = [_ler_linha_ata(numero_linha, row) for numero_linha, row in fatia]
+
+        novas = {}
+        desconhecidas = {chave for chave, _, _ in lidas if chave not in atas_por_chave}
+        if desconhecidas:
+            resultado.atas_existentes += _resolver_atas(connection, desconhecidas, atas_por_chave)
+            for chave, dados_ata, _ in lidas:
+                if chave not in atas_por_chave:
+                    novas.setdefault(chave, dados_ata)
+        if novas:
+            _inserir_atas(connection, list(novas.values()))
+            for chave, dados_ata in novas.items():
+                atas_por_chave[chave] = dados_ata['id']
+
+        itens = [{**dados_item, 'ata_id': atas_por_chave[chave]} for chave, _, dados_item in lidas]
+        if atualizar_existentes:
+            for item in itens:
+                item['chave_item'] = calcular_chave_item(item['ata_id'], item['descricao_item'], item['lote'])
+            itens, atualizados, inalterados = _atualizar_itens_existentes(connection, itens, linhas, usuario_id,
+                                                                         linha_por_chave)
+            resultado.itens_atualizados += atualizados
+            resultado.itens_inalterados += inalterados
+        if itens:
+            inserir_itens_em_lote(connection, itens, usuario_id)
+        ajustar_resumo_contagem(connection, {'atas': len(novas), 'itens_ata': len(itens)})
+
+        resultado.linhas += len(lidas)
+        resultado.atas_criadas += len(novas)
+        resultado.itens_criados += len(itens)
+        if ao_processar_lote:
+            ao_processar_lote(resultado)
+
+    marcar_tabelas_alteradas(['ata', 'item_ata'])
+    return resultado
+
+
+
+class ResultadoValidacao:
+    """Resultado da validação (sem gravação) de um CSV de atas."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.atas_novas = 0
+        self.atas_existentes = 0
+        self.erros = []
+        self.avisos = []
+
+    @property
+    def valido(self):
+        return not self.erros
+
+    @property
+    def linhas_com_erro(self):
+        return len({linha for linha, _, _, _ in self.erros if linha > 1})
+
+    def adicionar_erro(self, linha, coluna, valor, mensagem):
+        self.erros.append((linha, coluna, valor or '', mensagem))
+
+    def adicionar_aviso(self, linha, coluna, valor, mensagem):
+        self.avisos.append((linha, coluna, valor or '', mensagem))
+
+    def escrever_erros(self, destino):
+        escritor = csv.writer(destino)
+        escritor.writerow(['linha', 'coluna', 'valor', 'erro'])
+        escritor.writerows(sorted(self.erros, key=lambda erro: erro[0]))
+
+
+def validar_atas_csv(arquivo, modo='atas'):
+    """Confere o CSV de atas inteiro, numa passada, sem gravar nada.
+
+    Além das conversões de cada linha (colunas obrigatórias, datas, números no
+    formato brasileiro, tipo_item), aponta itens repetidos no arquivo (mesma
+    ata, descrição e lote) e atas cujo número já está cadastrado com outro ano.
+    O item repetido é erro no modo 'atas_atualizar', em que a linha identifica
+    o item a atualizar, e só um aviso no modo 'atas', que cadastra cada linha
+    como um item novo. As atas referenciadas são consultadas em lote, ao final
+    da leitura.
+    """
+    resultado = ResultadoValidacao()
+    leitor = csv.DictReader(arquivo)
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS_ATAS if coluna not in (leitor.fieldnames or [])]
+    for coluna in faltando:
+        resultado.adicionar_erro(1, coluna, '', "coluna obrigatória ausente no cabeçalho")
+    if faltando:
+        return resultado
+
+    primeira_linha_da_ata, ano_por_numero, primeira_linha_do_item = {}, {}, {}
+    for numero_linha, row in enumerate(leitor, start=2):
+        resultado.linhas += 1
+        chave, _, dados_item, erros = _validar_linha_ata(numero_linha, row)
+        numero_ata, ano = chave
+        if numero_ata and ano is not None:
+            if numero_ata in ano_por_numero and ano_por_numero[numero_ata] != ano:
+                erros.append(('ano_ata', row.get('ano_ata'),
+                              f"a ata {numero_ata} aparece com o ano {ano_por_numero[numero_ata]} em outra linha"))
+            else:
+                ano_por_numero[numero_ata] = ano
+                primeira_linha_da_ata.setdefault(chave, numero_linha)
+            if dados_item['descricao_item']:
+                chave_item = (chave, normalizar_texto(dados_item['descricao_item']), normalizar_texto(dados_item['lote']))
+                if chave_item in primeira_linha_do_item:
+                    mensagem = f"item repetido: mesma ata, descrição e lote da linha {primeira_linha_do_item[chave_item]}"
+                    if modo == 'atas_atualizar':
+                        erros.append(('descricao_item', dados_item['descricao_item'], mensagem))
+                    else:
+                        resultado.adicionar_aviso(numero_linha, 'descricao_item', dados_item['descricao_item'],
+                                                  f"{mensagem}; será cadastrado como outro item")
+                else:
+                    primeira_linha_do_item[chave_item] = numero_linha
+        for coluna, valor, mensagem in erros:
+            resultado.adicionar_erro(numero_linha, coluna, valor, mensagem)
+
+    # numero_ata é único na tabela: uma ata com o mesmo número e outro ano não pode ser criada.
+    cadastradas = {}
+    for numeros in fatias(ano_por_numero, 500):
+        cadastradas.update(db.session.query(Ata.numero_ata, Ata.ano).filter(Ata.numero_ata.in_(numeros)).all())
+    for (numero_ata, ano), numero_linha in primeira_linha_da_ata.items():
+        if numero_ata not in cadastradas:
+            resultado.atas_novas += 1
+        elif cadastradas[numero_ata] == ano:
+            resultado.atas_existentes += 1
+        else:
+            resultado.adicionar_erro(numero_linha, 'ano_ata', str(ano),
+                                     f"a ata {numero_ata} já está cadastrada com o ano {cadastradas[numero_ata]}")
+    return resultado
+
+
+# --- MATRIZ DE COTAS (ITEM × UNIDADE) ---
+# Uma linha por item da ata (coluna item_ata_id) e uma coluna por unidade de
+# saúde (cabeçalho = nome da unidade) com a quantidade prevista. Célula vazia
+# mantém a cota atual. A matriz inteira é validada antes de qualquer gravação:
+# com erro em qualquer célula, nada é gravado.
+
+COLUNAS_FIXAS_COTAS = ('item_ata_id', 'descricao_item')
+TOLERANCIA_COTAS = 1e-6
+# Linhas por comando de upsert (o INSERT leva 5 parâmetros por linha).
+LOTE_UPSERT_COTAS = 500
+
+
+class ResultadoCotas:
+    """Totais e erros de uma importação de matriz de cotas."""
+
+    def __init__(self):
+        self.itens = 0
+        self.cotas_criadas = 0
+        self.cotas_atualizadas = 0
+        self.erros = []
+
+    def resumo(self):
+        return (f"{self.cotas_criadas} cota(s) criada(s) e {self.cotas_atualizadas} atualizada(s) "
+                f"em {self.itens} item(ns)")
+
+
+def leitor_csv(arquivo, **kwargs):
+    """csv.reader com o delimitador (',' ou ';') detectado pela linha de cabeçalho."""
+    cabecalho = arquivo.readline()
+    delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    return csv.reader(chain([cabecalho], arquivo), delimiter=delimitador, **kwargs)
+
+
+def exportar_matriz_cotas(ata_id, destino):
+    """Escreve em destino (arquivo texto) a matriz de cotas atual da ata, pronta para edição."""
+    unidades = db.session.query(UnidadeSaude.id, UnidadeSaude.nome_unidade).order_by(UnidadeSaude.nome_unidade).all()
+    itens = db.session.query(ItemAta.id, ItemAta.descricao_item)\
+        .filter(ItemAta.ata_id == ata_id).order_by(ItemAta.descricao_item).all()
+    previstas = dict(((item_id, unidade_id), prevista) for item_id, unidade_id, prevista in
+                     db.session.query(CotaUnidadeItem.item_ata_id, CotaUnidadeItem.unidade_saude_id,
+                                      CotaUnidadeItem.quantidade_prevista)
+                     .join(ItemAta, CotaUnidadeItem.item_ata_id == ItemAta.id).filter(ItemAta.ata_id == ata_id))
+    escritor = csv.writer(destino)
+    escritor.writerow([*COLUNAS_FIXAS_COTAS, *(nome for _, nome in unidades)])
+    for item_id, descricao in itens:
+        escritor.writerow([item_id, descricao, *(
+            f"{previstas[(item_id, unidade_id)]:g}".replace('.', ',') if (item_id, unidade_id) in previstas else ''
+            for unidade_id, _ in unidades)])
+
+
+def _upsert_cotas(connection, linhas):
+    """INSERT ... ON CONFLICT (item_ata_id, unidade_saude_id) DO UPDATE (restrição _item_unidade_uc)."""
+    tabela = CotaUnidadeItem.__table__
+    comando = (insert_postgresql if connection.dialect.name == 'postgresql' else insert_sqlite)(tabela).values(linhas)
+    nova_prevista = comando.excluded.quantidade_prevista
+    connection.execute(comando.on_conflict_do_update(
+        index_elements=[tabela.c.item_ata_id, tabela.c.unidade_saude_id],
+        set_={'quantidade_prevista': nova_prevista,
+              'razao_saldo': case((nova_prevista > 0, (nova_prevista - tabela.c.quantidade_consumida) / nova_prevista),
+                                  else_=None)}
+    ))
+
+
+def importar_matriz_cotas(arquivo, ata_id, usuario_id=None):
+    """Valida a matriz de cotas da ata e grava as alterações com um único upsert, sem commit.
+
+    Os itens da ata, as unidades e as cotas atuais são lidos com uma consulta
+    cada; a soma das cotas de cada item (as atuais ajustadas pelas células do
+    arquivo) é conferida contra quantidade_registrada, e nenhuma cota pode
+    ficar abaixo do que a unidade já consumiu. Se houver erros, eles
+    ficam em ResultadoCotas.erros e nada é gravado.
+    """
+    resultado = ResultadoCotas()
+    leitor = leitor_csv(arquivo)
+    cabecalho = next(leitor, None)
+    if not cabecalho or 'item_ata_id' not in [coluna.strip() for coluna in cabecalho]:
+        resultado.erros.append("Linha 1: o cabeçalho deve conter a coluna 'item_ata_id' e uma coluna por unidade de saúde.")
+        return resultado
+
+    unidades_por_nome = {normalizar_texto(nome): unidade_id for unidade_id, nome in
+                         db.session.query(UnidadeSaude.id, UnidadeSaude.nome_unidade)}
+    coluna_item, colunas_unidade = None, []
+    for indice, coluna in enumerate(cabecalho):
+        nome = coluna.strip()
+        if nome == 'item_ata_id':
+            coluna_item = indice
+        elif nome in COLUNAS_FIXAS_COTAS or not nome:
+            continue
+        elif normalizar_texto(nome) in unidades_por_nome:
+            colunas_unidade.append((indice, nome, unidades_por_nome[normalizar_texto(nome)]))
+        else:
+            resultado.erros.append(f"Linha 1: a coluna '{nome}' não corresponde a nenhuma unidade de saúde.")
+
+    itens = {item_id: (descricao, quantidade_registrada) for item_id, descricao, quantidade_registrada in
+             db.session.query(ItemAta.id, ItemAta.descricao_item, ItemAta.quantidade_registrada)
+             .filter(ItemAta.ata_id == ata_id)}
+    cotas_atuais = {(item_id, unidade_id): (prevista, consumida or 0.0)
+                    for item_id, unidade_id, prevista, consumida in
+                    db.session.query(CotaUnidadeItem.item_ata_id, CotaUnidadeItem.unidade_saude_id,
+                                     CotaUnidadeItem.quantidade_prevista, CotaUnidadeItem.quantidade_consumida)
+                    .join(ItemAta, CotaUnidadeItem.item_ata_id == ItemAta.id)
+                    .filter(ItemAta.ata_id == ata_id).with_for_update(of=CotaUnidadeItem)}
+
+    matriz, linha_do_item = {}, {}
+    for numero_linha, row in enumerate(leitor, start=2):
+        if not any(celula.strip() for celula in row):
+            continue
+        valor_item = row[coluna_item].strip() if coluna_item < len(row) else ''
+        try:
+            item_id = int(valor_item)
+        except ValueError:
+            resultado.erros.append(f"Linha {numero_linha}: item_ata_id '{valor_item}' inválido.")
+            continue
+        if item_id not in itens:
+            resultado.erros.append(f"Linha {numero_linha}: o item {item_id} não pertence a esta ata.")
+            continue
+        if item_id in linha_do_item:
+            resultado.erros.append(f"Linha {numero_linha}: o item {item_id} já aparece na linha {linha_do_item[item_id]}.")
+            continue
+        linha_do_item[item_id] = numero_linha
+        for indice, nome_unidade, unidade_id in colunas_unidade:
+            celula = row[indice].strip() if indice < len(row) else ''
+            if not celula:
+                continue
+            try:
+                quantidade = ler_numero(celula)
+            except ValueError:
+                resultado.erros.append(f"Linha {numero_linha}, unidade '{nome_unidade}': '{celula}' não é um número.")
+                continue
+            if quantidade < 0:
+                resultado.erros.append(f"Linha {numero_linha}, unidade '{nome_unidade}': a cota não pode ser negativa.")
+                continue
+            _, consumida = cotas_atuais.get((item_id, unidade_id), (0.0, 0.0))
+            if quantidade < consumida - TOLERANCIA_COTAS:
+                resultado.erros.append(f"Linha {numero_linha}, unidade '{nome_unidade}': a cota ({quantidade:g}) "
+                                       f"não pode ser menor que a quantidade já consumida ({consumida:g}).")
+                continue
+            matriz[(item_id, unidade_id)] = quantidade
+
+    # Soma final de cada item = cotas atuais + diferença de cada célula informada.
+    somas = {}
+    for (item_id, _), (prevista, _) in cotas_atuais.items():
+        somas[item_id] = somas.get(item_id, 0.0) + prevista
+    for chave, quantidade in matriz.items():
+        somas[chave[0]] = somas.get(chave[0], 0.0) + quantidade - cotas_atuais.get(chave, (0.0, 0.0))[0]
+    for item_id in sorted(linha_do_item, key=linha_do_item.get):
+        descricao, quantidade_registrada = itens[item_id]
+        if somas.get(item_id, 0.0) > (quantidade_registrada or 0.0) + TOLERANCIA_COTAS:
+            resultado.erros.append(
+                f"Linha {linha_do_item[item_id]}: a soma das cotas do item '{descricao}' ({somas[item_id]:g}) "
+                f"ultrapassa a quantidade registrada ({quantidade_registrada:g}).")
+    if resultado.erros:
+        return resultado
+
+    linhas, movimentos = [], []
+    autoria = {'usuario_id': usuario_id} if usuario_id else {}
+    for (item_id, unidade_id), quantidade in matriz.items():
+        atual, _ = cotas_atuais.get((item_id, unidade_id), (None, None))
+        if (atual is None and quantidade == 0) or atual == quantidade:
+            continue
+        linhas.append({'item_ata_id': item_id, 'unidade_saude_id': unidade_id, 'quantidade_prevista': quantidade,
+                       'quantidade_consumida': 0.0, 'razao_saldo': calcular_razao_saldo(quantidade, quantidade)})
+        movimentos.append({'tipo': 'COTA', 'item_ata_id': item_id, 'unidade_saude_id': unidade_id,
+                           'delta_cota_prevista': quantidade - (atual or 0.0), **autoria})
+        if atual is None:
+            resultado.cotas_criadas += 1
+        else:
+            resultado.cotas_atualizadas += 1
+    resultado.itens = len({linha['item_ata_id'] for linha in linhas})
+    if linhas:
+        connection = db.session.connection()
+        for fatia in fatias(linhas, LOTE_UPSERT_COTAS):
+            _upsert_cotas(connection, fatia)
+        lancar_movimentos_saldo(movimentos, connection=connection)
+    return resultado
+
+
+# --- IMPORTAÇÃO DE CONTRATOS, ITENS E ADITIVOS (CSV) ---
+# Um único arquivo em que a coluna registro indica o tipo de cada linha:
+# CONTRATO, ITEM ou ADITIVO. Itens e aditivos apontam o contrato pelo
+# numero_contrato, criado por uma linha CONTRATO anterior do arquivo ou já
+# cadastrado. Tudo é gravado com INSERTs em lote, fatia a fatia; o valor global
+# e o fim de vigência dos contratos tocados são recalculados uma única vez, ao
+# final (recalcular_contratos_em_lote), e não a cada aditivo.
+
+COLUNAS_OBRIGATORIAS_CONTRATOS = ('registro', 'numero_contrato')
+TIPOS_REGISTRO_CONTRATO = ('CONTRATO', 'ITEM', 'ADITIVO')
+
+
+class ResultadoImportacaoContratos:
+    """Totais de uma importação de contratos, itens e aditivos."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.contratos_criados = 0
+        self.itens_criados = 0
+        self.aditivos_criados = 0
+        self.contratos_recalculados = 0
+
+    def resumo(self):
+        return f"{self.contratos_criados} contrato(s), {self.itens_criados} item(ns) e {self.aditivos_criados} aditivo(s)"
+
+
+def _validar_linha_contrato(numero_linha, row):
+    """Lê uma linha do CSV de contratos sem levantar exceção.
+
+    Devolve (registro, numero_contrato, dados, erros); dados traz as colunas
+    da tabela correspondente ao registro.
+    """
+    erros = []
+
+    def campo(coluna, *args, **kwargs):
+        return _ler_campo(row, coluna, erros, *args, **kwargs)
+
+    data_invalida, numero_invalido = "data inválida (use DD/MM/AAAA)", "número inválido (ex.: 1500,50)"
+    registro = campo('registro', str.upper, obrigatorio=True)
+    numero_contrato = campo('numero_contrato', obrigatorio=True)
+    dados = {}
+    if registro == 'CONTRATO':
+        data_fim = campo('data_fim_vigencia', ler_data, data_invalida)
+        dados = {'numero_contrato': numero_contrato,
+                 'objeto': campo('objeto', obrigatorio=True),
+                 'fornecedor': campo('fornecedor'),
+                 'data_assinatura_contrato': campo('data_assinatura', ler_data, data_invalida),
+                 'data_inicio_vigencia': campo('data_inicio_vigencia', ler_data, data_invalida),
+                 'data_fim_vigencia_original': data_fim,
+                 'data_fim_vigencia': data_fim,
+                 'valor_global_contrato': 0.0}
+    elif registro == 'ITEM':
+        quantidade = campo('quantidade', ler_numero, numero_invalido, obrigatorio=True)
+        valor_unitario = campo('valor_unitario', ler_numero, numero_invalido, obrigatorio=True)
+        if quantidade is not None and quantidade <= 0:
+            erros.append(('quantidade', row.get('quantidade'), "deve ser positiva"))
+        if valor_unitario is not None and valor_unitario < 0:
+            erros.append(('valor_unitario', row.get('valor_unitario'), "não pode ser negativo"))
+        dados = {'descricao': campo('descricao', obrigatorio=True),
+                 'unidade_medida': campo('unidade_medida'),
+                 'quantidade': quantidade,
+                 'valor_unitario': valor_unitario,
+                 'valor_total_item': quantidade * valor_unitario if not erros else None}
+    elif registro == 'ADITIVO':
+        dados = {'numero_aditivo': campo('numero_aditivo', obrigatorio=True),
+                 'data_assinatura': campo('data_assinatura', ler_data, data_invalida, obrigatorio=True),
+                 'objeto': campo('objeto'),
+                 'valor_acrescimo': campo('valor_acrescimo', ler_numero, numero_invalido, padrao=0.0),
+                 'prazo_adicional_dias': campo('prazo_adicional_dias', int, "número de dias inválido", padrao=0),
+                 'nova_data_fim_vigencia': campo('nova_data_fim_vigencia', ler_data, data_invalida)}
+    elif registro:
+        erros.append(('registro', row.get('registro'), f"registro deve ser um de: {', '.join(TIPOS_REGISTRO_CONTRATO)}"))
+    return registro, numero_contrato, dados, erros
+
+
+def _ler_linha_contrato(numero_linha, row):
+    registro, numero_contrato, dados, erros = _validar_linha_contrato(numero_linha, row)
+    _levantar_primeiro_erro(numero_linha, erros)
+    return registro, numero_contrato, dados
+
+
+def _resolver_contratos(connection, numeros, contratos_por_numero):
+    tabela = Contrato.__table__
+    for numero_contrato, contrato_id in connection.execute(
+        select(tabela.c.numero_contrato, tabela.c.id).where(tabela.c.numero_contrato.in_(list(numeros)))
+    ):
+        contratos_por_numero[numero_contrato] = contrato_id
+
+
+def _inserir_contratos(connection, contratos):
+    ids = connection.execute(
+        insert(Contrato.__table__).returning(Contrato.__table__.c.id, sort_by_parameter_order=True),
+        [{**contrato, 'criado_em': get_current_time_utc()} for contrato in contratos]
+    ).scalars().all()
+    for contrato_id, contrato in zip(ids, contratos):
+        contrato['id'] = contrato_id
+    indexar_documentos_em_lote(connection, Contrato, contratos)
+    registrar_vencimentos_em_lote(connection, Contrato, contratos)
+
+
+def importar_contratos_csv(arquivo, tamanho_lote=2000, ao_processar_lote=None, usuario_id=None):
+    """Importa contratos, itens de contrato e aditivos de um CSV (arquivo texto) sem fazer commit.
+
+    Uma linha CONTRATO com número já cadastrado (ou repetido no arquivo) é
+    erro; itens e aditivos podem apontar contratos já cadastrados. Ao final, o
+    valor global e o fim de vigência de todos os contratos tocados são
+    recalculados de uma vez. usuario_id é aceito pela interface comum dos
+    importadores. Levanta ValueError, indicando a linha, na primeira linha inválida.
+    """
+    connection = db.session.connection()
+    resultado = ResultadoImportacaoContratos()
+    contratos_por_numero, tocados = {}, set()
+    leitor = csv.DictReader(arquivo)
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS_CONTRATOS if coluna not in (leitor.fieldnames or [])]
+    if faltando:
+        raise ValueError(f"Linha 1: coluna(s) obrigatória(s) ausente(s) no cabeçalho: {', '.join(faltando)}.")
+    for fatia in fatias(enumerate(leitor, start=2), tamanho_lote):
+        lidas = [(numero_linha, *_ler_linha_contrato(numero_linha, row)) for numero_linha, row in fatia]
+
+        desconhecidos = {numero for _, _, numero, _ in lidas if numero not in contratos_por_numero}
+        if desconhecidos:
+            _resolver_contratos(connection, desconhecidos, contratos_por_numero)
+        novos = {}
+        for numero_linha, registro, numero, dados in lidas:
+            if registro == 'CONTRATO':
+                if numero in contratos_por_numero or numero in novos:
+                    raise ValueError(f"Linha {numero_linha}, coluna 'numero_contrato': o contrato {numero} "
+                                     "já está cadastrado ou aparece em outra linha CONTRATO do arquivo.")
+                novos[numero] = dados
+        if novos:
+            _inserir_contratos(connection, list(novos.values()))
+            for numero, dados in novos.items():
+                contratos_por_numero[numero] = dados['id']
+                tocados.add(dados['id'])
+
+        itens, aditivos = [], []
+        criado_em = get_current_time_utc()
+        for numero_linha, registro, numero, dados in lidas:
+            if registro == 'CONTRATO':
+                continue
+            contrato_id = contratos_por_numero.get(numero)
+            if contrato_id is None:
+                raise ValueError(f"Linha {numero_linha}, coluna 'numero_contrato': contrato {numero} não encontrado. "
+                                 "Cadastre-o ou inclua a linha CONTRATO antes dos itens e aditivos.")
+            if registro == 'ITEM':
+                itens.append({**dados, 'contrato_id': contrato_id})
+            else:
+                aditivos.append({**dados, 'contrato_id': contrato_id, 'criado_em': criado_em})
+            tocados.add(contrato_id)
+        if itens:
+            connection.execute(insert(ItemContrato.__table__), itens)
+        if aditivos:
+            connection.execute(insert(Aditivo.__table__), aditivos)
+        ajustar_resumo_contagem(connection, {'contratos': len(novos)})
+
+        resultado.linhas += len(lidas)
+        resultado.contratos_criados += len(novos)
+        resultado.itens_criados += len(itens)
+        resultado.aditivos_criados += len(aditivos)
+        if ao_processar_lote:
+            ao_processar_lote(resultado)
+
+    recalcular_contratos_em_lote(connection, tocados)
+    resultado.contratos_recalculados = len(tocados)
+    marcar_tabelas_alteradas(['contrato', 'item_contrato', 'aditivo'])
+    return resultado
+
+# Fim do arquivo completo: importacao.py
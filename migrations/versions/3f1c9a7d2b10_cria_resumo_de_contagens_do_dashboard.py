@@ -0,0 +1,40 @@
+"""Cria resumo de contagens do dashboard
+
+Revision ID: 3f1c9a7d2b10
+Revises: aeb55a311386
+Create Date: 2026-10-18 09:12:04.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b10'
+down_revision = 'aeb55a311386'
+branch_labels = None
+depends_on = None
+
+ENTIDADES = {
+    'processos': 'processo',
+    'atas': 'ata',
+    'contratos': 'contrato',
+    'contratinhos': 'contratinho',
+    'empenhos': 'empenho',
+    'itens_ata': 'item_ata',
+    'unidades_saude': 'unidade_saude',
+}
+
+
+def upgrade():
+    op.create_table('resumo_contagem',
+    sa.Column('entidade', sa.String(length=50), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('entidade')
+    )
+    for entidade, tabela in ENTIDADES.items():
+        op.execute(f"INSERT INTO resumo_contagem (entidade, total) SELECT '{entidade}', COUNT(*) FROM {tabela}")
+
+
+def downgrade():
+    op.drop_table('resumo_contagem')
@@ -0,0 +1,57 @@
+"""Cria consolidado de gastos por unidade e mes
+
+Revision ID: 5a90b3e8d4c1
+Revises: c4d7e19a5f32
+Create Date: 2026-10-18 13:45:12.907214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a90b3e8d4c1'
+down_revision = 'c4d7e19a5f32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('gasto_unidade_mensal',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('unidade_saude_id', sa.Integer(), nullable=False),
+    sa.Column('ano', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Integer(), nullable=False),
+    sa.Column('valor_total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['unidade_saude_id'], ['unidade_saude.id'], name='fk_gasto_unidade_saude_id', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('unidade_saude_id', 'ano', 'mes', name='_gasto_unidade_mes_uc')
+    )
+
+    # Carga inicial a partir dos consumos já registrados.
+    gasto = sa.table('gasto_unidade_mensal',
+                     sa.column('unidade_saude_id'), sa.column('ano'), sa.column('mes'), sa.column('valor_total'))
+    consumos = []
+    for documento, consumo, fk in (('contratinho', 'consumo_item_contratinho', 'contratinho_id'),
+                                   ('empenho', 'consumo_item_empenho', 'empenho_id')):
+        doc = sa.table(documento, sa.column('id'), sa.column('unidade_saude_id'), sa.column('data_emissao'))
+        item = sa.table(consumo, sa.column(fk), sa.column('valor_total_consumido_item'))
+        consumos.append(
+            sa.select(
+                doc.c.unidade_saude_id.label('unidade_saude_id'),
+                sa.extract('year', doc.c.data_emissao).label('ano'),
+                sa.extract('month', doc.c.data_emissao).label('mes'),
+                item.c.valor_total_consumido_item.label('valor')
+            ).select_from(item.join(doc, item.c[fk] == doc.c.id))
+             .where(doc.c.unidade_saude_id.isnot(None), item.c.valor_total_consumido_item.isnot(None))
+        )
+    todos = sa.union_all(*consumos).subquery()
+    op.execute(gasto.insert().from_select(
+        ['unidade_saude_id', 'ano', 'mes', 'valor_total'],
+        sa.select(todos.c.unidade_saude_id, todos.c.ano, todos.c.mes, sa.func.sum(todos.c.valor))
+          .group_by(todos.c.unidade_saude_id, todos.c.ano, todos.c.mes)
+    ))
+
+
+def downgrade():
+    op.drop_table('gasto_unidade_mensal')
@@ -0,0 +1,45 @@
+"""Adiciona razao de saldo indexada em item_ata e cota_unidade_item
+
+Revision ID: 8b2e4d61c0a7
+Revises: 3f1c9a7d2b10
+Create Date: 2026-10-18 10:03:51.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d61c0a7'
+down_revision = '3f1c9a7d2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item_ata', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('razao_saldo', sa.Float(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_item_ata_razao_saldo'), ['razao_saldo'], unique=False)
+
+    with op.batch_alter_table('cota_unidade_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('razao_saldo', sa.Float(), nullable=True))
+        batch_op.create_index('ix_cota_unidade_item_unidade_razao_saldo', ['unidade_saude_id', 'razao_saldo'], unique=False)
+
+    op.execute(
+        "UPDATE item_ata SET razao_saldo = saldo_disponivel / quantidade_registrada "
+        "WHERE quantidade_registrada > 0"
+    )
+    op.execute(
+        "UPDATE cota_unidade_item SET razao_saldo = (quantidade_prevista - quantidade_consumida) / quantidade_prevista "
+        "WHERE quantidade_prevista > 0"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('cota_unidade_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_cota_unidade_item_unidade_razao_saldo')
+        batch_op.drop_column('razao_saldo')
+
+    with op.batch_alter_table('item_ata', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_item_ata_razao_saldo'))
+        batch_op.drop_column('razao_saldo')
@@ -0,0 +1,78 @@
+"""Cria o livro de movimentos de saldo e os snapshots de saldo
+
+Revision ID: a83c5f1e7d26
+Revises: f4a9d2e6b815
+Create Date: 2026-10-18 14:22:40.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83c5f1e7d26'
+down_revision = 'f4a9d2e6b815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('movimento_saldo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('criado_em', sa.DateTime(), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('item_ata_id', sa.Integer(), nullable=False),
+        sa.Column('unidade_saude_id', sa.Integer(), nullable=True),
+        sa.Column('delta_saldo_item', sa.Float(), nullable=False),
+        sa.Column('delta_consumo_cota', sa.Float(), nullable=False),
+        sa.Column('delta_cota_prevista', sa.Float(), nullable=False),
+        sa.Column('tipo_documento', sa.String(length=20), nullable=True),
+        sa.Column('documento_id', sa.Integer(), nullable=True),
+        sa.Column('usuario_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('movimento_saldo', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_movimento_saldo_criado_em'), ['criado_em'], unique=False)
+        batch_op.create_index('ix_movimento_saldo_item_criado_em', ['item_ata_id', 'criado_em'], unique=False)
+        batch_op.create_index('ix_movimento_saldo_documento', ['tipo_documento', 'documento_id'], unique=False)
+
+    op.create_table('snapshot_saldo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('data_corte', sa.DateTime(), nullable=False),
+        sa.Column('item_ata_id', sa.Integer(), nullable=False),
+        sa.Column('unidade_saude_id', sa.Integer(), nullable=True),
+        sa.Column('saldo_item', sa.Float(), nullable=False),
+        sa.Column('consumo_cota', sa.Float(), nullable=False),
+        sa.Column('cota_prevista', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('snapshot_saldo', schema=None) as batch_op:
+        batch_op.create_index('ix_snapshot_saldo_corte_item', ['data_corte', 'item_ata_id'], unique=False)
+
+    # Abertura do livro: o saldo atual de cada item e de cada cota vira o
+    # primeiro movimento, para que o livro já some os saldos existentes.
+    op.execute(
+        "INSERT INTO movimento_saldo (criado_em, tipo, item_ata_id, unidade_saude_id, delta_saldo_item,"
+        " delta_consumo_cota, delta_cota_prevista, tipo_documento, documento_id)"
+        " SELECT CURRENT_TIMESTAMP, 'ABERTURA', id, NULL, saldo_disponivel, 0, 0, 'Ata', ata_id"
+        " FROM item_ata WHERE saldo_disponivel <> 0"
+    )
+    op.execute(
+        "INSERT INTO movimento_saldo (criado_em, tipo, item_ata_id, unidade_saude_id, delta_saldo_item,"
+        " delta_consumo_cota, delta_cota_prevista)"
+        " SELECT CURRENT_TIMESTAMP, 'ABERTURA', item_ata_id, unidade_saude_id, 0, quantidade_consumida, quantidade_prevista"
+        " FROM cota_unidade_item WHERE quantidade_consumida <> 0 OR quantidade_prevista <> 0"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('snapshot_saldo', schema=None) as batch_op:
+        batch_op.drop_index('ix_snapshot_saldo_corte_item')
+
+    op.drop_table('snapshot_saldo')
+    with op.batch_alter_table('movimento_saldo', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimento_saldo_documento')
+        batch_op.drop_index('ix_movimento_saldo_item_criado_em')
+        batch_op.drop_index(batch_op.f('ix_movimento_saldo_criado_em'))
+
+    op.drop_table('movimento_saldo')
@@ -0,0 +1,32 @@
+"""Adiciona indices em item_ata_id nas tabelas de consumo
+
+Revision ID: b5e2c7d94f13
+Revises: a83c5f1e7d26
+Create Date: 2026-10-18 15:02:11.904372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e2c7d94f13'
+down_revision = 'a83c5f1e7d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('consumo_item_contratinho', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_consumo_item_contratinho_item_ata_id'), ['item_ata_id'], unique=False)
+
+    with op.batch_alter_table('consumo_item_empenho', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_consumo_item_empenho_item_ata_id'), ['item_ata_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('consumo_item_empenho', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_consumo_item_empenho_item_ata_id'))
+
+    with op.batch_alter_table('consumo_item_contratinho', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_consumo_item_contratinho_item_ata_id'))
@@ -0,0 +1,54 @@
+"""Cria tabela unificada de vencimentos
+
+Revision ID: c4d7e19a5f32
+Revises: 8b2e4d61c0a7
+Create Date: 2026-10-18 11:27:40.650391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e19a5f32'
+down_revision = '8b2e4d61c0a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('vencimento',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo_documento', sa.String(length=20), nullable=False),
+    sa.Column('documento_id', sa.Integer(), nullable=False),
+    sa.Column('rotulo', sa.String(length=150), nullable=False),
+    sa.Column('descricao', sa.String(length=255), nullable=True),
+    sa.Column('data_vencimento', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tipo_documento', 'documento_id', name='_vencimento_documento_uc')
+    )
+    with op.batch_alter_table('vencimento', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vencimento_data_vencimento'), ['data_vencimento'], unique=False)
+
+    op.execute(
+        "INSERT INTO vencimento (tipo_documento, documento_id, rotulo, descricao, data_vencimento) "
+        "SELECT 'Ata', id, numero_ata || '/' || CAST(ano AS VARCHAR(10)), SUBSTR(descricao, 1, 255), data_validade "
+        "FROM ata WHERE data_validade IS NOT NULL"
+    )
+    op.execute(
+        "INSERT INTO vencimento (tipo_documento, documento_id, rotulo, descricao, data_vencimento) "
+        "SELECT 'Contrato', id, numero_contrato, SUBSTR(objeto, 1, 255), data_fim_vigencia "
+        "FROM contrato WHERE data_fim_vigencia IS NOT NULL"
+    )
+    op.execute(
+        "INSERT INTO vencimento (tipo_documento, documento_id, rotulo, descricao, data_vencimento) "
+        "SELECT 'Contratinho', id, numero_contratinho, SUBSTR(objeto, 1, 255), data_fim_vigencia "
+        "FROM contratinho WHERE data_fim_vigencia IS NOT NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('vencimento', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vencimento_data_vencimento'))
+
+    op.drop_table('vencimento')
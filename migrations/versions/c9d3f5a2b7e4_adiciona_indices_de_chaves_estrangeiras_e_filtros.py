@@ -0,0 +1,47 @@
+"""Adiciona indices de chaves estrangeiras e dos filtros dos relatorios
+
+Revision ID: c9d3f5a2b7e4
+Revises: b5e2c7d94f13
+Create Date: 2026-10-18 15:31:48.120694
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9d3f5a2b7e4'
+down_revision = 'b5e2c7d94f13'
+branch_labels = None
+depends_on = None
+
+
+# (nome, tabela, colunas). Os de chave estrangeira seguem o padrão ix_<tabela>_<coluna>
+# de index=True; os compostos atendem aos filtros dos relatórios por unidade.
+INDICES = [
+    ('ix_item_ata_ata_descricao', 'item_ata', ['ata_id', 'descricao_item']),
+    ('ix_consumo_item_contratinho_contratinho_id', 'consumo_item_contratinho', ['contratinho_id']),
+    ('ix_consumo_item_empenho_empenho_id', 'consumo_item_empenho', ['empenho_id']),
+    ('ix_contratinho_ata_id', 'contratinho', ['ata_id']),
+    ('ix_contratinho_processo_id', 'contratinho', ['processo_id']),
+    ('ix_contratinho_unidade_emissao', 'contratinho', ['unidade_saude_id', 'data_emissao']),
+    ('ix_contratinho_unidade_fim_vigencia', 'contratinho', ['unidade_saude_id', 'data_fim_vigencia']),
+    ('ix_empenho_ata_id', 'empenho', ['ata_id']),
+    ('ix_empenho_processo_id', 'empenho', ['processo_id']),
+    ('ix_empenho_unidade_emissao', 'empenho', ['unidade_saude_id', 'data_emissao']),
+    ('ix_contrato_processo_id', 'contrato', ['processo_id']),
+    ('ix_contrato_unidade_fim_vigencia', 'contrato', ['unidade_saude_id', 'data_fim_vigencia']),
+    ('ix_ata_processo_id', 'ata', ['processo_id']),
+    ('ix_item_contrato_contrato_id', 'item_contrato', ['contrato_id']),
+    ('ix_aditivo_contrato_id', 'aditivo', ['contrato_id']),
+]
+
+
+def upgrade():
+    for nome, tabela, colunas in INDICES:
+        op.create_index(nome, tabela, colunas, unique=False)
+
+
+def downgrade():
+    for nome, tabela, _ in reversed(INDICES):
+        op.drop_index(nome, table_name=tabela)
@@ -0,0 +1,40 @@
+"""Adiciona indices compostos para a paginacao por cursor das listagens
+
+Revision ID: d2f6a8c1e937
+Revises: 5a90b3e8d4c1
+Create Date: 2026-10-18 11:42:07.318254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6a8c1e937'
+down_revision = '5a90b3e8d4c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_processo_listagem', 'processo', ['ano', 'numero_processo', 'id'], unique=False)
+    op.create_index('ix_ata_listagem', 'ata', ['ano', 'numero_ata', 'id'], unique=False)
+    op.create_index('ix_contratinho_listagem', 'contratinho', ['data_emissao', 'id'], unique=False)
+    op.create_index('ix_empenho_listagem', 'empenho', ['data_emissao', 'id'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # A listagem ordena por data_assinatura_contrato DESC NULLS LAST; no PostgreSQL
+        # o índice precisa declarar a mesma posição dos nulos para ser percorrido em ordem.
+        op.create_index('ix_contrato_listagem', 'contrato',
+                        [sa.text('data_assinatura_contrato DESC NULLS LAST'), sa.text('numero_contrato DESC'), sa.text('id DESC')],
+                        unique=False)
+    else:
+        op.create_index('ix_contrato_listagem', 'contrato', ['data_assinatura_contrato', 'numero_contrato', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_contrato_listagem', table_name='contrato')
+    op.drop_index('ix_empenho_listagem', table_name='empenho')
+    op.drop_index('ix_contratinho_listagem', table_name='contratinho')
+    op.drop_index('ix_ata_listagem', table_name='ata')
+    op.drop_index('ix_processo_listagem', table_name='processo')
@@ -0,0 +1,24 @@
+"""Adiciona indice composto de comentarios por documento
+
+Revision ID: d8a1e6c3f095
+Revises: c9d3f5a2b7e4
+Create Date: 2026-10-18 16:04:27.553180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a1e6c3f095'
+down_revision = 'c9d3f5a2b7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_comentario_documento', 'comentario', ['commentable_type', 'commentable_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comentario_documento', table_name='comentario')
@@ -0,0 +1,46 @@
+"""Cria importacao_job para as importacoes CSV em segundo plano
+
+Revision ID: e2b7c4d9a618
+Revises: d8a1e6c3f095
+Create Date: 2026-10-18 16:48:03.271945
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c4d9a618'
+down_revision = 'd8a1e6c3f095'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('importacao_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=30), nullable=False),
+        sa.Column('nome_arquivo', sa.String(length=255), nullable=False),
+        sa.Column('caminho_arquivo', sa.String(length=500), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('linhas_processadas', sa.Integer(), nullable=False),
+        sa.Column('resumo', sa.Text(), nullable=True),
+        sa.Column('erros', sa.Text(), nullable=True),
+        sa.Column('usuario_id', sa.Integer(), nullable=False),
+        sa.Column('criado_em', sa.DateTime(), nullable=False),
+        sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+        sa.Column('concluido_em', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['usuario_id'], ['user.id'], name='fk_importacao_job_usuario_id'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('importacao_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_importacao_job_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_importacao_job_usuario_id'), ['usuario_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('importacao_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_importacao_job_usuario_id'))
+        batch_op.drop_index(batch_op.f('ix_importacao_job_status'))
+
+    op.drop_table('importacao_job')
@@ -0,0 +1,87 @@
+"""Cria indice de busca textual (FTS5 no SQLite, tsvector/GIN no PostgreSQL)
+
+Revision ID: e71b3c9d5a24
+Revises: d2f6a8c1e937
+Create Date: 2026-10-18 12:20:44.905163
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e71b3c9d5a24'
+down_revision = 'd2f6a8c1e937'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE = 1000
+
+# Mesmas regras de busca.py (campos, chave e normalização), copiadas para que
+# a migração não dependa do código da aplicação.
+CAMPOS_INDEXADOS = {
+    'processo': ('Processo', 1, ('numero_processo', 'descricao')),
+    'ata': ('Ata', 2, ('numero_ata', 'descricao')),
+    'item_ata': ('ItemAta', 3, ('descricao_item',)),
+    'contrato': ('Contrato', 4, ('numero_contrato', 'objeto', 'fornecedor')),
+    'contratinho': ('Contratinho', 5, ('numero_contratinho', 'objeto', 'favorecido')),
+    'empenho': ('Empenho', 6, ('numero_empenho', 'descricao_simples')),
+}
+
+
+def _montar_conteudo(valores):
+    texto = unicodedata.normalize('NFKD', ' '.join(str(valor) for valor in valores if valor))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def _popular_indice(conexao, coluna_chave):
+    inserir = sa.text(f"INSERT INTO indice_busca ({coluna_chave}, tipo_documento, documento_id, conteudo) "
+                      "VALUES (:chave, :tipo, :documento_id, :conteudo)")
+    for nome_tabela, (tipo_documento, codigo_tipo, campos) in CAMPOS_INDEXADOS.items():
+        tabela = sa.table(nome_tabela, sa.column('id', sa.Integer), *(sa.column(campo) for campo in campos))
+        ultimo_id = 0
+        while True:
+            linhas = conexao.execute(
+                sa.select(tabela.c.id, *(tabela.c[campo] for campo in campos))
+                .where(tabela.c.id > ultimo_id).order_by(tabela.c.id).limit(TAMANHO_LOTE)
+            ).all()
+            if not linhas:
+                break
+            documentos = []
+            for documento_id, *valores in linhas:
+                conteudo = _montar_conteudo(valores)
+                if conteudo:
+                    documentos.append({'chave': documento_id * 8 + codigo_tipo, 'tipo': tipo_documento,
+                                       'documento_id': documento_id, 'conteudo': conteudo})
+            if documentos:
+                conexao.execute(inserir, documentos)
+            ultimo_id = linhas[-1][0]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE TABLE IF NOT EXISTS indice_busca ("
+            " chave BIGINT PRIMARY KEY,"
+            " tipo_documento VARCHAR(20) NOT NULL,"
+            " documento_id INTEGER NOT NULL,"
+            " conteudo TEXT NOT NULL,"
+            " vetor tsvector GENERATED ALWAYS AS (to_tsvector('simple', conteudo)) STORED)"
+        )
+        op.execute("CREATE INDEX IF NOT EXISTS ix_indice_busca_vetor ON indice_busca USING GIN (vetor)")
+    else:
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS indice_busca USING fts5("
+            "tipo_documento UNINDEXED, documento_id UNINDEXED, conteudo, tokenize = 'unicode61')"
+        )
+
+    # Preenche o índice com os documentos já existentes; 'flask rebuild-busca'
+    # continua disponível para regravá-lo do zero.
+    conexao = op.get_bind()
+    _popular_indice(conexao, 'chave' if conexao.dialect.name == 'postgresql' else 'rowid')
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS indice_busca")
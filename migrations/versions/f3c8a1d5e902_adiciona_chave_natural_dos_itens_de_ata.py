@@ -0,0 +1,64 @@
+"""Adiciona chave_item (hash de ata, descrição e lote) aos itens de ata
+
+Revision ID: f3c8a1d5e902
+Revises: e2b7c4d9a618
+Create Date: 2026-10-18 17:35:12.604118
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a1d5e902'
+down_revision = 'e2b7c4d9a618'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE = 1000
+
+
+def _normalizar(texto):
+    return ' '.join((texto or '').split()).casefold()
+
+
+def _chave_item(ata_id, descricao_item, lote):
+    # Mesma regra de models.calcular_chave_item, copiada para que a migração
+    # não dependa do código da aplicação.
+    texto = '\x1f'.join((str(ata_id), _normalizar(descricao_item), _normalizar(lote)))
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('item_ata', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('chave_item', sa.String(length=40), nullable=True))
+
+    # Preenche os itens existentes em lotes, ordenados por id.
+    conexao = op.get_bind()
+    item_ata = sa.table('item_ata', sa.column('id', sa.Integer), sa.column('ata_id', sa.Integer),
+                        sa.column('descricao_item', sa.String), sa.column('lote', sa.String),
+                        sa.column('chave_item', sa.String))
+    atualizar = sa.update(item_ata).where(item_ata.c.id == sa.bindparam('b_id'))\
+        .values(chave_item=sa.bindparam('b_chave'))
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(item_ata.c.id, item_ata.c.ata_id, item_ata.c.descricao_item, item_ata.c.lote)
+            .where(item_ata.c.id > ultimo_id).order_by(item_ata.c.id).limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            break
+        conexao.execute(atualizar, [{'b_id': item_id, 'b_chave': _chave_item(ata_id, descricao_item, lote)}
+                                    for item_id, ata_id, descricao_item, lote in linhas])
+        ultimo_id = linhas[-1][0]
+
+    with op.batch_alter_table('item_ata', schema=None) as batch_op:
+        batch_op.create_index('ix_item_ata_chave_item', ['chave_item'], unique=False, postgresql_using='hash')
+
+
+def downgrade():
+    with op.batch_alter_table('item_ata', schema=None) as batch_op:
+        batch_op.drop_index('ix_item_ata_chave_item')
+        batch_op.drop_column('chave_item')
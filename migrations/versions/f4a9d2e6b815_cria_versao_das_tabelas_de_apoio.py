@@ -0,0 +1,34 @@
+"""Cria versao_tabela para invalidar o cache das listas de escolha
+
+Revision ID: f4a9d2e6b815
+Revises: e71b3c9d5a24
+Create Date: 2026-10-18 13:05:12.664031
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9d2e6b815'
+down_revision = 'e71b3c9d5a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    versao_tabela = op.create_table('versao_tabela',
+        sa.Column('tabela', sa.String(length=50), nullable=False),
+        sa.Column('versao', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('tabela')
+    )
+    op.bulk_insert(versao_tabela, [
+        {'tabela': 'ata', 'versao': 0},
+        {'tabela': 'item_ata', 'versao': 0},
+        {'tabela': 'processo', 'versao': 0},
+        {'tabela': 'unidade_saude', 'versao': 0},
+    ])
+
+
+def downgrade():
+    op.drop_table('versao_tabela')
@@ -1,10 +1,16 @@
 # Início do arquivo completo: models.py
 
+import hashlib
+
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import UniqueConstraint, inspect
-from datetime import datetime, timezone
+from sqlalchemy import UniqueConstraint, inspect, event, update, insert, delete, func, case, select, union_all, literal, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, column_property, object_session, joinedload
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from flask import g, has_request_context
 
 db = SQLAlchemy()
 
@@ -27,7 +33,11 @@ class Processo(db.Model):
     empenhos = db.relationship('Empenho', back_populates='processo', lazy='dynamic')
 
     # Garante que a combinação de número e ano do processo seja única
-    __table_args__ = (UniqueConstraint('numero_processo', 'ano', name='_processo_numero_ano_uc'),)
+    __table_args__ = (
+        UniqueConstraint('numero_processo', 'ano', name='_processo_numero_ano_uc'),
+        # Índices de apoio à paginação por cursor das listagens (mesma ordem do ORDER BY)
+        db.Index('ix_processo_listagem', 'ano', 'numero_processo', 'id'),
+    )
 
     def __repr__(self):
         return f'<Processo {self.numero_processo}/{self.ano}>'
@@ -40,10 +50,11 @@ class Commentable:
     @property
     def comments(self):
         # Encontra todos os comentários onde o tipo e o id correspondem a este objeto.
+        # O autor vem no mesmo SELECT; use .all() uma vez em vez de .count() + iteração.
         return Comentario.query.filter_by(
             commentable_type=self.__class__.__name__,
             commentable_id=self.id
-        ).order_by(Comentario.timestamp.asc())
+        ).options(joinedload(Comentario.author)).order_by(Comentario.timestamp.asc())
 
 # === MODELO DE USUÁRIO ===
 class User(UserMixin, db.Model):
@@ -78,12 +89,13 @@ class Ata(db.Model, Commentable): # Adicionado 'Commentable'
     criado_em = db.Column(db.DateTime, default=get_current_time_utc)
     
     # --- CAMPO ADICIONADO ---
-    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True)
+    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True, index=True)
     processo = db.relationship('Processo', back_populates='atas')
     
     contratinhos = db.relationship('Contratinho', backref='ata_vinculada', lazy=True, cascade="all, delete-orphan")
     empenhos = db.relationship('Empenho', backref='ata_vinculada', lazy=True, cascade="all, delete-orphan")
     itens_ata = db.relationship('ItemAta', backref='ata_mae', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (db.Index('ix_ata_listagem', 'ano', 'numero_ata', 'id'),)
     def __repr__(self):
         return f'<Ata {self.numero_ata}/{self.ano}>'
 
@@ -93,7 +105,8 @@ class ItemAta(db.Model):
     descricao_item = db.Column(db.String(255), nullable=False)
     unidade_medida = db.Column(db.String(50), nullable=True)
     quantidade_registrada = db.Column(db.Float, nullable=False, default=0.0)
-    saldo_disponivel = db.Column(db.Float, nullable=False, default=0.0)
+    # active_history: o valor anterior é carregado ao alterar, para o livro de movimentos.
+    saldo_disponivel = column_property(db.Column(db.Float, nullable=False, default=0.0), active_history=True)
     valor_unitario_registrado = db.Column(db.Float, nullable=True)
     lote = db.Column(db.String(100), nullable=True)
     TIPO_ITEM_CHOICES = [
@@ -106,9 +119,18 @@ class ItemAta(db.Model):
     tipo_item = db.Column(db.String(50), nullable=False, default='OUTRO')
     ata_id = db.Column(db.Integer, db.ForeignKey('ata.id', name='fk_itemata_ata_id'), nullable=False)
     criado_em = db.Column(db.DateTime, default=get_current_time_utc)
+    # Razão saldo_disponivel / quantidade_registrada, mantida a cada alteração de saldo
+    # para que o alerta de saldo baixo use o índice em vez de varrer a tabela.
+    razao_saldo = db.Column(db.Float, nullable=True, index=True)
+    # Hash de (ata, descrição normalizada, lote): chave natural usada para casar
+    # os itens de um CSV reimportado com os já cadastrados.
+    chave_item = db.Column(db.String(40), nullable=True)
     consumos_contratinho_itens = db.relationship('ConsumoItemContratinho', backref='item_ata_consumido', lazy='dynamic', cascade="all, delete-orphan")
     consumos_empenho_itens = db.relationship('ConsumoItemEmpenho', backref='item_ata_consumido', lazy='dynamic', cascade="all, delete-orphan")
     cotas = db.relationship('CotaUnidadeItem', backref='item_ata', lazy='dynamic', cascade="all, delete-orphan")
+    # Itens de uma ata, já na ordem de exibição (detalhes da ata, formulários de consumo).
+    __table_args__ = (db.Index('ix_item_ata_ata_descricao', 'ata_id', 'descricao_item'),
+                      db.Index('ix_item_ata_chave_item', 'chave_item', postgresql_using='hash'))
     def __repr__(self):
         return f'<ItemAta id={self.id} desc={self.descricao_item} saldo={self.saldo_disponivel}>'
 
@@ -126,19 +148,23 @@ class Contrato(db.Model, Commentable): # Adicionado 'Commentable'
     criado_em = db.Column(db.DateTime, default=get_current_time_utc)
     
     # --- CAMPO ADICIONADO ---
-    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True)
+    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True, index=True)
     processo = db.relationship('Processo', back_populates='contratos')
     
     unidade_saude_id = db.Column(db.Integer, db.ForeignKey('unidade_saude.id', name='fk_contrato_unidade_saude_id'), nullable=True)
     itens_do_contrato = db.relationship('ItemContrato', backref='contrato_pai', lazy='dynamic', cascade="all, delete-orphan")
     aditivos = db.relationship('Aditivo', backref='contrato_pai', lazy='dynamic', cascade="all, delete-orphan", order_by="Aditivo.data_assinatura")
+    __table_args__ = (
+        db.Index('ix_contrato_listagem', 'data_assinatura_contrato', 'numero_contrato', 'id'),
+        db.Index('ix_contrato_unidade_fim_vigencia', 'unidade_saude_id', 'data_fim_vigencia'),
+    )
     def __repr__(self):
         return f'<Contrato {self.numero_contrato}>'
 
 class Aditivo(db.Model, Commentable): # MODIFICADO: Adicionado ', Commentable'
     __tablename__ = 'aditivo'
     id = db.Column(db.Integer, primary_key=True)
-    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id', name='fk_aditivo_contrato_id', ondelete='CASCADE'), nullable=False)
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id', name='fk_aditivo_contrato_id', ondelete='CASCADE'), nullable=False, index=True)
     numero_aditivo = db.Column(db.String(100), nullable=False)
     data_assinatura = db.Column(db.DateTime, nullable=False)
     objeto = db.Column(db.Text, nullable=True)
@@ -183,17 +209,22 @@ class CotaUnidadeItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     item_ata_id = db.Column(db.Integer, db.ForeignKey('item_ata.id', name='fk_cota_item_ata_id', ondelete='CASCADE'), nullable=False)
     unidade_saude_id = db.Column(db.Integer, db.ForeignKey('unidade_saude.id', name='fk_cota_unidade_saude_id', ondelete='CASCADE'), nullable=False)
-    quantidade_prevista = db.Column(db.Float, nullable=False, default=0.0)
-    quantidade_consumida = db.Column(db.Float, nullable=False, default=0.0)
-    __table_args__ = (UniqueConstraint('item_ata_id', 'unidade_saude_id', name='_item_unidade_uc'),)
+    quantidade_prevista = column_property(db.Column(db.Float, nullable=False, default=0.0), active_history=True)
+    quantidade_consumida = column_property(db.Column(db.Float, nullable=False, default=0.0), active_history=True)
+    # Razão (prevista - consumida) / prevista; ver ItemAta.razao_saldo.
+    razao_saldo = db.Column(db.Float, nullable=True)
+    __table_args__ = (
+        UniqueConstraint('item_ata_id', 'unidade_saude_id', name='_item_unidade_uc'),
+        db.Index('ix_cota_unidade_item_unidade_razao_saldo', 'unidade_saude_id', 'razao_saldo'),
+    )
     def __repr__(self):
         return f'<Cota Unidade ID {self.unidade_saude_id} para Item ID {self.item_ata_id}: {self.quantidade_prevista}>'
 
 class ConsumoItemContratinho(db.Model):
     __tablename__ = 'consumo_item_contratinho'
     id = db.Column(db.Integer, primary_key=True)
-    contratinho_id = db.Column(db.Integer, db.ForeignKey('contratinho.id', name='fk_consumoitemcontratinho_contratinho_id', ondelete='CASCADE'), nullable=False)
-    item_ata_id = db.Column(db.Integer, db.ForeignKey('item_ata.id', name='fk_consumoitemcontratinho_item_ata_id', ondelete='RESTRICT'), nullable=False)
+    contratinho_id = db.Column(db.Integer, db.ForeignKey('contratinho.id', name='fk_consumoitemcontratinho_contratinho_id', ondelete='CASCADE'), nullable=False, index=True)
+    item_ata_id = db.Column(db.Integer, db.ForeignKey('item_ata.id', name='fk_consumoitemcontratinho_item_ata_id', ondelete='RESTRICT'), nullable=False, index=True)
     quantidade_consumida = db.Column(db.Float, nullable=False)
     valor_unitario_no_consumo = db.Column(db.Float, nullable=True) 
     valor_total_consumido_item = db.Column(db.Float, nullable=True) 
@@ -201,8 +232,8 @@ class ConsumoItemContratinho(db.Model):
 class ConsumoItemEmpenho(db.Model):
     __tablename__ = 'consumo_item_empenho'
     id = db.Column(db.Integer, primary_key=True)
-    empenho_id = db.Column(db.Integer, db.ForeignKey('empenho.id', name='fk_consumoitemempenho_empenho_id', ondelete='CASCADE'), nullable=False)
-    item_ata_id = db.Column(db.Integer, db.ForeignKey('item_ata.id', name='fk_consumoitemempenho_item_ata_id', ondelete='RESTRICT'), nullable=False)
+    empenho_id = db.Column(db.Integer, db.ForeignKey('empenho.id', name='fk_consumoitemempenho_empenho_id', ondelete='CASCADE'), nullable=False, index=True)
+    item_ata_id = db.Column(db.Integer, db.ForeignKey('item_ata.id', name='fk_consumoitemempenho_item_ata_id', ondelete='RESTRICT'), nullable=False, index=True)
     quantidade_consumida = db.Column(db.Float, nullable=False)
     valor_unitario_no_consumo = db.Column(db.Float, nullable=True) 
     valor_total_consumido_item = db.Column(db.Float, nullable=True) 
@@ -210,7 +241,7 @@ class ConsumoItemEmpenho(db.Model):
 class ItemContrato(db.Model):
     __tablename__ = 'item_contrato' 
     id = db.Column(db.Integer, primary_key=True)
-    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id', name='fk_itemcontrato_contrato_id', ondelete='CASCADE'), nullable=False)
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id', name='fk_itemcontrato_contrato_id', ondelete='CASCADE'), nullable=False, index=True)
     descricao = db.Column(db.String(500), nullable=False)
     unidade_medida = db.Column(db.String(50), nullable=True)
     quantidade = db.Column(db.Float, nullable=False)
@@ -230,14 +261,20 @@ class Contratinho(db.Model, Commentable): # Adicionado 'Commentable'
     criado_em = db.Column(db.DateTime, default=get_current_time_utc)
     
     # --- CAMPO ADICIONADO ---
-    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True)
+    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True, index=True)
     processo = db.relationship('Processo', back_populates='contratinhos')
     
-    ata_id = db.Column(db.Integer, db.ForeignKey('ata.id', name='fk_contratinho_ata_id'), nullable=False)
+    ata_id = db.Column(db.Integer, db.ForeignKey('ata.id', name='fk_contratinho_ata_id'), nullable=False, index=True)
     unidade_saude_id = db.Column(db.Integer, db.ForeignKey('unidade_saude.id', name='fk_contratinho_unidade_saude_id'), nullable=True)
     valor_total_itens = db.Column(db.Float, nullable=True, default=0.0)
     valor_total_manual = db.Column(db.Float, nullable=True) 
     itens_consumidos = db.relationship('ConsumoItemContratinho', backref='contratinho_pai', lazy='dynamic', cascade="all, delete-orphan")
+    # Relatórios por unidade: consumo no período (data_emissao) e vigentes (data_fim_vigencia).
+    __table_args__ = (
+        db.Index('ix_contratinho_listagem', 'data_emissao', 'id'),
+        db.Index('ix_contratinho_unidade_emissao', 'unidade_saude_id', 'data_emissao'),
+        db.Index('ix_contratinho_unidade_fim_vigencia', 'unidade_saude_id', 'data_fim_vigencia'),
+    )
     def __repr__(self):
         return f'<Contratinho {self.numero_contratinho}>'
 
@@ -251,14 +288,18 @@ class Empenho(db.Model, Commentable): # Adicionado 'Commentable'
     criado_em = db.Column(db.DateTime, default=get_current_time_utc)
     
     # --- CAMPO ADICIONADO ---
-    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True)
+    processo_id = db.Column(db.Integer, db.ForeignKey('processo.id'), nullable=True, index=True)
     processo = db.relationship('Processo', back_populates='empenhos')
     
-    ata_id = db.Column(db.Integer, db.ForeignKey('ata.id', name='fk_empenho_ata_id'), nullable=False)
+    ata_id = db.Column(db.Integer, db.ForeignKey('ata.id', name='fk_empenho_ata_id'), nullable=False, index=True)
     unidade_saude_id = db.Column(db.Integer, db.ForeignKey('unidade_saude.id', name='fk_empenho_unidade_saude_id'), nullable=True)
     valor_total_itens = db.Column(db.Float, nullable=True, default=0.0)
     valor_total_manual = db.Column(db.Float, nullable=True)
     itens_consumidos = db.relationship('ConsumoItemEmpenho', backref='empenho_pai', lazy='dynamic', cascade="all, delete-orphan")
+    __table_args__ = (
+        db.Index('ix_empenho_listagem', 'data_emissao', 'id'),
+        db.Index('ix_empenho_unidade_emissao', 'unidade_saude_id', 'data_emissao'),
+    )
     def __repr__(self):
         return f'<Empenho {self.numero_empenho}>'
 
@@ -288,8 +329,879 @@ class Comentario(db.Model):
     __mapper_args__ = {
         'polymorphic_on': commentable_type
     }
+    # Comentários de um documento, já na ordem cronológica.
+    __table_args__ = (db.Index('ix_comentario_documento', 'commentable_type', 'commentable_id', 'timestamp'),)
 
     def __repr__(self):
         return f'<Comentario {self.id} por {self.author.username}>'
 
+def carregar_comentarios(documentos):
+    """Comentários (com autor) de uma lista de documentos numa única consulta.
+
+    Aceita documentos de tipos diferentes. Devolve {(tipo, id): [comentários em
+    ordem cronológica]}; documentos sem comentário não aparecem no dicionário.
+    """
+    ids_por_tipo = {}
+    for documento in documentos:
+        ids_por_tipo.setdefault(documento.__class__.__name__, set()).add(documento.id)
+    if not ids_por_tipo:
+        return {}
+    condicoes = [db.and_(Comentario.commentable_type == tipo, Comentario.commentable_id.in_(ids))
+                 for tipo, ids in ids_por_tipo.items()]
+    comentarios = Comentario.query.filter(db.or_(*condicoes))\
+        .options(joinedload(Comentario.author))\
+        .order_by(Comentario.commentable_type, Comentario.commentable_id, Comentario.timestamp).all()
+    por_documento = {}
+    for comentario in comentarios:
+        por_documento.setdefault((comentario.commentable_type, comentario.commentable_id), []).append(comentario)
+    return por_documento
+
+# --- RAZÃO DE SALDO PARA OS ALERTAS DE SALDO BAIXO ---
+def calcular_razao_saldo(saldo, total):
+    if not total or total <= 0:
+        return None
+    return (saldo or 0.0) / total
+
+@event.listens_for(ItemAta, 'before_insert')
+@event.listens_for(ItemAta, 'before_update')
+def _atualizar_razao_saldo_item(mapper, connection, target):
+    target.razao_saldo = calcular_razao_saldo(target.saldo_disponivel, target.quantidade_registrada)
+
+@event.listens_for(CotaUnidadeItem, 'before_insert')
+@event.listens_for(CotaUnidadeItem, 'before_update')
+def _atualizar_razao_saldo_cota(mapper, connection, target):
+    saldo_cota = (target.quantidade_prevista or 0.0) - (target.quantidade_consumida or 0.0)
+    target.razao_saldo = calcular_razao_saldo(saldo_cota, target.quantidade_prevista)
+
+# --- CHAVE NATURAL DOS ITENS DE ATA ---
+def normalizar_texto(texto):
+    return ' '.join((texto or '').split()).casefold()
+
+def calcular_chave_item(ata_id, descricao_item, lote):
+    """Hash de (ata, descrição, lote), ignorando maiúsculas e espaços repetidos."""
+    texto = '\x1f'.join((str(ata_id), normalizar_texto(descricao_item), normalizar_texto(lote)))
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+@event.listens_for(ItemAta, 'before_insert')
+@event.listens_for(ItemAta, 'before_update')
+def _atualizar_chave_item(mapper, connection, target):
+    target.chave_item = calcular_chave_item(target.ata_id, target.descricao_item, target.lote)
+
+# --- AJUSTES ATÔMICOS DE SALDO ---
+# Consumos e estornos alteram saldo do item e consumo da cota com um único
+# UPDATE relativo (saldo = saldo - :q), em vez de ler o valor em Python e gravar
+# o resultado. Assim, dois workers consumindo o mesmo item não perdem
+# atualizações: o banco serializa os UPDATEs na mesma linha (no PostgreSQL a
+# condição do WHERE é reavaliada após a espera pelo lock) e a condição de saldo
+# impede que ele fique negativo. A razão de saldo é recalculada no próprio SQL.
+
+def ajustar_saldo_item(item_ata_id, delta):
+    """Soma delta ao saldo do item (negativo = consumo).
+
+    Consumos só são aplicados se ainda houver saldo suficiente no banco;
+    retorna False quando a condição não é satisfeita (ou o item não existe).
+    """
+    novo_saldo = ItemAta.saldo_disponivel + delta
+    stmt = update(ItemAta).where(ItemAta.id == item_ata_id).values(
+        saldo_disponivel=novo_saldo,
+        razao_saldo=case((ItemAta.quantidade_registrada > 0, novo_saldo / ItemAta.quantidade_registrada), else_=None)
+    )
+    if delta < 0:
+        stmt = stmt.where(ItemAta.saldo_disponivel >= -delta)
+    resultado = db.session.execute(stmt.execution_options(synchronize_session='fetch'))
+    if resultado.rowcount != 1:
+        return False
+    return True
+
+def ajustar_consumo_cota(item_ata_id, unidade_saude_id, delta):
+    """Soma delta ao consumo da cota da unidade (positivo = consumo).
+
+    Consumos só são aplicados se a cota ainda comportar a quantidade;
+    retorna False quando a condição não é satisfeita (ou a cota não existe).
+    """
+    novo_consumo = CotaUnidadeItem.quantidade_consumida + delta
+    stmt = update(CotaUnidadeItem).where(
+        CotaUnidadeItem.item_ata_id == item_ata_id,
+        CotaUnidadeItem.unidade_saude_id == unidade_saude_id
+    ).values(
+        quantidade_consumida=novo_consumo,
+        razao_saldo=case((CotaUnidadeItem.quantidade_prevista > 0,
+                          (CotaUnidadeItem.quantidade_prevista - novo_consumo) / CotaUnidadeItem.quantidade_prevista),
+                         else_=None)
+    )
+    if delta > 0:
+        stmt = stmt.where(CotaUnidadeItem.quantidade_prevista - CotaUnidadeItem.quantidade_consumida >= delta)
+    resultado = db.session.execute(stmt.execution_options(synchronize_session='fetch'))
+    if resultado.rowcount != 1:
+        return False
+    return True
+
+# --- LIVRO DE MOVIMENTOS DE SALDO ---
+# Registro só de inclusão de tudo o que altera saldo de item ou cota: entrada
+# do item (cadastro ou importação), consumo, estorno, mudança de cota, ajuste
+# manual e exclusão. Cada linha guarda os deltas com sinal, o documento de
+# origem e o usuário, e é gravada na mesma transação da alteração.
+# Os snapshots (SnapshotSaldo) guardam as somas do livro até uma data de corte;
+# o saldo em qualquer data é o snapshot anterior a ela mais os movimentos
+# desde o corte, sem reprocessar o histórico inteiro.
+# item_ata_id e unidade_saude_id não têm chave estrangeira de propósito: o
+# histórico continua existindo depois que o item ou a unidade é excluído.
+TIPOS_MOVIMENTO_SALDO = ('ABERTURA', 'ENTRADA', 'IMPORTACAO', 'CONSUMO', 'ESTORNO', 'COTA', 'AJUSTE', 'EXCLUSAO')
+
+class MovimentoSaldo(db.Model):
+    __tablename__ = 'movimento_saldo'
+    id = db.Column(db.Integer, primary_key=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=get_current_time_utc, index=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    item_ata_id = db.Column(db.Integer, nullable=False)
+    unidade_saude_id = db.Column(db.Integer, nullable=True)
+    delta_saldo_item = db.Column(db.Float, nullable=False, default=0.0)
+    delta_consumo_cota = db.Column(db.Float, nullable=False, default=0.0)
+    delta_cota_prevista = db.Column(db.Float, nullable=False, default=0.0)
+    tipo_documento = db.Column(db.String(20), nullable=True)
+    documento_id = db.Column(db.Integer, nullable=True)
+    usuario_id = db.Column(db.Integer, nullable=True)
+    __table_args__ = (
+        db.Index('ix_movimento_saldo_item_criado_em', 'item_ata_id', 'criado_em'),
+        db.Index('ix_movimento_saldo_documento', 'tipo_documento', 'documento_id'),
+    )
+
+    def __repr__(self):
+        return f'<MovimentoSaldo {self.tipo} item={self.item_ata_id} unidade={self.unidade_saude_id} saldo={self.delta_saldo_item:+}>'
+
+class SnapshotSaldo(db.Model):
+    __tablename__ = 'snapshot_saldo'
+    id = db.Column(db.Integer, primary_key=True)
+    data_corte = db.Column(db.DateTime, nullable=False)
+    item_ata_id = db.Column(db.Integer, nullable=False)
+    # Nulo: linha só com o saldo do item; preenchido: linha da cota da unidade.
+    unidade_saude_id = db.Column(db.Integer, nullable=True)
+    saldo_item = db.Column(db.Float, nullable=False, default=0.0)
+    consumo_cota = db.Column(db.Float, nullable=False, default=0.0)
+    cota_prevista = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.Index('ix_snapshot_saldo_corte_item', 'data_corte', 'item_ata_id'),)
+
+    def __repr__(self):
+        return f'<SnapshotSaldo {self.data_corte} item={self.item_ata_id} unidade={self.unidade_saude_id}>'
+
+def _referencia_documento(documento):
+    if documento is None:
+        return None, None
+    if isinstance(documento, tuple):
+        return documento
+    return type(documento).__name__, documento.id
+
+def _usuario_atual_id():
+    # Lê o usuário já carregado pelo Flask-Login sem disparar consulta (pode ser chamado durante um flush).
+    if not has_request_context():
+        return None
+    return getattr(g.get('_login_user'), 'id', None)
+
+def lancar_movimento_saldo(tipo, item_ata_id, unidade_saude_id=None, delta_saldo_item=0.0,
+                           delta_consumo_cota=0.0, delta_cota_prevista=0.0, documento=None, connection=None):
+    """Acrescenta uma linha ao livro de movimentos.
+
+    documento é o objeto de origem (Contratinho, Empenho...) ou uma tupla
+    (tipo_documento, documento_id). Sem connection, usa a da sessão atual.
+    """
+    if not (delta_saldo_item or delta_consumo_cota or delta_cota_prevista):
+        return
+    tipo_documento, documento_id = _referencia_documento(documento)
+    (connection or db.session.connection()).execute(insert(MovimentoSaldo.__table__).values(
+        criado_em=get_current_time_utc(), tipo=tipo, item_ata_id=item_ata_id, unidade_saude_id=unidade_saude_id,
+        delta_saldo_item=delta_saldo_item, delta_consumo_cota=delta_consumo_cota,
+        delta_cota_prevista=delta_cota_prevista, tipo_documento=tipo_documento,
+        documento_id=documento_id, usuario_id=_usuario_atual_id()
+    ))
+
+def lancar_movimentos_saldo(movimentos, connection=None):
+    """Versão em lote de lancar_movimento_saldo: um único INSERT para vários movimentos.
+
+    Cada movimento é um dict com 'tipo', 'item_ata_id' e, opcionalmente, os
+    demais campos de MovimentoSaldo (deltas, unidade, tipo_documento, documento_id).
+    """
+    if not movimentos:
+        return
+    padrao = {'criado_em': get_current_time_utc(), 'unidade_saude_id': None, 'delta_saldo_item': 0.0,
+              'delta_consumo_cota': 0.0, 'delta_cota_prevista': 0.0, 'tipo_documento': None,
+              'documento_id': None, 'usuario_id': _usuario_atual_id()}
+    (connection or db.session.connection()).execute(
+        insert(MovimentoSaldo.__table__), [{**padrao, **movimento} for movimento in movimentos]
+    )
+
+def lancar_movimentos_por_consulta(tipo, consulta, connection=None):
+    """Lança um movimento por linha da consulta, com um único INSERT ... SELECT.
+
+    A consulta deve trazer, nesta ordem: item_ata_id, unidade_saude_id,
+    delta_saldo_item, delta_consumo_cota, tipo_documento e documento_id.
+    """
+    origem = list(consulta.subquery().c)
+    tabela = MovimentoSaldo.__table__
+    colunas = [literal(get_current_time_utc(), tabela.c.criado_em.type), literal(tipo), *origem[:4],
+               literal(0.0), *origem[4:], literal(_usuario_atual_id(), tabela.c.usuario_id.type)]
+    (connection or db.session.connection()).execute(insert(tabela).from_select(
+        ['criado_em', 'tipo', 'item_ata_id', 'unidade_saude_id', 'delta_saldo_item', 'delta_consumo_cota',
+         'delta_cota_prevista', 'tipo_documento', 'documento_id', 'usuario_id'],
+        select(*colunas)
+    ))
+
+def lancar_movimento_consumo(item_ata_id, unidade_saude_id, quantidade, documento):
+    """Lança um consumo (quantidade positiva) ou estorno (negativa) de item e cota."""
+    lancar_movimento_saldo('CONSUMO' if quantidade > 0 else 'ESTORNO', item_ata_id, unidade_saude_id,
+                           delta_saldo_item=-quantidade, delta_consumo_cota=quantidade, documento=documento)
+
+def definir_origem_movimentos(tipo):
+    """Faz os cadastros de itens e cotas desta transação serem lançados com outro tipo (ex.: IMPORTACAO)."""
+    db.session.info['origem_movimentos'] = tipo
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _descartar_origem_movimentos(session):
+    session.info.pop('origem_movimentos', None)
+
+def _delta_atributo(estado, nome):
+    historico = estado.attrs[nome].history
+    if not historico.has_changes():
+        return 0.0
+    novo = historico.added[0] if historico.added else 0.0
+    anterior = historico.deleted[0] if historico.deleted else 0.0
+    return (novo or 0.0) - (anterior or 0.0)
+
+def _origem_movimento(target, padrao):
+    sessao = object_session(target)
+    return sessao.info.get('origem_movimentos', padrao) if sessao is not None else padrao
+
+@event.listens_for(ItemAta, 'after_insert')
+def _lancar_entrada_item(mapper, connection, target):
+    lancar_movimento_saldo(_origem_movimento(target, 'ENTRADA'), target.id,
+                           delta_saldo_item=target.saldo_disponivel or 0.0,
+                           documento=('Ata', target.ata_id), connection=connection)
+
+@event.listens_for(ItemAta, 'after_update')
+def _lancar_ajuste_item(mapper, connection, target):
+    delta = _delta_atributo(inspect(target), 'saldo_disponivel')
+    lancar_movimento_saldo('AJUSTE', target.id, delta_saldo_item=delta,
+                           documento=('Ata', target.ata_id), connection=connection)
+
+@event.listens_for(ItemAta, 'after_delete')
+def _lancar_exclusao_item(mapper, connection, target):
+    lancar_movimento_saldo('EXCLUSAO', target.id, delta_saldo_item=-(target.saldo_disponivel or 0.0),
+                           documento=('Ata', target.ata_id), connection=connection)
+
+@event.listens_for(CotaUnidadeItem, 'after_insert')
+def _lancar_cota_nova(mapper, connection, target):
+    lancar_movimento_saldo(_origem_movimento(target, 'COTA'), target.item_ata_id, target.unidade_saude_id,
+                           delta_consumo_cota=target.quantidade_consumida or 0.0,
+                           delta_cota_prevista=target.quantidade_prevista or 0.0, connection=connection)
+
+@event.listens_for(CotaUnidadeItem, 'after_update')
+def _lancar_alteracao_cota(mapper, connection, target):
+    estado = inspect(target)
+    delta_prevista = _delta_atributo(estado, 'quantidade_prevista')
+    lancar_movimento_saldo('COTA' if delta_prevista else 'AJUSTE', target.item_ata_id, target.unidade_saude_id,
+                           delta_consumo_cota=_delta_atributo(estado, 'quantidade_consumida'),
+                           delta_cota_prevista=delta_prevista, connection=connection)
+
+@event.listens_for(CotaUnidadeItem, 'after_delete')
+def _lancar_exclusao_cota(mapper, connection, target):
+    lancar_movimento_saldo('EXCLUSAO', target.item_ata_id, target.unidade_saude_id,
+                           delta_consumo_cota=-(target.quantidade_consumida or 0.0),
+                           delta_cota_prevista=-(target.quantidade_prevista or 0.0), connection=connection)
+
+def _somas_do_livro(ate=None, item_ata_ids=None):
+    """Somas (saldo, consumo, prevista) por (item, unidade) dos movimentos anteriores a `ate`.
+
+    Parte do snapshot mais recente com corte <= ate e lê só os movimentos
+    desde esse corte, pelo índice de criado_em.
+    """
+    consulta_corte = db.session.query(func.max(SnapshotSaldo.data_corte))
+    if ate is not None:
+        consulta_corte = consulta_corte.filter(SnapshotSaldo.data_corte <= ate)
+    corte = consulta_corte.scalar()
+
+    somas = {}
+    def _acumular(linhas):
+        for item_ata_id, unidade_saude_id, saldo, consumo, prevista in linhas:
+            atual = somas.setdefault((item_ata_id, unidade_saude_id), [0.0, 0.0, 0.0])
+            atual[0] += saldo or 0.0
+            atual[1] += consumo or 0.0
+            atual[2] += prevista or 0.0
+
+    if corte is not None:
+        query = db.session.query(
+            SnapshotSaldo.item_ata_id, SnapshotSaldo.unidade_saude_id,
+            SnapshotSaldo.saldo_item, SnapshotSaldo.consumo_cota, SnapshotSaldo.cota_prevista
+        ).filter(SnapshotSaldo.data_corte == corte)
+        if item_ata_ids is not None:
+            query = query.filter(SnapshotSaldo.item_ata_id.in_(item_ata_ids))
+        _acumular(query.all())
+
+    query = db.session.query(
+        MovimentoSaldo.item_ata_id, MovimentoSaldo.unidade_saude_id,
+        func.sum(MovimentoSaldo.delta_saldo_item), func.sum(MovimentoSaldo.delta_consumo_cota),
+        func.sum(MovimentoSaldo.delta_cota_prevista)
+    )
+    if corte is not None:
+        query = query.filter(MovimentoSaldo.criado_em >= corte)
+    if ate is not None:
+        query = query.filter(MovimentoSaldo.criado_em < ate)
+    if item_ata_ids is not None:
+        query = query.filter(MovimentoSaldo.item_ata_id.in_(item_ata_ids))
+    _acumular(query.group_by(MovimentoSaldo.item_ata_id, MovimentoSaldo.unidade_saude_id).all())
+    return somas
+
+def calcular_saldos(ate=None, item_ata_ids=None):
+    """Saldos segundo o livro de movimentos anteriores a `ate` (ou todos).
+
+    Retorna ({item_ata_id: saldo}, {(item_ata_id, unidade_saude_id): (prevista, consumida)}).
+    """
+    saldos_itens, cotas = {}, {}
+    for (item_ata_id, unidade_saude_id), (saldo, consumo, prevista) in _somas_do_livro(ate, item_ata_ids).items():
+        saldos_itens[item_ata_id] = saldos_itens.get(item_ata_id, 0.0) + saldo
+        if unidade_saude_id is not None:
+            cotas[(item_ata_id, unidade_saude_id)] = (prevista, consumo)
+    return saldos_itens, cotas
+
+def gerar_snapshot_saldos(margem=timedelta(minutes=10)):
+    """Grava um snapshot do livro com corte em agora - margem. Faz commit.
+
+    A margem deixa de fora movimentos de transações que ainda podem estar em
+    andamento. Retorna (data_corte, linhas gravadas), ou (None, 0) se já
+    existir snapshot com corte igual ou posterior.
+    """
+    corte = get_current_time_utc() - margem
+    ultimo_corte = db.session.query(func.max(SnapshotSaldo.data_corte)).scalar()
+    if ultimo_corte is not None and ultimo_corte >= corte.replace(tzinfo=None):
+        return None, 0
+    linhas = [
+        {'data_corte': corte, 'item_ata_id': item_ata_id, 'unidade_saude_id': unidade_saude_id,
+         'saldo_item': saldo, 'consumo_cota': consumo, 'cota_prevista': prevista}
+        for (item_ata_id, unidade_saude_id), (saldo, consumo, prevista) in _somas_do_livro(corte).items()
+        if saldo or consumo or prevista
+    ]
+    if linhas:
+        db.session.execute(insert(SnapshotSaldo.__table__), linhas)
+    db.session.commit()
+    return corte, len(linhas)
+
+def reconstruir_saldos(aplicar=False, item_ata_ids=None, tolerancia=1e-6):
+    """Compara saldos de itens e cotas com o livro e, se aplicar=True, corrige-os. Faz commit.
+
+    Retorna a lista de divergências (tabela, id, valor atual, valor do livro).
+    Itens e cotas sem nenhum movimento são considerados com saldo zero.
+    """
+    saldos_itens, cotas = calcular_saldos(item_ata_ids=item_ata_ids)
+    divergencias = []
+
+    query_itens = db.session.query(ItemAta.id, ItemAta.saldo_disponivel)
+    query_cotas = db.session.query(CotaUnidadeItem.id, CotaUnidadeItem.item_ata_id, CotaUnidadeItem.unidade_saude_id,
+                                   CotaUnidadeItem.quantidade_prevista, CotaUnidadeItem.quantidade_consumida)
+    if item_ata_ids is not None:
+        query_itens = query_itens.filter(ItemAta.id.in_(item_ata_ids))
+        query_cotas = query_cotas.filter(CotaUnidadeItem.item_ata_id.in_(item_ata_ids))
+
+    for item_ata_id, saldo_atual in query_itens.all():
+        saldo_livro = saldos_itens.get(item_ata_id, 0.0)
+        if abs((saldo_atual or 0.0) - saldo_livro) > tolerancia:
+            divergencias.append(('item_ata', item_ata_id, saldo_atual, saldo_livro))
+            if aplicar:
+                db.session.execute(update(ItemAta.__table__).where(ItemAta.__table__.c.id == item_ata_id).values(
+                    saldo_disponivel=saldo_livro,
+                    razao_saldo=case((ItemAta.__table__.c.quantidade_registrada > 0,
+                                      saldo_livro / ItemAta.__table__.c.quantidade_registrada), else_=None)
+                ))
+    for cota_id, item_ata_id, unidade_saude_id, prevista_atual, consumida_atual in query_cotas.all():
+        prevista_livro, consumida_livro = cotas.get((item_ata_id, unidade_saude_id), (0.0, 0.0))
+        if (abs((prevista_atual or 0.0) - prevista_livro) > tolerancia
+                or abs((consumida_atual or 0.0) - consumida_livro) > tolerancia):
+            divergencias.append(('cota_unidade_item', cota_id, (prevista_atual, consumida_atual),
+                                 (prevista_livro, consumida_livro)))
+            if aplicar:
+                db.session.execute(update(CotaUnidadeItem.__table__).where(CotaUnidadeItem.__table__.c.id == cota_id).values(
+                    quantidade_prevista=prevista_livro, quantidade_consumida=consumida_livro,
+                    razao_saldo=calcular_razao_saldo(prevista_livro - consumida_livro, prevista_livro)
+                ))
+    db.session.commit()
+    return divergencias
+
+# --- CONCILIAÇÃO DE SALDOS COM AS LINHAS DE CONSUMO ---
+# Recalcula saldo dos itens e consumo das cotas a partir das linhas de
+# consumo de Contratinhos e Empenhos. O total consumido sai de uma única
+# consulta agrupada (uma varredura de cada tabela de consumo); só as linhas
+# divergentes voltam para o Python.
+
+def _consumo_por_item_unidade(ata_ids=None):
+    consumos = union_all(
+        select(ConsumoItemContratinho.item_ata_id, Contratinho.unidade_saude_id,
+               ConsumoItemContratinho.quantidade_consumida.label('quantidade'))
+        .join(Contratinho, Contratinho.id == ConsumoItemContratinho.contratinho_id),
+        select(ConsumoItemEmpenho.item_ata_id, Empenho.unidade_saude_id,
+               ConsumoItemEmpenho.quantidade_consumida.label('quantidade'))
+        .join(Empenho, Empenho.id == ConsumoItemEmpenho.empenho_id),
+    ).subquery()
+    query = select(consumos.c.item_ata_id, consumos.c.unidade_saude_id,
+                   func.sum(consumos.c.quantidade).label('quantidade'))
+    if ata_ids:
+        query = query.where(consumos.c.item_ata_id.in_(select(ItemAta.id).where(ItemAta.ata_id.in_(ata_ids))))
+    return query.group_by(consumos.c.item_ata_id, consumos.c.unidade_saude_id).subquery()
+
+def reconciliar_saldos(corrigir=False, ata_ids=None, tolerancia=1e-6):
+    """Confere saldos de itens e consumos de cotas contra as linhas de consumo.
+
+    Retorna (itens, cotas) com as divergências: itens como
+    (id, ata_id, descricao, saldo atual, saldo correto) e cotas como
+    (id, item_ata_id, unidade_saude_id, consumo atual, consumo correto).
+    Com corrigir=True grava os valores corretos com um UPDATE por tabela e o
+    AJUSTE no livro de movimentos com um INSERT ... SELECT por tabela, numa
+    única transação; as linhas divergentes ficam travadas desde a leitura. Faz commit.
+    """
+    por_item_unidade = _consumo_por_item_unidade(ata_ids)
+    por_item = select(por_item_unidade.c.item_ata_id, func.sum(por_item_unidade.c.quantidade).label('quantidade'))\
+        .group_by(por_item_unidade.c.item_ata_id).subquery()
+
+    saldo_correto = ItemAta.quantidade_registrada - func.coalesce(por_item.c.quantidade, 0.0)
+    query_itens = select(ItemAta.id, ItemAta.ata_id, ItemAta.descricao_item, ItemAta.saldo_disponivel, saldo_correto)\
+        .outerjoin(por_item, por_item.c.item_ata_id == ItemAta.id)\
+        .where(func.abs(ItemAta.saldo_disponivel - saldo_correto) > tolerancia)
+    consumo_correto = func.coalesce(por_item_unidade.c.quantidade, 0.0)
+    query_cotas = select(CotaUnidadeItem.id, CotaUnidadeItem.item_ata_id, CotaUnidadeItem.unidade_saude_id,
+                         CotaUnidadeItem.quantidade_consumida, consumo_correto)\
+        .outerjoin(por_item_unidade, (por_item_unidade.c.item_ata_id == CotaUnidadeItem.item_ata_id)
+                   & (por_item_unidade.c.unidade_saude_id == CotaUnidadeItem.unidade_saude_id))\
+        .where(func.abs(CotaUnidadeItem.quantidade_consumida - consumo_correto) > tolerancia)
+    if ata_ids:
+        query_itens = query_itens.where(ItemAta.ata_id.in_(ata_ids))
+        query_cotas = query_cotas.where(CotaUnidadeItem.item_ata_id.in_(select(ItemAta.id).where(ItemAta.ata_id.in_(ata_ids))))
+    leitura_itens, leitura_cotas = query_itens.order_by(ItemAta.id), query_cotas.order_by(CotaUnidadeItem.id)
+    if corrigir:
+        # Nenhum consumo concorrente altera as linhas divergentes até o commit,
+        # então o AJUSTE lançado é exatamente a diferença corrigida.
+        leitura_itens = leitura_itens.with_for_update(of=ItemAta)
+        leitura_cotas = leitura_cotas.with_for_update(of=CotaUnidadeItem)
+
+    itens = [tuple(linha) for linha in db.session.execute(leitura_itens)]
+    cotas = [tuple(linha) for linha in db.session.execute(leitura_cotas)]
+    if not corrigir or not (itens or cotas):
+        return itens, cotas
+
+    # Livro primeiro, enquanto os valores atuais ainda são os divergentes.
+    lancar_movimentos_por_consulta('AJUSTE', query_itens.with_only_columns(
+        ItemAta.id, literal(None, db.Integer), saldo_correto - ItemAta.saldo_disponivel, literal(0.0),
+        literal('Ata'), ItemAta.ata_id, maintain_column_froms=False
+    ))
+    lancar_movimentos_por_consulta('AJUSTE', query_cotas.with_only_columns(
+        CotaUnidadeItem.item_ata_id, CotaUnidadeItem.unidade_saude_id, literal(0.0),
+        consumo_correto - CotaUnidadeItem.quantidade_consumida, literal(None, db.String), literal(None, db.Integer),
+        maintain_column_froms=False
+    ))
+
+    tabela_itens, tabela_cotas = ItemAta.__table__, CotaUnidadeItem.__table__
+    consumo_do_item = select(por_item.c.quantidade).where(por_item.c.item_ata_id == tabela_itens.c.id).scalar_subquery()
+    novo_saldo = tabela_itens.c.quantidade_registrada - func.coalesce(consumo_do_item, 0.0)
+    db.session.execute(update(tabela_itens).where(
+        tabela_itens.c.id.in_(query_itens.with_only_columns(ItemAta.id, maintain_column_froms=False).correlate(None))
+    ).values(
+        saldo_disponivel=novo_saldo,
+        razao_saldo=case((tabela_itens.c.quantidade_registrada > 0, novo_saldo / tabela_itens.c.quantidade_registrada),
+                         else_=None)
+    ))
+    consumo_da_cota = select(por_item_unidade.c.quantidade).where(
+        por_item_unidade.c.item_ata_id == tabela_cotas.c.item_ata_id,
+        por_item_unidade.c.unidade_saude_id == tabela_cotas.c.unidade_saude_id
+    ).scalar_subquery()
+    novo_consumo = func.coalesce(consumo_da_cota, 0.0)
+    db.session.execute(update(tabela_cotas).where(
+        tabela_cotas.c.id.in_(query_cotas.with_only_columns(CotaUnidadeItem.id, maintain_column_froms=False).correlate(None))
+    ).values(
+        quantidade_consumida=novo_consumo,
+        razao_saldo=case((tabela_cotas.c.quantidade_prevista > 0,
+                          (tabela_cotas.c.quantidade_prevista - novo_consumo) / tabela_cotas.c.quantidade_prevista),
+                         else_=None)
+    ))
+    db.session.commit()
+    return itens, cotas
+
+# --- LINHA DO TEMPO DE VENCIMENTOS ---
+# Tabela única com o prazo final de Atas, Contratos e Contratinhos, para que o
+# alerta de prazos do dashboard seja uma só consulta por intervalo de datas.
+class Vencimento(db.Model):
+    __tablename__ = 'vencimento'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo_documento = db.Column(db.String(20), nullable=False)
+    documento_id = db.Column(db.Integer, nullable=False)
+    rotulo = db.Column(db.String(150), nullable=False)
+    descricao = db.Column(db.String(255), nullable=True)
+    data_vencimento = db.Column(db.DateTime, nullable=False, index=True)
+    __table_args__ = (UniqueConstraint('tipo_documento', 'documento_id', name='_vencimento_documento_uc'),)
+
+    def __repr__(self):
+        return f'<Vencimento {self.tipo_documento} {self.rotulo} em {self.data_vencimento}>'
+
+# Para cada documento: atributos que alimentam a linha e como montá-la (rótulo, descrição, data).
+_VENCIMENTO_POR_MODELO = {
+    Ata: (('numero_ata', 'ano', 'descricao', 'data_validade'),
+          lambda doc: (f"{doc.numero_ata}/{doc.ano}", doc.descricao, doc.data_validade)),
+    Contrato: (('numero_contrato', 'objeto', 'data_fim_vigencia'),
+               lambda doc: (doc.numero_contrato, doc.objeto, doc.data_fim_vigencia)),
+    Contratinho: (('numero_contratinho', 'objeto', 'data_fim_vigencia'),
+                  lambda doc: (doc.numero_contratinho, doc.objeto, doc.data_fim_vigencia)),
+}
+
+def sincronizar_vencimento(connection, tipo_documento, documento_id, rotulo=None, descricao=None, data_vencimento=None):
+    """Regrava a linha de vencimento do documento; sem data, apenas a remove."""
+    tabela = Vencimento.__table__
+    connection.execute(delete(tabela).where(
+        tabela.c.tipo_documento == tipo_documento, tabela.c.documento_id == documento_id
+    ))
+    if data_vencimento:
+        connection.execute(insert(tabela).values(
+            tipo_documento=tipo_documento,
+            documento_id=documento_id,
+            rotulo=rotulo,
+            descricao=descricao[:255] if descricao else None,
+            data_vencimento=data_vencimento
+        ))
+
+def _registrar_eventos_vencimento(modelo, atributos, montar_linha):
+    tipo_documento = modelo.__name__
+
+    @event.listens_for(modelo, 'after_insert')
+    def _inserir(mapper, connection, target):
+        sincronizar_vencimento(connection, tipo_documento, target.id, *montar_linha(target))
+
+    @event.listens_for(modelo, 'after_update')
+    def _atualizar(mapper, connection, target):
+        estado = inspect(target)
+        if any(estado.attrs[nome].history.has_changes() for nome in atributos):
+            sincronizar_vencimento(connection, tipo_documento, target.id, *montar_linha(target))
+
+    @event.listens_for(modelo, 'after_delete')
+    def _excluir(mapper, connection, target):
+        sincronizar_vencimento(connection, tipo_documento, target.id)
+
+for _modelo, (_atributos, _montar_linha) in _VENCIMENTO_POR_MODELO.items():
+    _registrar_eventos_vencimento(_modelo, _atributos, _montar_linha)
+
+def registrar_vencimentos_em_lote(connection, modelo, documentos):
+    """Grava o vencimento de documentos inseridos em lote, sem passar pelos eventos do ORM.
+
+    documentos é uma lista de dicts com 'id' e os campos do modelo.
+    """
+    if modelo not in _VENCIMENTO_POR_MODELO:
+        return
+    _, montar_linha = _VENCIMENTO_POR_MODELO[modelo]
+    linhas = []
+    for documento in documentos:
+        rotulo, descricao, data_vencimento = montar_linha(SimpleNamespace(**documento))
+        if data_vencimento:
+            linhas.append({'tipo_documento': modelo.__name__, 'documento_id': documento['id'], 'rotulo': rotulo,
+                           'descricao': descricao[:255] if descricao else None, 'data_vencimento': data_vencimento})
+    if linhas:
+        connection.execute(insert(Vencimento.__table__), linhas)
+
+def remover_vencimentos_em_lote(connection, modelo, documento_ids):
+    tabela = Vencimento.__table__
+    connection.execute(delete(tabela).where(
+        tabela.c.tipo_documento == modelo.__name__, tabela.c.documento_id.in_(documento_ids)
+    ))
+
+# --- ESTADO DOS CONTRATOS (VALOR GLOBAL E VIGÊNCIA) ---
+def calcular_fim_vigencia(data_fim_original, aditivos):
+    """Aplica os aditivos, já em ordem de assinatura, ao fim de vigência original.
+
+    Uma nova data final substitui a vigente; sem ela, o prazo adicional em dias
+    é somado à data vigente.
+    """
+    data_final = data_fim_original
+    for aditivo in aditivos:
+        if aditivo.nova_data_fim_vigencia:
+            data_final = aditivo.nova_data_fim_vigencia
+        elif aditivo.prazo_adicional_dias and data_final:
+            data_final = data_final + timedelta(days=aditivo.prazo_adicional_dias)
+    return data_final
+
+def recalcular_contratos_em_lote(connection, contrato_ids, tamanho_lote=500):
+    """Recalcula valor global e fim de vigência de vários contratos de uma vez.
+
+    Versão em lote do recálculo feito a cada aditivo salvo: o valor global
+    (itens + acréscimos dos aditivos) é gravado por um UPDATE com subconsultas
+    correlacionadas; a vigência, por uma única leitura dos aditivos de cada
+    fatia de contratos. A linha do tempo de vencimentos acompanha as datas alteradas.
+    """
+    contratos, itens, aditivos = Contrato.__table__, ItemContrato.__table__, Aditivo.__table__
+    contrato_ids = sorted(set(contrato_ids))
+    for inicio in range(0, len(contrato_ids), tamanho_lote):
+        ids = contrato_ids[inicio:inicio + tamanho_lote]
+        valor_itens = select(func.coalesce(func.sum(itens.c.valor_total_item), 0.0))\
+            .where(itens.c.contrato_id == contratos.c.id).scalar_subquery()
+        valor_aditivos = select(func.coalesce(func.sum(aditivos.c.valor_acrescimo), 0.0))\
+            .where(aditivos.c.contrato_id == contratos.c.id).scalar_subquery()
+        connection.execute(update(contratos).where(contratos.c.id.in_(ids))
+                           .values(valor_global_contrato=valor_itens + valor_aditivos))
+
+        aditivos_por_contrato = {}
+        for aditivo in connection.execute(
+            select(aditivos.c.contrato_id, aditivos.c.nova_data_fim_vigencia, aditivos.c.prazo_adicional_dias)
+            .where(aditivos.c.contrato_id.in_(ids))
+            .order_by(aditivos.c.contrato_id, aditivos.c.data_assinatura, aditivos.c.id)
+        ):
+            aditivos_por_contrato.setdefault(aditivo.contrato_id, []).append(aditivo)
+        alterados = []
+        for contrato in connection.execute(
+            select(contratos.c.id, contratos.c.numero_contrato, contratos.c.objeto,
+                   contratos.c.data_fim_vigencia_original, contratos.c.data_fim_vigencia)
+            .where(contratos.c.id.in_(ids))
+        ):
+            data_fim = calcular_fim_vigencia(contrato.data_fim_vigencia_original,
+                                             aditivos_por_contrato.get(contrato.id, ()))
+            if data_fim != contrato.data_fim_vigencia:
+                alterados.append({'id': contrato.id, 'numero_contrato': contrato.numero_contrato,
+                                  'objeto': contrato.objeto, 'data_fim_vigencia': data_fim})
+        if alterados:
+            connection.execute(
+                update(contratos).where(contratos.c.id == bindparam('b_id'))
+                .values(data_fim_vigencia=bindparam('b_data_fim')),
+                [{'b_id': contrato['id'], 'b_data_fim': contrato['data_fim_vigencia']} for contrato in alterados]
+            )
+            remover_vencimentos_em_lote(connection, Contrato, [contrato['id'] for contrato in alterados])
+            registrar_vencimentos_em_lote(connection, Contrato, alterados)
+
+def consultar_vencimentos(data_limite, data_inicial=None):
+    """Documentos que vencem até data_limite (e a partir de data_inicial, se informada)."""
+    query = db.session.query(
+        Vencimento.tipo_documento, Vencimento.documento_id, Vencimento.rotulo,
+        Vencimento.descricao, Vencimento.data_vencimento
+    ).filter(Vencimento.data_vencimento <= data_limite)
+    if data_inicial is not None:
+        query = query.filter(Vencimento.data_vencimento >= data_inicial)
+    return query.order_by(Vencimento.data_vencimento).all()
+
+# --- CONSOLIDADO DE GASTOS POR UNIDADE/MÊS ---
+# Soma de valor_total_consumido_item (Contratinhos + Empenhos) por unidade e mês
+# de emissão do documento. É ajustado na mesma transação em que os consumos são
+# gravados ou estornados, e alimenta o gráfico de gastos do dashboard.
+class GastoUnidadeMensal(db.Model):
+    __tablename__ = 'gasto_unidade_mensal'
+    id = db.Column(db.Integer, primary_key=True)
+    unidade_saude_id = db.Column(db.Integer, db.ForeignKey('unidade_saude.id', name='fk_gasto_unidade_saude_id', ondelete='CASCADE'), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (UniqueConstraint('unidade_saude_id', 'ano', 'mes', name='_gasto_unidade_mes_uc'),)
+
+    def __repr__(self):
+        return f'<GastoUnidadeMensal unidade={self.unidade_saude_id} {self.mes:02d}/{self.ano}: {self.valor_total}>'
+
+def registrar_gasto_unidade(unidade_saude_id, data_referencia, valor):
+    """Soma (ou, com valor negativo, estorna) um gasto no consolidado da unidade."""
+    if not unidade_saude_id or not data_referencia or not valor:
+        return
+    tabela = GastoUnidadeMensal.__table__
+    filtro = (
+        tabela.c.unidade_saude_id == unidade_saude_id,
+        tabela.c.ano == data_referencia.year,
+        tabela.c.mes == data_referencia.month,
+    )
+    resultado = db.session.execute(update(tabela).where(*filtro).values(valor_total=tabela.c.valor_total + valor))
+    if resultado.rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(tabela).values(
+                unidade_saude_id=unidade_saude_id, ano=data_referencia.year,
+                mes=data_referencia.month, valor_total=valor
+            ))
+    except IntegrityError:
+        # Outra transação criou a linha do mês entre o UPDATE e o INSERT.
+        db.session.execute(update(tabela).where(*filtro).values(valor_total=tabela.c.valor_total + valor))
+
+# --- RESUMO DE CONTAGENS DO DASHBOARD ---
+# Guarda o total de registros de cada entidade principal para que o dashboard
+# não precise executar um COUNT(*) por tabela a cada acesso. Os totais são
+# ajustados no mesmo flush em que os registros são inseridos ou excluídos.
+class ResumoContagem(db.Model):
+    __tablename__ = 'resumo_contagem'
+    entidade = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumoContagem {self.entidade}={self.total}>'
+
+MODELOS_CONTADOS = {
+    'processos': Processo,
+    'atas': Ata,
+    'contratos': Contrato,
+    'contratinhos': Contratinho,
+    'empenhos': Empenho,
+    'itens_ata': ItemAta,
+    'unidades_saude': UnidadeSaude,
+}
+_ENTIDADE_POR_MODELO = {modelo: entidade for entidade, modelo in MODELOS_CONTADOS.items()}
+
+def ajustar_resumo_contagem(connection, deltas):
+    """Soma os deltas ({entidade: n}) aos totais já materializados.
+
+    Entidades ainda sem linha no resumo são ignoradas: a próxima leitura
+    recalcula o total a partir da tabela, já incluindo esta alteração.
+    """
+    tabela = ResumoContagem.__table__
+    for entidade, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(tabela).where(tabela.c.entidade == entidade).values(total=tabela.c.total + delta)
+            )
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_resumo_contagem(session, flush_context):
+    deltas = {}
+    for obj in session.new:
+        entidade = _ENTIDADE_POR_MODELO.get(type(obj))
+        if entidade:
+            deltas[entidade] = deltas.get(entidade, 0) + 1
+    for obj in session.deleted:
+        entidade = _ENTIDADE_POR_MODELO.get(type(obj))
+        # Objetos já excluídos num flush anterior da mesma transação podem
+        # reaparecer aqui por cascata; só os ainda persistentes contam.
+        if entidade and inspect(obj).persistent:
+            deltas[entidade] = deltas.get(entidade, 0) - 1
+    if deltas:
+        ajustar_resumo_contagem(session.connection(), deltas)
+
+def reconstruir_resumo_contagem(entidades=None):
+    """Recalcula (via COUNT) os totais das entidades informadas, ou de todas."""
+    entidades = list(entidades or MODELOS_CONTADOS)
+    ResumoContagem.query.filter(ResumoContagem.entidade.in_(entidades)).delete(synchronize_session=False)
+    totais = {}
+    for entidade in entidades:
+        totais[entidade] = db.session.query(func.count(MODELOS_CONTADOS[entidade].id)).scalar()
+        db.session.add(ResumoContagem(entidade=entidade, total=totais[entidade]))
+    db.session.commit()
+    return totais
+
+def obter_totais_dashboard():
+    totais = dict(db.session.query(ResumoContagem.entidade, ResumoContagem.total).all())
+    faltantes = [entidade for entidade in MODELOS_CONTADOS if entidade not in totais]
+    if faltantes:
+        try:
+            totais.update(reconstruir_resumo_contagem(faltantes))
+        except IntegrityError:
+            # Outro worker materializou o resumo ao mesmo tempo; basta reler.
+            db.session.rollback()
+            totais = dict(db.session.query(ResumoContagem.entidade, ResumoContagem.total).all())
+    return totais
+
+# --- VERSÃO DAS TABELAS DE APOIO ---
+# Cada tabela usada para montar listas de escolha dos formulários tem um
+# contador que é incrementado no mesmo flush em que seus registros são
+# inseridos, alterados ou excluídos. Os caches de opções (opcoes.py) guardam a
+# versão com que foram montados e só recarregam quando ela muda, o que vale
+# também entre workers distintos, já que o contador fica no banco.
+class VersaoTabela(db.Model):
+    __tablename__ = 'versao_tabela'
+    tabela = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersaoTabela {self.tabela}={self.versao}>'
+
+TABELAS_VERSIONADAS = ('ata', 'item_ata', 'processo', 'unidade_saude')
+# Colunas que mudam a cada consumo ou estorno. Alterá-las não muda a estrutura
+# das listas de escolha (as que exibem saldo não são guardadas em cache), então
+# não incrementam a versão: do contrário cada consumo travaria a linha de
+# 'item_ata' em versao_tabela e descartaria as listas de todos os workers.
+COLUNAS_DE_SALDO = {'saldo_disponivel', 'razao_saldo'}
+
+@event.listens_for(VersaoTabela.__table__, 'after_create')
+def _popular_versao_tabela(target, connection, **kw):
+    connection.execute(insert(target), [{'tabela': nome, 'versao': 0} for nome in TABELAS_VERSIONADAS])
+
+def incrementar_versao_tabelas(connection, tabelas):
+    """Invalida os caches montados a partir das tabelas informadas."""
+    tabelas = sorted(set(tabelas) & set(TABELAS_VERSIONADAS))
+    if not tabelas:
+        return
+    tabela = VersaoTabela.__table__
+    connection.execute(
+        update(tabela).where(tabela.c.tabela.in_(tabelas)).values(versao=tabela.c.versao + 1)
+    )
+    if has_request_context():
+        # A versão lida no início da requisição deixou de valer para ela.
+        g.pop('_versoes_tabelas', None)
+
+def marcar_tabelas_alteradas(tabelas):
+    """Registra tabelas alteradas por UPDATEs em massa, que não passam pelo flush.
+
+    As versões são incrementadas uma única vez, no commit da transação.
+    """
+    db.session.info.setdefault('tabelas_alteradas', set()).update(tabelas)
+
+@event.listens_for(Session, 'before_commit')
+def _versionar_tabelas_marcadas(session):
+    tabelas = session.info.pop('tabelas_alteradas', None)
+    if tabelas:
+        incrementar_versao_tabelas(session.connection(), tabelas)
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_tabelas_marcadas(session):
+    session.info.pop('tabelas_alteradas', None)
+
+def _apenas_saldo_alterado(obj):
+    estado = inspect(obj)
+    return all(nome in COLUNAS_DE_SALDO or not estado.attrs[nome].history.has_changes()
+               for nome in estado.mapper.column_attrs.keys())
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_versao_tabelas(session, flush_context):
+    alteradas = set()
+    for obj in session.new:
+        alteradas.add(getattr(obj, '__tablename__', None))
+    for obj in session.deleted:
+        alteradas.add(getattr(obj, '__tablename__', None))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False) and not _apenas_saldo_alterado(obj):
+            alteradas.add(getattr(obj, '__tablename__', None))
+    if alteradas & set(TABELAS_VERSIONADAS):
+        incrementar_versao_tabelas(session.connection(), alteradas)
+
+def obter_versoes_tabelas():
+    """Versões atuais de todas as tabelas versionadas (uma consulta por requisição)."""
+    if has_request_context() and '_versoes_tabelas' in g:
+        return g._versoes_tabelas
+    versoes = dict(db.session.query(VersaoTabela.tabela, VersaoTabela.versao).all())
+    if has_request_context():
+        g._versoes_tabelas = versoes
+    return versoes
+
+# --- IMPORTAÇÕES EM SEGUNDO PLANO ---
+# Cada arquivo enviado vira uma linha em importacao_job; o arquivo fica no
+# diretório de spool até ser processado por um worker (ver app.py).
+class ImportacaoJob(db.Model):
+    __tablename__ = 'importacao_job'
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Na fila'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDO', 'Concluída'),
+        ('ERRO', 'Erro'),
+    ]
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)
+    nome_arquivo = db.Column(db.String(255), nullable=False)
+    caminho_arquivo = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='PENDENTE', index=True)
+    linhas_processadas = db.Column(db.Integer, nullable=False, default=0)
+    resumo = db.Column(db.Text, nullable=True)
+    erros = db.Column(db.Text, nullable=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_importacao_job_usuario_id'), nullable=False, index=True)
+    usuario = db.relationship('User')
+    criado_em = db.Column(db.DateTime, nullable=False, default=get_current_time_utc)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def finalizado(self):
+        return self.status in ('CONCLUIDO', 'ERRO')
+
+    def __repr__(self):
+        return f'<ImportacaoJob {self.id} {self.tipo} {self.status}>'
+
 # Fim do arquivo completo: models.py
\ No newline at end of file
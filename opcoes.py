@@ -0,0 +1,96 @@
+# Início do arquivo completo: opcoes.py
+
+import threading
+from collections import OrderedDict
+
+from models import db, Ata, ItemAta, Processo, UnidadeSaude, obter_versoes_tabelas
+
+# --- CACHE DAS LISTAS DE ESCOLHA DOS FORMULÁRIOS ---
+# Cada lista fica em memória (por processo) junto com as versões das tabelas
+# de onde foi montada. Ao montar um formulário, basta comparar essas versões
+# com as atuais (lidas uma única vez por requisição); a lista só é consultada
+# de novo no banco quando alguma das tabelas foi alterada, em qualquer worker.
+# As listas que exibem saldo mudam a cada consumo e não passam pelo cache.
+
+TAMANHO_MAXIMO_CACHE = 64
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def _obter(nome, tabelas, carregar):
+    versoes = obter_versoes_tabelas()
+    chave_versao = tuple(versoes.get(tabela) for tabela in tabelas)
+    with _lock:
+        em_cache = _cache.get(nome)
+        if em_cache is not None:
+            _cache.move_to_end(nome)
+    if em_cache is not None and em_cache[0] == chave_versao:
+        return em_cache[1]
+    # A versão é lida antes dos dados: se houver escrita concorrente, no pior
+    # caso a lista guardada já é mais nova que a versão e será recarregada.
+    opcoes = carregar()
+    if None not in chave_versao:
+        with _lock:
+            _cache[nome] = (chave_versao, opcoes)
+            _cache.move_to_end(nome)
+            while len(_cache) > TAMANHO_MAXIMO_CACHE:
+                _cache.popitem(last=False)
+    return opcoes
+
+
+def limpar_cache_opcoes():
+    with _lock:
+        _cache.clear()
+
+
+def opcoes_atas():
+    return _obter('atas', ('ata',), lambda: [
+        (ata_id, f"{numero_ata}/{ano}")
+        for ata_id, numero_ata, ano in db.session.query(Ata.id, Ata.numero_ata, Ata.ano)
+                                                   .order_by(Ata.ano.desc(), Ata.numero_ata.desc()).all()
+    ])
+
+
+def opcoes_unidades():
+    return _obter('unidades', ('unidade_saude',), lambda: [
+        tuple(linha) for linha in db.session.query(UnidadeSaude.id, UnidadeSaude.nome_unidade)
+                                            .order_by(UnidadeSaude.nome_unidade).all()
+    ])
+
+
+def opcoes_processos():
+    return _obter('processos', ('processo',), lambda: [
+        (processo_id, f"{numero_processo}/{ano}")
+        for processo_id, numero_processo, ano in db.session.query(Processo.id, Processo.numero_processo, Processo.ano)
+                                                           .order_by(Processo.ano.desc(), Processo.numero_processo.desc()).all()
+    ])
+
+
+def opcoes_itens_ata():
+    """Todos os itens de ata com ata e saldo, para o relatório de consumo por item (sem cache)."""
+    return [
+        (item_id, f"{descricao_item} (Ata: {numero_ata}/{ano}, Saldo: {saldo_disponivel:.0f})")
+        for item_id, descricao_item, saldo_disponivel, numero_ata, ano in
+        db.session.query(ItemAta.id, ItemAta.descricao_item, ItemAta.saldo_disponivel, Ata.numero_ata, Ata.ano)
+                  .join(Ata, ItemAta.ata_id == Ata.id)
+                  .order_by(Ata.ano.desc(), Ata.numero_ata.desc(), ItemAta.descricao_item).all()
+    ]
+
+
+def opcoes_itens_com_saldo(ata_id):
+    """Itens da ata com saldo, para os consumos de Contratinhos/Empenhos.
+
+    Retorna (opcoes, ata_tem_itens); o segundo valor distingue a ata sem itens
+    cadastrados da ata com todos os itens zerados. Sem cache: é uma consulta
+    pelo índice de ata_id e o saldo muda a cada consumo.
+    """
+    itens = db.session.query(
+        ItemAta.id, ItemAta.descricao_item, ItemAta.saldo_disponivel,
+        ItemAta.unidade_medida, ItemAta.valor_unitario_registrado
+    ).filter(ItemAta.ata_id == ata_id).order_by(ItemAta.descricao_item).all()
+    opcoes = [(item_id, f"{descricao} (Saldo: {saldo:.2f} {unidade or ''}, VU: R${valor_unitario:.2f})")
+              for item_id, descricao, saldo, unidade, valor_unitario in itens if saldo > 0]
+    return opcoes, bool(itens)
+
+# Fim do arquivo completo: opcoes.py
@@ -0,0 +1,120 @@
+# Início do arquivo completo: paginacao.py
+
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.engine import Row
+from sqlalchemy.types import Date, DateTime
+
+
+class PaginaCursor:
+    """Uma página de resultados obtida por paginação por cursor (keyset)."""
+
+    def __init__(self, itens, proximo_cursor, cursor_atual):
+        self.itens = itens
+        self.proximo_cursor = proximo_cursor
+        self.cursor_atual = cursor_atual
+
+    @property
+    def tem_proxima(self):
+        return self.proximo_cursor is not None
+
+    @property
+    def eh_primeira(self):
+        return self.cursor_atual is None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def __bool__(self):
+        return bool(self.itens)
+
+
+def _codificar_cursor(valores):
+    serializados = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores]
+    bruto = json.dumps(serializados, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor(cursor, ordenacao):
+    """Converte o cursor recebido na URL de volta para os valores da chave.
+
+    Retorna None se o cursor estiver vazio, corrompido ou não corresponder à
+    ordenação (nesses casos a listagem simplesmente volta à primeira página).
+    """
+    if not cursor:
+        return None
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        if not isinstance(valores, list) or len(valores) != len(ordenacao):
+            return None
+        convertidos = []
+        for (coluna, _), valor in zip(ordenacao, valores):
+            if valor is not None and isinstance(coluna.type, DateTime):
+                valor = datetime.fromisoformat(valor)
+            elif valor is not None and isinstance(coluna.type, Date):
+                valor = date.fromisoformat(valor)
+            convertidos.append(valor)
+        return convertidos
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _condicao_apos_cursor(ordenacao, valores):
+    """Monta a condição "linha vem depois do cursor" para a ordenação dada.
+
+    Colunas que aceitam nulo são ordenadas com NULLS LAST, então um cursor com
+    valor preenchido também aceita as linhas nulas, e um cursor nulo só avança
+    dentro do bloco de nulos. A última coluna da ordenação (o id) nunca é nula.
+    """
+    condicao = None
+    for (coluna, descendente), valor in reversed(list(zip(ordenacao, valores))):
+        if valor is None:
+            condicao = and_(coluna.is_(None), condicao)
+            continue
+        depois = coluna < valor if descendente else coluna > valor
+        if coluna.nullable:
+            depois = or_(depois, coluna.is_(None))
+        condicao = depois if condicao is None else or_(depois, and_(coluna == valor, condicao))
+    return condicao
+
+
+def paginar_por_cursor(query, ordenacao, cursor=None, por_pagina=50):
+    """Aplica ordenação + filtro de cursor à query e devolve uma PaginaCursor.
+
+    `ordenacao` é uma lista de (coluna, descendente) que deve terminar numa
+    coluna única (normalmente o id) para que a ordem seja total. A entidade
+    paginada é a primeira da query; linhas em tupla (ex.: entidade + contagem)
+    são aceitas. O custo de qualquer página é o mesmo da primeira, pois o banco
+    apenas continua a varredura do índice a partir da chave do cursor.
+    """
+    clausulas = []
+    for coluna, descendente in ordenacao:
+        clausula = coluna.desc() if descendente else coluna.asc()
+        if coluna.nullable:
+            clausula = clausula.nulls_last()
+        clausulas.append(clausula)
+
+    valores_cursor = _decodificar_cursor(cursor, ordenacao)
+    if valores_cursor is not None:
+        query = query.filter(_condicao_apos_cursor(ordenacao, valores_cursor))
+
+    linhas = query.order_by(*clausulas).limit(por_pagina + 1).all()
+
+    proximo_cursor = None
+    if len(linhas) > por_pagina:
+        linhas = linhas[:por_pagina]
+        ultima = linhas[-1]
+        entidade = ultima[0] if isinstance(ultima, Row) else ultima
+        proximo_cursor = _codificar_cursor([getattr(entidade, coluna.key) for coluna, _ in ordenacao])
+
+    return PaginaCursor(linhas, proximo_cursor, cursor if valores_cursor is not None else None)
+
+# Fim do arquivo completo: paginacao.py
@@ -0,0 +1,149 @@
+# Início do arquivo completo: profiler.py
+
+import heapq
+import random
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class ProfilerRequisicoes:
+    """Mede, por endpoint, quantas consultas SQL cada requisição executa, o tempo
+    gasto no banco e na renderização de templates e as instruções mais lentas.
+
+    As medições ficam numa janela móvel em memória (por processo) e podem ser
+    amostradas via PROFILER_TAXA_AMOSTRAGEM para reduzir o custo em produção.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._janelas = {}
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILER_ATIVO', True)
+        app.config.setdefault('PROFILER_TAXA_AMOSTRAGEM', 1.0)
+        app.config.setdefault('PROFILER_JANELA', 200)
+        app.config.setdefault('PROFILER_CONSULTAS_LENTAS', 5)
+        self.app = app
+        app.extensions['profiler'] = self
+
+        app.before_request(self._iniciar_requisicao)
+        app.after_request(self._finalizar_requisicao)
+        before_render_template.connect(self._iniciar_template, app)
+        template_rendered.connect(self._finalizar_template, app)
+        event.listen(Engine, 'before_cursor_execute', self._iniciar_consulta)
+        event.listen(Engine, 'after_cursor_execute', self._finalizar_consulta)
+
+    # --- Coleta ---
+    def _medicao_atual(self):
+        if not has_request_context():
+            return None
+        return g.get('_profiler')
+
+    def _iniciar_requisicao(self):
+        config = self.app.config
+        if not config['PROFILER_ATIVO'] or request.endpoint in (None, 'static'):
+            return
+        if random.random() >= config['PROFILER_TAXA_AMOSTRAGEM']:
+            return
+        g._profiler = {
+            'inicio': time.perf_counter(),
+            'consultas': 0,
+            'tempo_sql': 0.0,
+            'tempo_template': 0.0,
+            'templates_abertos': [],
+            'lentas': [],
+        }
+
+    def _iniciar_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        if self._medicao_atual() is not None:
+            conn.info.setdefault('_profiler_inicio', []).append(time.perf_counter())
+
+    def _finalizar_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        medicao = self._medicao_atual()
+        inicios = conn.info.get('_profiler_inicio')
+        if medicao is None or not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        medicao['consultas'] += 1
+        medicao['tempo_sql'] += duracao
+        lentas = medicao['lentas']
+        entrada = (duracao, medicao['consultas'], statement[:500])
+        if len(lentas) < self.app.config['PROFILER_CONSULTAS_LENTAS']:
+            heapq.heappush(lentas, entrada)
+        elif duracao > lentas[0][0]:
+            heapq.heapreplace(lentas, entrada)
+
+    def _iniciar_template(self, sender, template, context, **extra):
+        medicao = self._medicao_atual()
+        if medicao is not None:
+            medicao['templates_abertos'].append(time.perf_counter())
+
+    def _finalizar_template(self, sender, template, context, **extra):
+        medicao = self._medicao_atual()
+        if medicao is not None and medicao['templates_abertos']:
+            inicio = medicao['templates_abertos'].pop()
+            # Só o template mais externo conta, para não somar o mesmo tempo duas vezes.
+            if not medicao['templates_abertos']:
+                medicao['tempo_template'] += time.perf_counter() - inicio
+
+    def _finalizar_requisicao(self, response):
+        medicao = self._medicao_atual()
+        if medicao is None:
+            return response
+        g._profiler = None
+        registro = {
+            'momento': time.time(),
+            'status': response.status_code,
+            'duracao': time.perf_counter() - medicao['inicio'],
+            'consultas': medicao['consultas'],
+            'tempo_sql': medicao['tempo_sql'],
+            'tempo_template': medicao['tempo_template'],
+            'lentas': sorted(medicao['lentas'], reverse=True),
+        }
+        with self._lock:
+            janela = self._janelas.get(request.endpoint)
+            if janela is None:
+                janela = self._janelas[request.endpoint] = deque(maxlen=self.app.config['PROFILER_JANELA'])
+            janela.append(registro)
+        return response
+
+    # --- Consulta ---
+    def limpar(self):
+        with self._lock:
+            self._janelas.clear()
+
+    def resumo(self):
+        """Estatísticas agregadas da janela atual, do endpoint mais lento para o mais rápido."""
+        with self._lock:
+            janelas = {endpoint: list(registros) for endpoint, registros in self._janelas.items()}
+
+        limite_lentas = self.app.config['PROFILER_CONSULTAS_LENTAS']
+        linhas = []
+        for endpoint, registros in janelas.items():
+            n = len(registros)
+            duracoes = sorted(r['duracao'] for r in registros)
+            lentas = heapq.nlargest(limite_lentas, (lenta for r in registros for lenta in r['lentas']))
+            linhas.append({
+                'endpoint': endpoint,
+                'requisicoes': n,
+                'consultas_media': sum(r['consultas'] for r in registros) / n,
+                'consultas_max': max(r['consultas'] for r in registros),
+                'sql_ms_media': sum(r['tempo_sql'] for r in registros) / n * 1000,
+                'template_ms_media': sum(r['tempo_template'] for r in registros) / n * 1000,
+                'total_ms_media': sum(duracoes) / n * 1000,
+                'total_ms_p95': duracoes[min(n - 1, int(n * 0.95))] * 1000,
+                'ultima': max(r['momento'] for r in registros),
+                'consultas_lentas': [{'ms': duracao * 1000, 'sql': sql} for duracao, _, sql in lentas],
+            })
+        linhas.sort(key=lambda linha: linha['total_ms_media'], reverse=True)
+        return linhas
+
+# Fim do arquivo completo: profiler.py
@@ -176,9 +176,10 @@ def gerar_pdf_detalhes_ata(ata, itens_da_ata):
     else:
         story.append(Paragraph("Nenhum item registrado para esta ata.", styles['Normal']))
 
-    if ata.comments.count() > 0:
+    comentarios = ata.comments.all()
+    if comentarios:
         story.append(Paragraph("Comentários", styles['Subtitulo']))
-        for comment in ata.comments:
+        for comment in comentarios:
             story.append(Paragraph(f"{comment.author.username} em {comment.timestamp.strftime('%d/%m/%Y %H:%M')}:", styles['CommentUser']))
             story.append(Paragraph(comment.content.replace('\n', '<br/>'), styles['CommentContent']))
             story.append(Spacer(1, 0.1*inch))
@@ -235,9 +236,10 @@ def gerar_pdf_detalhes_contrato(contrato):
         t.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('GRID', (0,0), (-1,-1), 0.5, colors.grey)]))
         story.append(t)
 
-    if contrato.comments.count() > 0:
+    comentarios = contrato.comments.all()
+    if comentarios:
         story.append(Paragraph("Comentários", styles['Subtitulo']))
-        for comment in contrato.comments:
+        for comment in comentarios:
             story.append(Paragraph(f"{comment.author.username} em {comment.timestamp.strftime('%d/%m/%Y %H:%M')}:", styles['CommentUser']))
             story.append(Paragraph(comment.content.replace('\n', '<br/>'), styles['CommentContent']))
             story.append(Spacer(1, 0.1*inch))
@@ -277,9 +279,10 @@ def gerar_pdf_detalhes_contratinho(contratinho):
         t.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('GRID', (0,0), (-1,-1), 0.5, colors.grey)]))
         story.append(t)
 
-    if contratinho.comments.count() > 0:
+    comentarios = contratinho.comments.all()
+    if comentarios:
         story.append(Paragraph("Comentários", styles['Subtitulo']))
-        for comment in contratinho.comments:
+        for comment in comentarios:
             story.append(Paragraph(f"{comment.author.username} em {comment.timestamp.strftime('%d/%m/%Y %H:%M')}:", styles['CommentUser']))
             story.append(Paragraph(comment.content.replace('\n', '<br/>'), styles['CommentContent']))
             story.append(Spacer(1, 0.1*inch))
@@ -319,9 +322,10 @@ def gerar_pdf_detalhes_empenho(empenho):
         t.setStyle(TableStyle([('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('GRID', (0,0), (-1,-1), 0.5, colors.grey)]))
         story.append(t)
 
-    if empenho.comments.count() > 0:
+    comentarios = empenho.comments.all()
+    if comentarios:
         story.append(Paragraph("Comentários", styles['Subtitulo']))
-        for comment in empenho.comments:
+        for comment in comentarios:
             story.append(Paragraph(f"{comment.author.username} em {comment.timestamp.strftime('%d/%m/%Y %H:%M')}:", styles['CommentUser']))
             story.append(Paragraph(comment.content.replace('\n', '<br/>'), styles['CommentContent']))
             story.append(Spacer(1, 0.1*inch))
@@ -0,0 +1,95 @@
+# Início do arquivo completo: tests/conftest.py
+
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+from flask import g
+
+import config
+
+# O banco de testes é um SQLite temporário, recriado a cada teste. A
+# configuração precisa ser ajustada antes de importar o app, que lê Config
+# (e cria a engine) na importação.
+_diretorio_testes = tempfile.mkdtemp(prefix='testes_saude_contratos_')
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(_diretorio_testes, 'testes.db')
+config.Config.IMPORTACAO_DIRETORIO = os.path.join(_diretorio_testes, 'importacoes')
+config.Config.WTF_CSRF_ENABLED = False
+config.Config.PROFILER_ATIVO = False
+config.Config.TESTING = True
+
+from app import app as aplicacao  # noqa: E402
+from models import db, User, Ata, ItemAta, UnidadeSaude, CotaUnidadeItem  # noqa: E402
+from opcoes import limpar_cache_opcoes  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with aplicacao.app_context():
+        db.drop_all()
+        db.create_all()
+        limpar_cache_opcoes()
+        admin = User(username='admin', role='admin')
+        admin.set_password('senha')
+        db.session.add(admin)
+        db.session.commit()
+        yield aplicacao
+        db.session.remove()
+
+
+def _descartar_versoes_lidas():
+    # As requisições do cliente de testes reaproveitam o contexto da aplicação
+    # do fixture (e o seu g); cadastros feitos direto no banco precisam
+    # descartar as versões das tabelas que alguma requisição anterior leu.
+    g.pop('_versoes_tabelas', None)
+
+
+@pytest.fixture
+def cliente(app):
+    """Cliente HTTP já autenticado como administrador."""
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'username': 'admin', 'password': 'senha'})
+    assert resposta.status_code == 302
+    return cliente
+
+
+@pytest.fixture
+def nova_ata(app):
+    """Cria uma ata com itens e, opcionalmente, cotas por unidade.
+
+    itens é uma lista de (descricao, quantidade, valor_unitario); cotas é
+    {unidade: quantidade prevista}, aplicada a todos os itens.
+    """
+    def criar(numero='1', ano=2025, itens=(), cotas=None):
+        ata = Ata(numero_ata=numero, ano=ano, descricao=f'Ata {numero}', data_validade=datetime(2030, 12, 31))
+        db.session.add(ata)
+        db.session.flush()
+        criados = []
+        for descricao, quantidade, valor_unitario in itens:
+            item = ItemAta(ata_id=ata.id, descricao_item=descricao, quantidade_registrada=quantidade,
+                           saldo_disponivel=quantidade, valor_unitario_registrado=valor_unitario)
+            db.session.add(item)
+            criados.append(item)
+        db.session.flush()
+        for unidade, quantidade in (cotas or {}).items():
+            for item in criados:
+                db.session.add(CotaUnidadeItem(item_ata_id=item.id, unidade_saude_id=unidade.id,
+                                               quantidade_prevista=quantidade))
+        db.session.commit()
+        _descartar_versoes_lidas()
+        return ata, criados
+    return criar
+
+
+@pytest.fixture
+def nova_unidade(app):
+    def criar(nome='UBS Centro'):
+        unidade = UnidadeSaude(nome_unidade=nome, tipo_unidade='UBS')
+        db.session.add(unidade)
+        db.session.commit()
+        _descartar_versoes_lidas()
+        return unidade
+    return criar
+
+# Fim do arquivo completo: tests/conftest.py
@@ -0,0 +1,106 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from app import _aplicar_baixa, _processar_itens_consumidos_para_salvar
+from models import db, ItemAta, CotaUnidadeItem, Contratinho, ConsumoItemContratinho
+
+THREADS = 4
+CONSUMOS_POR_THREAD = 10
+LIMITES = pytest.mark.parametrize('saldo_item, cota_unidade', [(30, 100), (100, 25)], ids=['saldo_limita', 'cota_limita'])
+
+
+def consumir_em_paralelo(app, consumir):
+    """Cada thread, com sessão própria, chama consumir(thread, operacao) CONSUMOS_POR_THREAD vezes.
+
+    ValueError conta como consumo recusado; "database is locked" do SQLite é
+    repetido, já que o banco serializa os escritores.
+    """
+    contadores = {'aceitos': 0, 'recusados': 0, 'desistencias': 0}
+    lock = threading.Lock()
+    largada = threading.Barrier(THREADS)
+
+    def worker(numero):
+        with app.app_context():
+            largada.wait()
+            for operacao in range(CONSUMOS_POR_THREAD):
+                for _ in range(50):
+                    try:
+                        consumir(numero, operacao)
+                        db.session.commit()
+                        resultado = 'aceitos'
+                    except ValueError:
+                        db.session.rollback()
+                        resultado = 'recusados'
+                    except OperationalError:
+                        db.session.rollback()
+                        time.sleep(0.01)
+                        continue
+                    break
+                else:
+                    resultado = 'desistencias'
+                with lock:
+                    contadores[resultado] += 1
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(numero,)) for numero in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return contadores
+
+
+def preparar(nova_ata, nova_unidade, saldo_item, cota_unidade):
+    assert ':memory:' not in db.engine.url.render_as_string()
+    unidade = nova_unidade()
+    ata, (item,) = nova_ata(itens=[('Gaze', saldo_item, 1.0)], cotas={unidade: cota_unidade})
+    ids = ata.id, item.id, unidade.id
+    db.session.close()
+    return ids
+
+
+def conferir(item_id, unidade_id, contadores, saldo_item, cota_unidade):
+    limite = min(saldo_item, cota_unidade)
+    assert contadores == {'aceitos': limite, 'recusados': THREADS * CONSUMOS_POR_THREAD - limite, 'desistencias': 0}
+    db.session.expire_all()
+    item = db.session.get(ItemAta, item_id)
+    cota = CotaUnidadeItem.query.filter_by(item_ata_id=item_id, unidade_saude_id=unidade_id).one()
+    assert item.saldo_disponivel == saldo_item - limite
+    assert cota.quantidade_consumida == limite
+    return limite
+
+
+@LIMITES
+def test_documentos_concorrentes_nao_perdem_baixas_nem_estouram_saldo(app, nova_ata, nova_unidade,
+                                                                     saldo_item, cota_unidade):
+    ata_id, item_id, unidade_id = preparar(nova_ata, nova_unidade, saldo_item, cota_unidade)
+
+    def registrar_contratinho(numero, operacao):
+        contratinho = Contratinho(numero_contratinho=f'T{numero}-{operacao}', data_emissao=datetime.now(),
+                                  ata_id=ata_id, unidade_saude_id=unidade_id)
+        db.session.add(contratinho)
+        db.session.flush()
+        _processar_itens_consumidos_para_salvar([{'item_ata_id': item_id, 'quantidade_consumida': 1}],
+                                                contratinho, ConsumoItemContratinho, ata_id, unidade_id)
+
+    limite = conferir(item_id, unidade_id, consumir_em_paralelo(app, registrar_contratinho), saldo_item, cota_unidade)
+    soma_linhas = db.session.query(func.sum(ConsumoItemContratinho.quantidade_consumida))\
+        .filter(ConsumoItemContratinho.item_ata_id == item_id).scalar()
+    assert soma_linhas == limite and Contratinho.query.count() == limite
+
+
+@LIMITES
+def test_baixas_concorrentes_respeitam_a_condicao_do_update(app, nova_ata, nova_unidade, saldo_item, cota_unidade):
+    # Sem o INSERT do documento antes, nada serializa as threads entre a leitura
+    # do item e a baixa: só a condição do UPDATE impede o saldo de estourar.
+    _, item_id, unidade_id = preparar(nova_ata, nova_unidade, saldo_item, cota_unidade)
+
+    def baixar(numero, operacao):
+        _aplicar_baixa(db.session.get(ItemAta, item_id), unidade_id, 1)
+
+    conferir(item_id, unidade_id, consumir_em_paralelo(app, baixar), saldo_item, cota_unidade)
@@ -0,0 +1,21 @@
+from app import profiler
+
+
+def endpoints_medidos():
+    return {linha['endpoint'] for linha in profiler.resumo()}
+
+
+def test_limpar_medicoes_exige_post(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILER_ATIVO', True)
+    profiler.limpar()
+    assert cliente.get('/admin/desempenho').status_code == 200
+    assert 'admin_visualizar_desempenho' in endpoints_medidos()
+
+    # Um link ou pré-carregamento do navegador não descarta as medições.
+    assert cliente.get('/admin/desempenho/limpar').status_code == 405
+    assert 'admin_visualizar_desempenho' in endpoints_medidos()
+
+    resposta = cliente.post('/admin/desempenho/limpar')
+    assert resposta.status_code == 302 and resposta.headers['Location'].endswith('/admin/desempenho')
+    assert 'admin_visualizar_desempenho' not in endpoints_medidos()
+    assert 'action="/admin/desempenho/limpar"' in cliente.get('/admin/desempenho').get_data(as_text=True)
@@ -0,0 +1,131 @@
+from datetime import date
+
+import pytest
+
+import app as modulo_app
+from models import (db, Contratinho, ConsumoItemContratinho, ItemAta, CotaUnidadeItem, GastoUnidadeMensal,
+                    UnidadeSaude)
+
+HOJE = date.today()
+
+# Linhas iniciais (descrição, quantidade); Gaze aparece duas vezes de propósito.
+LINHAS_INICIAIS = [('Gaze', 10), ('Luva', 4), ('Gaze', 6)]
+
+# Cada cenário altera o Contratinho a partir das linhas iniciais.
+CENARIOS = {
+    'somente_texto': {'numero': 'CT-editado', 'objeto': 'Novo objeto'},
+    'aumento': {'linhas': [('Gaze', 15), ('Luva', 4), ('Gaze', 6)]},
+    'reducao': {'linhas': [('Gaze', 10), ('Luva', 4), ('Gaze', 2)]},
+    'remove_linha': {'linhas': [('Gaze', 10), ('Gaze', 6)]},
+    'adiciona_linha': {'linhas': LINHAS_INICIAIS + [('Atadura', 7)]},
+    'aumento_e_reducao': {'linhas': [('Gaze', 3), ('Luva', 9)]},
+    'troca_unidade': {'unidade': 'U2'},
+    'troca_ata': {'ata': 'B', 'linhas': [('Seringa', 3)]},
+}
+
+
+def montar(nova_ata, nova_unidade, cliente, sufixo):
+    """Cria um cenário independente (atas, unidades e cotas próprias) e o Contratinho inicial."""
+    unidades = {'U1': nova_unidade(f'U1-{sufixo}'), 'U2': nova_unidade(f'U2-{sufixo}')}
+    cotas = {unidade: 100 for unidade in unidades.values()}
+    ata_a, itens_a = nova_ata(numero=f'A-{sufixo}', itens=[('Gaze', 100, 2.0), ('Luva', 100, 3.0),
+                                                          ('Atadura', 100, 1.5)], cotas=cotas)
+    ata_b, itens_b = nova_ata(numero=f'B-{sufixo}', itens=[('Seringa', 100, 5.0)], cotas=cotas)
+    cenario = {
+        'sufixo': sufixo, 'unidades': unidades, 'atas': {'A': ata_a, 'B': ata_b},
+        'itens': {item.descricao_item: item.id for item in itens_a + itens_b},
+    }
+    resposta = cliente.post('/contratinho/novo', data=formulario(cenario, f'CT-{sufixo}', 'A', 'U1', LINHAS_INICIAIS))
+    assert resposta.status_code == 302
+    cenario['contratinho_id'] = Contratinho.query.filter_by(numero_contratinho=f'CT-{sufixo}').one().id
+    return cenario
+
+
+def formulario(cenario, numero, ata, unidade, linhas, objeto=''):
+    dados = {'numero_contratinho': numero, 'objeto': objeto, 'data_emissao': HOJE.isoformat(),
+             'ata_id': cenario['atas'][ata].id, 'unidade_saude_id': cenario['unidades'][unidade].id}
+    for indice, (descricao, quantidade) in enumerate(linhas):
+        dados[f'itens_consumidos-{indice}-item_ata_id'] = cenario['itens'][descricao]
+        dados[f'itens_consumidos-{indice}-quantidade_consumida'] = str(quantidade)
+    return dados
+
+
+def editar(cliente, cenario, alteracao):
+    dados = formulario(cenario, alteracao.get('numero', f"CT-{cenario['sufixo']}"), alteracao.get('ata', 'A'),
+                       alteracao.get('unidade', 'U1'), alteracao.get('linhas', LINHAS_INICIAIS),
+                       alteracao.get('objeto', ''))
+    resposta = cliente.post(f"/contratinho/editar/{cenario['contratinho_id']}", data=dados)
+    assert resposta.status_code == 302
+
+
+def estado(cenario):
+    """Saldos, cotas, valor dos itens e gasto mensal, com nomes sem o sufixo do cenário."""
+    db.session.expire_all()
+    nomes_unidade = {unidade.id: nome for nome, unidade in cenario['unidades'].items()}
+    itens = {item.id: item for item in ItemAta.query.filter(ItemAta.id.in_(cenario['itens'].values()))}
+    return {
+        'saldo': {item.descricao_item: item.saldo_disponivel for item in itens.values()},
+        'cota': {(itens[cota.item_ata_id].descricao_item, nomes_unidade[cota.unidade_saude_id]): cota.quantidade_consumida
+                 for cota in CotaUnidadeItem.query.filter(CotaUnidadeItem.item_ata_id.in_(itens))},
+        'valor_total_itens': db.session.get(Contratinho, cenario['contratinho_id']).valor_total_itens,
+        'gasto': {(nomes_unidade[gasto.unidade_saude_id], gasto.ano, gasto.mes): gasto.valor_total
+                  for gasto in GastoUnidadeMensal.query.filter(GastoUnidadeMensal.unidade_saude_id.in_(nomes_unidade))
+                  if gasto.valor_total},
+    }
+
+
+def _sempre_estorna_e_consome(atualizar):
+    # Caminho antigo: finge que a ata mudou para forçar o estorno completo e o novo consumo.
+    def atualizar_completo(form_itens_data, objeto_pai, ModeloConsumoItem, ata_id_anterior,
+                           unidade_saude_id_anterior, data_emissao_anterior):
+        return atualizar(form_itens_data, objeto_pai, ModeloConsumoItem, None,
+                         unidade_saude_id_anterior, data_emissao_anterior)
+    return atualizar_completo
+
+
+@pytest.mark.parametrize('nome_cenario', sorted(CENARIOS))
+def test_edicao_pela_diferenca_equivale_ao_estorno_completo(cliente, nova_ata, nova_unidade, monkeypatch,
+                                                            nome_cenario):
+    alteracao = CENARIOS[nome_cenario]
+    pela_diferenca = montar(nova_ata, nova_unidade, cliente, 'dif')
+    completo = montar(nova_ata, nova_unidade, cliente, 'completo')
+
+    editar(cliente, pela_diferenca, alteracao)
+    with monkeypatch.context() as patch:
+        patch.setattr(modulo_app, '_atualizar_itens_consumidos',
+                      _sempre_estorna_e_consome(modulo_app._atualizar_itens_consumidos))
+        editar(cliente, completo, alteracao)
+
+    assert estado(pela_diferenca) == estado(completo)
+
+
+def test_edicao_preserva_linhas_e_valores_da_epoca(cliente, nova_ata, nova_unidade):
+    cenario = montar(nova_ata, nova_unidade, cliente, 'preco')
+    linhas_iniciais = {consumo.id: (consumo.quantidade_consumida, consumo.valor_total_consumido_item)
+                       for consumo in ConsumoItemContratinho.query.filter_by(contratinho_id=cenario['contratinho_id'])}
+    gaze = db.session.get(ItemAta, cenario['itens']['Gaze'])
+    gaze.valor_unitario_registrado = 4.0
+    db.session.commit()
+
+    # Aumento: as três linhas ficam como estão e o acréscimo entra pelo valor novo.
+    editar(cliente, cenario, {'linhas': [('Gaze', 15), ('Luva', 4), ('Gaze', 6)]})
+    consumos = ConsumoItemContratinho.query.filter_by(contratinho_id=cenario['contratinho_id'])\
+        .order_by(ConsumoItemContratinho.id).all()
+    assert {consumo.id: (consumo.quantidade_consumida, consumo.valor_total_consumido_item)
+            for consumo in consumos[:3]} == linhas_iniciais
+    assert (consumos[3].quantidade_consumida, consumos[3].valor_total_consumido_item) == (5, 20.0)
+    atual = estado(cenario)
+    assert atual['valor_total_itens'] == 16 * 2.0 + 4 * 3.0 + 5 * 4.0
+    assert atual['gasto'] == {('U1', HOJE.year, HOJE.month): atual['valor_total_itens']}
+
+    # Redução: sai da linha mais recente (a do acréscimo) e depois da anterior.
+    editar(cliente, cenario, {'linhas': [('Gaze', 10), ('Luva', 4), ('Gaze', 4)]})
+    consumos = ConsumoItemContratinho.query.filter_by(contratinho_id=cenario['contratinho_id'])\
+        .order_by(ConsumoItemContratinho.id).all()
+    assert [(consumo.item_ata_id, consumo.quantidade_consumida, consumo.valor_total_consumido_item)
+            for consumo in consumos] == [(gaze.id, 10, 20.0), (cenario['itens']['Luva'], 4, 12.0), (gaze.id, 4, 8.0)]
+    atual = estado(cenario)
+    assert atual['valor_total_itens'] == 40.0
+    assert atual['saldo']['Gaze'] == 86 and atual['cota'][('Gaze', 'U1')] == 14
+    assert atual['gasto'] == {('U1', HOJE.year, HOJE.month): 40.0}
+    assert UnidadeSaude.query.count() == 2
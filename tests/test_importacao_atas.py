@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+import importacao
+from models import db, ItemAta
+
+CABECALHO = "numero_ata,ano_ata,descricao_item,lote,quantidade_registrada,valor_unitario_registrado\n"
+COM_ITEM_REPETIDO = CABECALHO + "10,2025,Gaze,L1,5,1\n10,2025,Luva,L1,3,2\n10,2025,  gaze ,L1,7,1\n"
+
+
+def test_item_repetido_e_aviso_ao_acrescentar_e_erro_ao_atualizar(app):
+    acrescentar = importacao.validar_atas_csv(io.StringIO(COM_ITEM_REPETIDO), modo='atas')
+    assert acrescentar.valido
+    assert [(linha, coluna) for linha, coluna, _, _ in acrescentar.avisos] == [(4, 'descricao_item')]
+
+    atualizar = importacao.validar_atas_csv(io.StringIO(COM_ITEM_REPETIDO), modo='atas_atualizar')
+    assert not atualizar.valido and not atualizar.avisos
+    assert [(linha, coluna) for linha, coluna, _, _ in atualizar.erros] == [(4, 'descricao_item')]
+    assert 'linha 2' in atualizar.erros[0][3]
+
+    # O modo de acréscimo aceita o arquivo que a validação aprovou.
+    importacao.importar_atas_csv(io.StringIO(COM_ITEM_REPETIDO))
+    db.session.commit()
+    assert sorted(item.quantidade_registrada for item in ItemAta.query) == [3, 5, 7]
+
+
+def test_rota_valida_conforme_o_modo(cliente):
+    for modo, mensagem in (('atas', 'aviso(s)'), ('atas_atualizar', 'erro(s)')):
+        resposta = cliente.post('/importar/atas_csv', data={
+            'modo': modo, 'validar': 'Validar',
+            'csv_file': (io.BytesIO(COM_ITEM_REPETIDO.encode('utf-8')), 'atas.csv')})
+        assert resposta.status_code == 200
+        pagina = resposta.get_data(as_text=True)
+        assert 'item repetido' in pagina and mensagem in pagina
+    assert ItemAta.query.count() == 0
+
+
+@pytest.mark.parametrize('tamanho_lote', [10, 2])
+def test_atualizacao_recusa_chave_repetida(app, tamanho_lote):
+    importacao.importar_atas_csv(io.StringIO(CABECALHO + "10,2025,Gaze,L1,5,1\n"))
+    db.session.commit()
+
+    # Com lote 2, as linhas repetidas (2 e 4) caem em fatias diferentes.
+    with pytest.raises(ValueError, match=r'^Linha 4: item repetido: .* da linha 2\.$'):
+        importacao.importar_atas_csv(io.StringIO(COM_ITEM_REPETIDO), tamanho_lote=tamanho_lote,
+                                     atualizar_existentes=True)
+    db.session.rollback()
+    assert [(item.descricao_item, item.quantidade_registrada) for item in ItemAta.query] == [('Gaze', 5)]
@@ -0,0 +1,30 @@
+import io
+from datetime import date
+
+import importacao
+from models import db, CotaUnidadeItem
+
+
+def test_matriz_nao_reduz_cota_abaixo_do_consumido(cliente, nova_ata, nova_unidade):
+    unidade = nova_unidade()
+    ata, (gaze,) = nova_ata(itens=[('Gaze', 100, 1.0)], cotas={unidade: 40})
+    documentos = [{'numero_contratinho': 'CT-1', 'data_emissao': date.today().isoformat(), 'ata_id': ata.id,
+                   'unidade_saude_id': unidade.id, 'itens': [{'item_ata_id': gaze.id, 'quantidade_consumida': 15}]}]
+    assert cliente.post('/contratinho/lote', json={'documentos': documentos}).get_json()['criados'] == 1
+
+    resultado = importacao.importar_matriz_cotas(
+        io.StringIO(f"item_ata_id,descricao_item,UBS Centro\n{gaze.id},Gaze,10\n"), ata.id)
+    assert resultado.erros == ["Linha 2, unidade 'UBS Centro': a cota (10) não pode ser menor que a quantidade "
+                               "já consumida (15)."]
+    db.session.rollback()
+    cota = CotaUnidadeItem.query.one()
+    assert (cota.quantidade_prevista, cota.quantidade_consumida) == (40, 15)
+
+    # Reduzir até o consumido é permitido.
+    resultado = importacao.importar_matriz_cotas(
+        io.StringIO(f"item_ata_id,descricao_item,UBS Centro\n{gaze.id},Gaze,15\n"), ata.id)
+    assert resultado.erros == [] and resultado.cotas_atualizadas == 1
+    db.session.commit()
+    db.session.expire_all()
+    cota = CotaUnidadeItem.query.one()
+    assert (cota.quantidade_prevista, cota.quantidade_consumida, cota.razao_saldo) == (15, 15, 0)
@@ -0,0 +1,42 @@
+import os
+
+import app as modulo_app
+from models import db, ImportacaoJob, User
+
+
+class ResultadoFalso:
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def resumo(self):
+        return f"{self.linhas} linha(s)"
+
+
+def test_progresso_e_visivel_fora_do_processo_da_importacao(app, cliente, monkeypatch, tmp_path):
+    caminho = tmp_path / 'atas.csv'
+    caminho.write_text('numero_ata\n')
+    job = ImportacaoJob(tipo='atas', nome_arquivo='atas.csv', caminho_arquivo=str(caminho),
+                        usuario_id=User.query.one().id)
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    os.makedirs(app.config['IMPORTACAO_DIRETORIO'], exist_ok=True)
+
+    vistos = []
+
+    def importar(arquivo, tamanho_lote, usuario_id, ao_processar_lote):
+        # Cada consulta ao endpoint vê só o que foi gravado fora da memória do processo.
+        for lote in range(1, 2 * modulo_app.PROGRESSO_A_CADA_LOTES + 1):
+            ao_processar_lote(ResultadoFalso(lote * 100))
+            vistos.append(cliente.get(f'/importacoes/{job_id}/progresso').get_json()['linhas_processadas'])
+        return ResultadoFalso(1234)
+
+    monkeypatch.setitem(modulo_app.IMPORTADORES, 'atas', importar)
+    modulo_app.processar_importacao(job_id)
+
+    a_cada = modulo_app.PROGRESSO_A_CADA_LOTES
+    assert vistos == [0] * (a_cada - 1) + [a_cada * 100] * a_cada + [2 * a_cada * 100]
+    db.session.expire_all()
+    final = cliente.get(f'/importacoes/{job_id}/progresso').get_json()
+    assert (final['status'], final['linhas_processadas']) == ('CONCLUIDO', 1234)
+    assert not os.path.exists(modulo_app._caminho_progresso(job_id)) and not caminho.exists()
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from flask import url_for
+from sqlalchemy import event
+
+from models import (db, Processo, Contrato, ItemContrato, Contratinho, Empenho, ConsumoItemContratinho,
+                    ConsumoItemEmpenho, Comentario, User)
+
+# Comandos SQL por listagem, qualquer que seja o número de linhas: a própria
+# listagem, já com contagens e relações, e uma consulta auxiliar (os
+# comentários da página nas listagens de documentos, o usuário logado nas
+# demais). O número não pode crescer com a quantidade de registros.
+CONSULTAS_POR_LISTAGEM = {
+    'index': 2,
+    'listar_contratos': 2,
+    'listar_contratinhos': 2,
+    'listar_empenhos': 2,
+    'listar_processos': 2,
+}
+
+
+@contextmanager
+def contar_consultas():
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        yield comandos
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+
+def popular(indices, nova_ata, unidade):
+    autor = User.query.first()
+    for indice in indices:
+        processo = Processo(numero_processo=f'P-{indice}', ano=2025)
+        db.session.add(processo)
+        db.session.flush()
+        ata, itens = nova_ata(numero=f'A-{indice}', itens=[('Gaze', 100, 1.0), ('Luva', 100, 2.0)])
+        ata.processo_id = processo.id
+        contrato = Contrato(numero_contrato=f'C-{indice}', objeto='Objeto', processo_id=processo.id)
+        contratinho = Contratinho(numero_contratinho=f'CT-{indice}', data_emissao=datetime(2025, 1, 1),
+                                  ata_id=ata.id, unidade_saude_id=unidade.id, processo_id=processo.id)
+        empenho = Empenho(numero_empenho=f'E-{indice}', data_emissao=datetime(2025, 1, 1),
+                          ata_id=ata.id, unidade_saude_id=unidade.id)
+        db.session.add_all([contrato, contratinho, empenho])
+        db.session.flush()
+        db.session.add(ItemContrato(contrato_id=contrato.id, descricao='Serviço', quantidade=1, valor_unitario=1))
+        for item in itens:
+            db.session.add(ConsumoItemContratinho(contratinho_id=contratinho.id, item_ata_id=item.id,
+                                                  quantidade_consumida=1))
+            db.session.add(ConsumoItemEmpenho(empenho_id=empenho.id, item_ata_id=item.id, quantidade_consumida=1))
+        for documento in (contrato, contratinho, empenho):
+            db.session.add(Comentario(content='Ok', user_id=autor.id, commentable_type=type(documento).__name__,
+                                      commentable_id=documento.id))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('rota', sorted(CONSULTAS_POR_LISTAGEM))
+def test_listagem_faz_numero_fixo_de_consultas(app, cliente, nova_ata, nova_unidade, rota):
+    unidade = nova_unidade()
+    with app.test_request_context():
+        url = url_for(rota, filtro='todos')
+
+    totais = []
+    for indices in (range(0, 3), range(3, 30)):
+        popular(indices, nova_ata, unidade)
+        with contar_consultas() as comandos:
+            resposta = cliente.get(url)
+        assert resposta.status_code == 200
+        totais.append(len(comandos))
+
+    assert totais == [CONSULTAS_POR_LISTAGEM[rota]] * 2, comandos
+
+
+def test_contagens_da_listagem_sao_por_registro(cliente, nova_ata, nova_unidade):
+    popular(range(2), nova_ata, nova_unidade())
+    db.session.add(ItemContrato(contrato_id=Contrato.query.filter_by(numero_contrato='C-1').one().id,
+                                descricao='Extra', quantidade=1, valor_unitario=1))
+    db.session.commit()
+
+    from app import _contagem_por_pai
+    linhas = dict(db.session.query(Contrato.numero_contrato, _contagem_por_pai(ItemContrato.contrato_id, Contrato.id)))
+    assert linhas == {'C-0': 1, 'C-1': 2}
+    total_docs = sum(_contagem_por_pai(coluna, Processo.id) for coluna in
+                     (Contrato.processo_id, Contratinho.processo_id, Empenho.processo_id))
+    assert dict(db.session.query(Processo.numero_processo, total_docs)) == {'P-0': 2, 'P-1': 2}
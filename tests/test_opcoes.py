@@ -0,0 +1,51 @@
+from datetime import date
+
+import opcoes
+from models import db, VersaoTabela, ItemAta, Contratinho, ajustar_saldo_item
+
+
+def versao(tabela):
+    db.session.expire_all()
+    return db.session.get(VersaoTabela, tabela).versao
+
+
+def test_consumo_e_estorno_nao_alteram_versao_dos_itens(cliente, nova_ata, nova_unidade):
+    unidade = nova_unidade()
+    ata, (item,) = nova_ata(itens=[('Gaze', 100, 1.0)], cotas={unidade: 100})
+    inicial = versao('item_ata')
+
+    documentos = [{'numero_contratinho': f'CT-{indice}', 'data_emissao': date.today().isoformat(),
+                   'ata_id': ata.id, 'unidade_saude_id': unidade.id,
+                   'itens': [{'item_ata_id': item.id, 'quantidade_consumida': 2}]} for indice in range(3)]
+    assert cliente.post('/contratinho/lote', json={'documentos': documentos}).get_json()['criados'] == 3
+    ids = [contratinho.id for contratinho in Contratinho.query]
+    assert cliente.post('/contratinho/excluir_lote', data={'documento_ids': ids}).status_code == 302
+    assert ajustar_saldo_item(item.id, -1)
+    db.session.commit()
+    # Alteração só de saldo pelo ORM
+    item = db.session.get(ItemAta, item.id)
+    item.saldo_disponivel = 50
+    db.session.commit()
+    assert versao('item_ata') == inicial
+
+    item.descricao_item = 'Gaze estéril'
+    db.session.commit()
+    assert versao('item_ata') == inicial + 1
+
+
+def test_listas_com_saldo_refletem_o_consumo(app, nova_ata):
+    ata, (item,) = nova_ata(itens=[('Gaze', 10, 1.0)])
+    assert opcoes.opcoes_itens_com_saldo(ata.id) == ([(item.id, 'Gaze (Saldo: 10.00 , VU: R$1.00)')], True)
+    assert ajustar_saldo_item(item.id, -10)
+    db.session.commit()
+    assert opcoes.opcoes_itens_com_saldo(ata.id) == ([], True)
+    assert opcoes.opcoes_itens_ata() == [(item.id, 'Gaze (Ata: 1/2025, Saldo: 0)')]
+
+
+def test_cache_de_opcoes_e_limitado(app, monkeypatch):
+    monkeypatch.setattr(opcoes, 'TAMANHO_MAXIMO_CACHE', 3)
+    for indice in range(5):
+        opcoes._obter(f'lista:{indice}', ('ata',), lambda: [indice])
+    opcoes._obter('lista:2', ('ata',), lambda: [])  # acesso recente
+    opcoes._obter('lista:5', ('ata',), lambda: [5])
+    assert list(opcoes._cache) == ['lista:4', 'lista:2', 'lista:5']
@@ -0,0 +1,52 @@
+from datetime import date
+
+from sqlalchemy import event, update
+
+from models import db, ItemAta, CotaUnidadeItem, MovimentoSaldo, reconciliar_saldos
+
+
+def test_reconciliacao_corrige_em_lote_e_lanca_ajustes(cliente, nova_ata, nova_unidade):
+    unidade = nova_unidade()
+    ata, itens = nova_ata(itens=[('Gaze', 100, 1.0), ('Luva', 50, 2.0), ('Atadura', 30, 1.0)], cotas={unidade: 40})
+    gaze, luva, atadura = itens
+    documentos = [{'numero_contratinho': f'CT-{indice}', 'data_emissao': date.today().isoformat(),
+                   'ata_id': ata.id, 'unidade_saude_id': unidade.id,
+                   'itens': [{'item_ata_id': gaze.id, 'quantidade_consumida': 3},
+                             {'item_ata_id': luva.id, 'quantidade_consumida': 2}]} for indice in range(4)]
+    assert cliente.post('/contratinho/lote', json={'documentos': documentos}).get_json()['criados'] == 4
+    assert reconciliar_saldos() == ([], [])
+
+    # Divergências gravadas por fora: saldo de dois itens e consumo de uma cota.
+    db.session.execute(update(ItemAta).where(ItemAta.id == gaze.id).values(saldo_disponivel=70))
+    db.session.execute(update(ItemAta).where(ItemAta.id == atadura.id).values(saldo_disponivel=31))
+    db.session.execute(update(CotaUnidadeItem).where(CotaUnidadeItem.item_ata_id == luva.id)
+                       .values(quantidade_consumida=1))
+    db.session.commit()
+    ajustes_antes = MovimentoSaldo.query.filter_by(tipo='AJUSTE').count()
+
+    comandos = []
+    registrar = lambda conn, cursor, statement, *args: comandos.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        itens_divergentes, cotas_divergentes = reconciliar_saldos(corrigir=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+    assert [(item_id, atual, correto) for item_id, _, _, atual, correto in itens_divergentes] == \
+        [(gaze.id, 70, 88), (atadura.id, 31, 30)]
+    assert [(item_id, atual, correto) for _, item_id, _, atual, correto in cotas_divergentes] == [(luva.id, 1, 8)]
+    # Uma leitura, um INSERT ... SELECT e um UPDATE por tabela, qualquer que seja o número de divergências.
+    assert sum(comando.lstrip().upper().startswith('UPDATE') for comando in comandos) == 2
+    assert sum(comando.lstrip().upper().startswith('INSERT') for comando in comandos) == 2
+
+    db.session.expire_all()
+    assert {item.id: item.saldo_disponivel for item in ItemAta.query} == {gaze.id: 88, luva.id: 42, atadura.id: 30}
+    assert db.session.get(ItemAta, gaze.id).razao_saldo == 0.88
+    cota_luva = CotaUnidadeItem.query.filter_by(item_ata_id=luva.id).one()
+    assert cota_luva.quantidade_consumida == 8 and cota_luva.razao_saldo == 0.8
+
+    ajustes = MovimentoSaldo.query.filter_by(tipo='AJUSTE').order_by(MovimentoSaldo.id).all()[ajustes_antes:]
+    assert sorted((ajuste.item_ata_id, ajuste.unidade_saude_id, ajuste.delta_saldo_item, ajuste.delta_consumo_cota)
+                  for ajuste in ajustes) == [(gaze.id, None, 18, 0), (luva.id, unidade.id, 0, 7),
+                                             (atadura.id, None, -1, 0)]
+    assert reconciliar_saldos() == ([], [])
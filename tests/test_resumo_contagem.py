@@ -0,0 +1,95 @@
+import io
+from datetime import date
+
+from sqlalchemy import func
+
+import importacao
+from models import (db, MODELOS_CONTADOS, obter_totais_dashboard, Ata, ItemAta, Contrato, Contratinho, Empenho,
+                    UnidadeSaude)
+
+
+def contagens_reais():
+    return {entidade: db.session.query(func.count(modelo.id)).scalar() for entidade, modelo in MODELOS_CONTADOS.items()}
+
+
+def conferir_totais():
+    db.session.expire_all()
+    assert obter_totais_dashboard() == contagens_reais()
+
+
+def test_totais_acompanham_rotas_do_orm(cliente):
+    conferir_totais()  # materializa o resumo com o banco vazio
+
+    resposta = cliente.post('/unidade/nova', data={'nome_unidade': 'UBS Norte', 'tipo_unidade': 'UBS'})
+    assert resposta.status_code == 302
+    conferir_totais()
+
+    resposta = cliente.post('/ata/nova', data={'numero_ata': '10', 'ano': '2025', 'descricao': 'Ata de teste'})
+    assert resposta.status_code == 302
+    ata = Ata.query.filter_by(numero_ata='10').one()
+    conferir_totais()
+
+    for descricao in ('Gaze', 'Luva'):
+        resposta = cliente.post(f'/ata/{ata.id}/item/novo', data={
+            'descricao_item': descricao, 'tipo_item': 'MATERIAL_CONSUMO', 'quantidade_registrada': '100',
+            'valor_unitario_registrado': '2,50'})
+        assert resposta.status_code == 302
+    assert ItemAta.query.count() == 2
+    conferir_totais()
+
+    resposta = cliente.post('/contrato/novo', data={
+        'numero_contrato': 'CT-1', 'objeto': 'Limpeza', 'itens_contratados-0-descricao': 'Serviço',
+        'itens_contratados-0-quantidade': '2', 'itens_contratados-0-valor_unitario': '10'})
+    assert resposta.status_code == 302
+    conferir_totais()
+
+    item = ItemAta.query.filter_by(descricao_item='Luva').one()
+    assert cliente.get(f'/ata/{ata.id}/item/{item.id}/excluir').status_code == 302
+    conferir_totais()
+
+    contrato = Contrato.query.one()
+    assert cliente.get(f'/contrato/excluir/{contrato.id}').status_code == 302
+    assert cliente.get(f'/ata/excluir/{ata.id}').status_code == 302
+    assert Ata.query.count() == 0 and ItemAta.query.count() == 0
+    conferir_totais()
+
+
+def test_totais_acompanham_lotes_e_importacoes(cliente, nova_ata, nova_unidade):
+    unidade = nova_unidade()
+    ata, (item,) = nova_ata(itens=[('Gaze', 1000, 1.5)], cotas={unidade: 1000})
+    conferir_totais()
+
+    for tipo, campo_numero in (('contratinho', 'numero_contratinho'), ('empenho', 'numero_empenho')):
+        documentos = [{campo_numero: f'{tipo}-{indice}', 'data_emissao': date.today().isoformat(),
+                       'ata_id': ata.id, 'unidade_saude_id': unidade.id,
+                       'itens': [{'item_ata_id': item.id, 'quantidade_consumida': 1}]} for indice in range(5)]
+        documentos.append({campo_numero: 'rejeitado', 'data_emissao': date.today().isoformat(), 'ata_id': ata.id})
+        resposta = cliente.post(f'/{tipo}/lote', json={'documentos': documentos})
+        assert resposta.get_json()['criados'] == 5
+        conferir_totais()
+
+    contratinho_ids = [contratinho.id for contratinho in Contratinho.query.limit(3)]
+    resposta = cliente.post('/contratinho/excluir_lote', data={'documento_ids': contratinho_ids})
+    assert resposta.status_code == 302
+    empenho_ids = [empenho.id for empenho in Empenho.query]
+    resposta = cliente.post('/empenho/excluir_lote', data={'documento_ids': empenho_ids})
+    assert resposta.status_code == 302
+    assert Contratinho.query.count() == 2 and Empenho.query.count() == 0
+    conferir_totais()
+
+    csv_atas = ("numero_ata,ano_ata,descricao_item,quantidade_registrada,valor_unitario_registrado\n"
+                + "".join(f"IMP-{indice % 3},2025,Item {indice},10,1\n" for indice in range(25)))
+    importacao.importar_atas_csv(io.StringIO(csv_atas), tamanho_lote=10)
+    db.session.commit()
+    assert Ata.query.count() == 4 and ItemAta.query.count() == 26
+    conferir_totais()
+
+    csv_contratos = ("registro,numero_contrato,objeto,descricao,quantidade,valor_unitario\n"
+                     + "".join(f"CONTRATO,C-{indice},Objeto {indice},,,\nITEM,C-{indice},,Serviço,1,10\n"
+                               for indice in range(7)))
+    importacao.importar_contratos_csv(io.StringIO(csv_contratos), tamanho_lote=4)
+    db.session.commit()
+    assert Contrato.query.count() == 7
+    conferir_totais()
+
+    assert UnidadeSaude.query.count() == 1